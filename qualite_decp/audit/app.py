@@ -1,37 +1,43 @@
 """ Ce module contient les fonctions nécessaires à l'audit de qualité des données consolidées.
 """
 
+import collections
+import concurrent.futures
+import cProfile
+import itertools
 import logging
-from datetime import datetime
+import multiprocessing
+import os
 
 import jsonschema
-import pandas
 
 from qualite_decp import download
 from qualite_decp import conf
+from qualite_decp import profiling
 from qualite_decp.audit import audit_results
 from qualite_decp.audit import audit_results_one_source
+from qualite_decp.audit import fingerprints
+from qualite_decp.audit import incremental_audit
 from qualite_decp.audit import measures
+from qualite_decp.audit import rules
+from qualite_decp.audit import schema_checker
+from qualite_decp.audit import statistics
+from qualite_decp.audit import typed_columns
+from qualite_decp.audit import validation_cache
 
 
-def audit_against_schema(data: dict, schema: dict):
-    """Audit la conformité de donnée par rapport à un schéma de définition.
+def find_marche_schema_index(schema: dict):
+    """Trouve la position de la définition d'un marché parmi les types d'entrées acceptés par le schéma.
 
     Args:
-        data (dict): Donnée à auditer. Doit contenir un champ "marches"
         schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
 
     Raises:
-        Exception: [description]
+        Exception: Si la définition #/definitions/marche n'est pas référencée
 
     Returns:
-        dict: Dictionnaire {uid: {errors: ..., failed_validators: ...}}
+        int: Position dans properties.marches.items.anyOf
     """
-    if len(data["marches"]) == 0:
-        return {}
-    # Choix de Draft4Validator car "$schema": "http://json-schema.org/draft-04/schema#"
-    validator = jsonschema.Draft4Validator(schema)
-    errors = dict()
     keep_index_any_of = None
     for index, any_of in enumerate(schema["properties"]["marches"]["items"]["anyOf"]):
         if any_of["$ref"] == "#/definitions/marche":
@@ -40,6 +46,438 @@ def audit_against_schema(data: dict, schema: dict):
         raise Exception(
             "Impossible de trouver la valeur #/definitions/marche dans properties.marches.items.anyOf"
         )
+    return keep_index_any_of
+
+
+def audit_against_schema(data: dict, schema: dict):
+    """Audit la conformité de donnée par rapport à un schéma de définition.
+
+    Selon conf.audit.validation_schema.mode, chaque marché est validé directement contre
+    #/definitions/marche ("marche") ou le document entier est validé ("document").
+    Les deux modes produisent les mêmes résultats.
+
+    Args:
+        data (dict): Donnée à auditer. Doit contenir un champ "marches"
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+
+    Returns:
+        dict: Dictionnaire {uid: {errors: ..., failed_validators: ...}}
+    """
+    if conf.audit.validation_schema.mode == "document":
+        return audit_document_against_schema(data, schema)
+    return audit_marches_against_schema(data["marches"], schema)
+
+
+def build_marche_validators(schema: dict):
+    """Construit les fonctions de validation d'un marché à partir du schéma.
+
+    Args:
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+
+    Returns:
+        callable, list, jsonschema.Draft4Validator: Vérificateur compilé de #/definitions/marche,
+            vérificateurs compilés des autres types d'entrées acceptés, et validateur détaillant les erreurs
+    """
+    keep_index_any_of = find_marche_schema_index(schema)
+    any_of = schema["properties"]["marches"]["items"]["anyOf"]
+    checker = schema_checker.SchemaChecker(schema)
+    is_valid_marche = checker.compile(any_of[keep_index_any_of])
+    is_valid_other = [
+        checker.compile(sub)
+        for index, sub in enumerate(any_of)
+        if index != keep_index_any_of
+    ]
+    validator = checker.validator(checker.resolve("#/definitions/marche"))
+    return is_valid_marche, is_valid_other, validator
+
+
+def audit_marches_against_schema(marches: list, schema: dict):
+    """Audit la conformité de chaque marché par rapport à la définition #/definitions/marche du schéma.
+
+    Si conf.audit.cache_validation.chemin est renseigné, les résultats sont conservés
+    d'une exécution à l'autre et seuls les marchés nouveaux ou modifiés sont validés.
+
+    Args:
+        marches (list): Marchés à auditer
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+
+    Returns:
+        dict: Dictionnaire {uid: {errors: ..., failed_validators: ...}}
+    """
+    if len(marches) == 0:
+        return {}
+    results = [None] * len(marches)
+    pending = list(range(len(marches)))
+    cache = open_validation_cache(schema)
+    if cache is not None:
+        digests = [validation_cache.record_digest(marche) for marche in marches]
+        cached_results = cache.get_many(digests)
+        pending = list()
+        for index, digest in enumerate(digests):
+            if digest in cached_results:
+                results[index] = cached_results[digest]
+            else:
+                pending.append(index)
+    logging.debug("%d marchés à valider", len(pending))
+    pending_results = validate_marches([marches[index] for index in pending], schema)
+    for index, result in zip(pending, pending_results):
+        results[index] = result
+    if cache is not None:
+        cache.put_many({digests[index]: results[index] for index in pending})
+        cache.close()
+    return schema_errors_by_uid(marches, results)
+
+
+def schema_errors_by_uid(marches: list, results: list):
+    """Indexe par UID les résultats de validation des marchés non valides.
+
+    Args:
+        marches (list): Marchés validés
+        results (list): Résultat pour chaque marché ({errors: ..., failed_validators: ...}, ou None si valide)
+
+    Returns:
+        dict: Dictionnaire {uid: {errors: ..., failed_validators: ...}}
+    """
+    errors = dict()
+    for marche, result in zip(marches, results):
+        if result is not None:
+            errors[marche.get("uid")] = result
+    return errors
+
+
+def open_validation_cache(schema: dict):
+    """Ouvre le cache des résultats de validation, s'il est configuré (conf.audit.cache_validation.chemin).
+
+    Args:
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+
+    Returns:
+        validation_cache.ValidationCache: Cache, None s'il n'est pas configuré
+    """
+    if not conf.audit.cache_validation.chemin:
+        return None
+    return validation_cache.ValidationCache(
+        conf.audit.cache_validation.chemin,
+        schema,
+        max_entries=conf.audit.cache_validation.nombre_max_entrees,
+    )
+
+
+def validate_marches(marches: list, schema: dict):
+    """Valide des marchés par rapport à la définition #/definitions/marche du schéma.
+
+    Si conf.audit.validation_schema.processus est supérieur à 1, les marchés sont découpés
+    en lots de conf.audit.validation_schema.taille_lot validés dans un pool de processus.
+
+    Args:
+        marches (list): Marchés à valider
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+
+    Returns:
+        list: Résultat pour chaque marché ({errors: ..., failed_validators: ...}, ou None si valide)
+    """
+    if len(marches) == 0:
+        return []
+    processes = conf.audit.validation_schema.processus or 1
+    chunk_size = conf.audit.validation_schema.taille_lot or len(marches)
+    # Pas de pool imbriqué lorsque l'audit est déjà exécuté dans un processus secondaire
+    if (
+        processes <= 1
+        or len(marches) <= chunk_size
+        or multiprocessing.parent_process() is not None
+    ):
+        return audit_marches_chunk_against_schema(
+            marches, build_marche_validators(schema)
+        )
+    chunks = [
+        marches[start : start + chunk_size]
+        for start in range(0, len(marches), chunk_size)
+    ]
+    logging.debug(
+        "Validation de %d lots de marchés sur %d processus", len(chunks), processes
+    )
+    results = list()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=init_schema_validation_worker,
+        initargs=(schema,),
+    ) as executor:
+        for chunk_results in executor.map(audit_marches_chunk_in_worker, chunks):
+            results += chunk_results
+    return results
+
+
+# Fonctions de validation construites une fois par processus du pool de validation
+worker_marche_validators = None
+
+
+def init_schema_validation_worker(schema: dict):
+    """Initialise un processus du pool de validation.
+
+    Args:
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+    """
+    global worker_marche_validators
+    worker_marche_validators = build_marche_validators(schema)
+
+
+def audit_marches_chunk_in_worker(marches: list):
+    """Audit un lot de marchés dans un processus du pool de validation.
+
+    Args:
+        marches (list): Lot de marchés à auditer
+
+    Returns:
+        list: Résultat pour chaque marché ({errors: ..., failed_validators: ...}, ou None si valide)
+    """
+    return audit_marches_chunk_against_schema(marches, worker_marche_validators)
+
+
+def audit_marches_chunk_against_schema(marches: list, marche_validators: tuple):
+    """Audit la conformité d'un lot de marchés par rapport à la définition #/definitions/marche du schéma.
+
+    Un vérificateur compilé écarte d'abord les marchés valides. Seuls les autres sont
+    confrontés à jsonschema pour obtenir le détail des erreurs, s'ils ne sont pas
+    acceptés par un autre type d'entrée du schéma (properties.marches.items.anyOf).
+
+    Args:
+        marches (list): Marchés à auditer
+        marche_validators (tuple): Fonctions de validation issues de build_marche_validators
+
+    Returns:
+        list: Résultat pour chaque marché ({errors: ..., failed_validators: ...}, ou None si valide)
+    """
+    is_valid_marche, is_valid_other, validator = marche_validators
+    results = list()
+    for marche in marches:
+        if is_valid_marche(marche) or any(
+            is_valid(marche) for is_valid in is_valid_other
+        ):
+            results.append(None)
+            continue
+        instance_suberrors = []
+        for error in validator.iter_errors(marche):
+            if len(error.context) > 0:
+                logging.warning("Des défauts de qualité inattendus ont pu être omis")
+            error_details = {
+                "message": error.message,
+                "validator": error.validator,
+            }
+            instance_suberrors.append(error_details)
+        failed_validators = list(
+            set([suberror["validator"] for suberror in instance_suberrors])
+        )
+        instance_errors = {
+            "errors": instance_suberrors,
+            "failed_validators": failed_validators,
+        }
+        results.append(instance_errors)
+    return results
+
+
+def audit_records_chunk(
+    marches: list,
+    validated_indices: list,
+    ignored_fields: list,
+    marche_validators: tuple = None,
+):
+    """Audite un lot de marchés marché par marché : validation par rapport au schéma et empreintes.
+
+    Args:
+        marches (list): Lot de marchés
+        validated_indices (list): Positions des marchés à valider (les autres résultats sont en cache)
+        ignored_fields (list): Champs ignorés pour la recherche de lignes quasi-dupliquées
+        marche_validators (tuple, optional): Fonctions de validation issues de build_marche_validators.
+            Defaults to None (pas de validation).
+
+    Returns:
+        list, list: Résultat de validation des marchés à valider (vide sans fonctions de validation),
+            et empreintes (exacte, hors champs ignorés) de chaque marché
+    """
+    schema_results = list()
+    if marche_validators is not None:
+        schema_results = audit_marches_chunk_against_schema(
+            [marches[index] for index in validated_indices], marche_validators
+        )
+    ignored_fields = set(ignored_fields)
+    record_fingerprints = [
+        fingerprints.record_fingerprints(marche, ignored_fields) for marche in marches
+    ]
+    return schema_results, record_fingerprints
+
+
+def audit_records_chunk_in_worker(
+    marches: list, validated_indices: list, ignored_fields: list
+):
+    """Audite un lot de marchés marché par marché dans un processus du pool de validation (voir audit_records_chunk)."""
+    return audit_records_chunk(
+        marches, validated_indices, ignored_fields, worker_marche_validators
+    )
+
+
+class RecordAudits:
+    def __init__(self, schema_results: list = None, record_fingerprints: list = None):
+        """Résultats d'audit des marchés d'une source calculés marché par marché, au fil de leur lecture.
+
+        Args:
+            schema_results (list, optional): Résultat de validation de chaque marché ({errors: ..., failed_validators: ...},
+                ou None si valide). Defaults to None (validation non effectuée, mode "document").
+            record_fingerprints (list, optional): Empreintes (exacte, hors champs ignorés) de chaque marché. Defaults to None.
+        """
+        self.schema_results = schema_results
+        self.record_fingerprints = (
+            list() if record_fingerprints is None else record_fingerprints
+        )
+
+
+class RecordAuditor:
+    def __init__(self, schema: dict):
+        """Audite les marchés un par un au fil de leur lecture, par lots traités en arrière-plan.
+
+        Les étapes ne dépendant que du marché (validation par rapport au schéma en mode "marche",
+        empreintes de recherche des doublons) sont exécutées par lots de
+        conf.audit.validation_schema.taille_lot marchés, dans un pool de
+        conf.audit.validation_schema.processus processus, pendant que la lecture se poursuit.
+        Les agrégats par source sont calculés ensuite (voir count_source_defects).
+
+        Args:
+            schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+        """
+        self.schema = schema
+        self.validate = conf.audit.validation_schema.mode != "document"
+        self.ignored_fields = list(conf.audit.lignes_dupliquees.colonnes_excluses)
+        self.chunk_size = conf.audit.validation_schema.taille_lot or 20000
+        self.cache = open_validation_cache(schema) if self.validate else None
+        processes = conf.audit.validation_schema.processus or 1
+        if processes > 1:
+            self.marche_validators = None
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=processes,
+                initializer=init_schema_validation_worker,
+                initargs=(schema,),
+            )
+        else:
+            # Un seul fil d'exécution : le lot est audité pendant la réception des données
+            self.marche_validators = (
+                build_marche_validators(schema) if self.validate else None
+            )
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.marches = list()
+        self.sources = list()
+        self.chunks = list()
+
+    def add(self, source: str, marche: dict):
+        """Ajoute un marché, audité avec le lot en cours une fois celui-ci complet.
+
+        Args:
+            source (str): Source du marché
+            marche (dict): Marché
+        """
+        self.marches.append(marche)
+        self.sources.append(source)
+        if len(self.marches) >= self.chunk_size:
+            self.submit_chunk()
+
+    def submit_chunk(self):
+        """Soumet le lot en cours au pool."""
+        if len(self.marches) == 0:
+            return
+        marches, sources = self.marches, self.sources
+        self.marches, self.sources = list(), list()
+        digests, cached_results = None, dict()
+        validated_indices = list(range(len(marches))) if self.validate else list()
+        if self.cache is not None:
+            digests = [validation_cache.record_digest(marche) for marche in marches]
+            cached_results = self.cache.get_many(digests)
+            validated_indices = [
+                index
+                for index, digest in enumerate(digests)
+                if digest not in cached_results
+            ]
+        if self.marche_validators is None and self.validate:
+            future = self.executor.submit(
+                audit_records_chunk_in_worker,
+                marches,
+                validated_indices,
+                self.ignored_fields,
+            )
+        else:
+            future = self.executor.submit(
+                audit_records_chunk,
+                marches,
+                validated_indices,
+                self.ignored_fields,
+                self.marche_validators,
+            )
+        self.chunks.append(
+            (sources, digests, cached_results, validated_indices, future)
+        )
+
+    def finish(self):
+        """Attend la fin de l'audit des lots et regroupe les résultats par source.
+
+        Returns:
+            dict: Résultats par source ({source: RecordAudits}), dans l'ordre de lecture des marchés
+        """
+        self.submit_chunk()
+        record_audits = collections.defaultdict(
+            lambda: RecordAudits(list() if self.validate else None)
+        )
+        new_results = dict()
+        try:
+            for (
+                sources,
+                digests,
+                cached_results,
+                validated_indices,
+                future,
+            ) in self.chunks:
+                chunk_schema_results, chunk_fingerprints = future.result()
+                validated_results = dict(zip(validated_indices, chunk_schema_results))
+                for index, source in enumerate(sources):
+                    source_audits = record_audits[source]
+                    source_audits.record_fingerprints.append(chunk_fingerprints[index])
+                    if not self.validate:
+                        continue
+                    if index in validated_results:
+                        result = validated_results[index]
+                        if digests is not None:
+                            new_results[digests[index]] = result
+                    else:
+                        result = cached_results[digests[index]]
+                    source_audits.schema_results.append(result)
+            if self.cache is not None:
+                self.cache.put_many(new_results)
+        finally:
+            self.close()
+        return dict(record_audits)
+
+    def close(self):
+        """Arrête le pool (les lots non commencés sont abandonnés) et ferme le cache."""
+        for chunk in self.chunks:
+            chunk[-1].cancel()
+        self.executor.shutdown()
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
+
+
+def audit_document_against_schema(data: dict, schema: dict):
+    """Audit la conformité d'un document entier par rapport à un schéma de définition.
+
+    Args:
+        data (dict): Donnée à auditer. Doit contenir un champ "marches"
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+
+    Returns:
+        dict: Dictionnaire {uid: {errors: ..., failed_validators: ...}}
+    """
+    if len(data["marches"]) == 0:
+        return {}
+    # Choix de Draft4Validator car "$schema": "http://json-schema.org/draft-04/schema#"
+    validator = jsonschema.Draft4Validator(schema)
+    errors = dict()
+    keep_index_any_of = find_marche_schema_index(schema)
     for root_error in validator.iter_errors(data):
         instance_uid = root_error.instance.get("uid")
         instance_suberrors = []
@@ -83,380 +521,720 @@ def divide_and_round(dividend, divisor):
     return rounded_quotient
 
 
-def is_after(date_1: str, date_2: str):
-    """Vérifie si une date_1 est strictement ultérieure à date_2.
+def count_schema_failed_validators(uids: list, schema_audit_results: dict):
+    """Compte les marchés en échec pour chaque type de validateur du schéma.
 
     Args:
-        date_1 (str): Première date (YYYY-MM-DD)
-        date_2 (str): Seconde date (YYYY-MM-DD)
+        uids (list): UIDs des marchés audités (un par marché, éventuellement répétés)
+        schema_audit_results (dict): Résultats de la confrontation au schéma ({uid: {failed_validators: ...}})
 
     Returns:
-        bool: True si date_1 est ultérieure à date_2, False sinon.
+        collections.Counter: Nombre de marchés en échec par validateur
     """
-    date_1 = str_to_datetime_date(date_1)
-    date_2 = str_to_datetime_date(date_2)
-    return date_1 > date_2
+    uid_counts = collections.Counter(uids)
+    failed_validators_counts = collections.Counter()
+    for uid, marche_schema_audit_results in schema_audit_results.items():
+        for validator in marche_schema_audit_results["failed_validators"]:
+            failed_validators_counts[validator] += uid_counts[uid]
+    return failed_validators_counts
 
 
-def str_to_datetime_date(date_str: str):
-    """Convertit une date sous forme de chaîne en objet datetime.
+def classify_failed_validators(failed_validators_counts: dict):
+    """Répartit les échecs de validation du schéma entre les indicateurs de qualité.
 
     Args:
-        date_str (str): Date à convertir (YYYY-MM-DD)
+        failed_validators_counts (dict): Nombre de marchés en échec par validateur
 
     Returns:
-        datetime.datetime: Date convertie
+        dict: Nombre de défauts par indicateur (formats_non_valides, valeurs_non_valides,
+            donnees_manquantes, valeurs_non_renseignees)
     """
-    date = str(date_str)[:10]
-    return datetime.strptime(date, "%Y-%m-%d").date()
+    counts = {
+        "formats_non_valides": 0,
+        "valeurs_non_valides": 0,
+        "donnees_manquantes": 0,
+        "valeurs_non_renseignees": 0,
+    }
+    for v, count in failed_validators_counts.items():
+        if v == "minLength" or v == "maxLength" or v == "pattern":
+            counts["formats_non_valides"] += count
+        elif v == "enum" or v == "minimum" or v == "maximum":
+            counts["valeurs_non_valides"] += count
+        elif v == "required":
+            counts["donnees_manquantes"] += count
+            counts["valeurs_non_renseignees"] += count
+        else:
+            logging.warning("Validateur non géré : %s", v)
+    return counts
+
 
+def find_duplicates(marches: list, record_fingerprints: list = None):
+    """Recherche les identifiants non uniques et les lignes dupliquées d'une source.
 
-def is_market_publishing_delay_overdue(notification_date: str, publishing_date: str):
-    """Vérifie si le délai maximal entre notification et publication est dépassé.
+    La recherche est exacte, ou probabiliste si configuré
+    (conf.audit.lignes_dupliquees.probabiliste).
 
     Args:
-        notification_date (str): Date de notification (YYYY-MM-DD)
-        publishing_date (str): Date de publication (YYYY-MM-DD)
+        marches (list): Marchés de la source
+        record_fingerprints (list, optional): Empreintes de chaque marché déjà calculées
+            (voir fingerprints.record_fingerprints). Defaults to None.
 
     Returns:
-        bool: True si le délai est dépassé, False sinon
+        fingerprints.DuplicatesReport: UIDs et nombres de lignes concernées par chaque type de doublon
     """
-    notification_date = str_to_datetime_date(notification_date)
-    publishing_date = str_to_datetime_date(publishing_date)
-    delta = publishing_date - notification_date
-    return int(delta.days) > conf.audit.delai_publication
+    ignored_fields = conf.audit.lignes_dupliquees.colonnes_excluses
+    probabilistic = conf.audit.lignes_dupliquees.probabiliste
+    if not probabilistic.actif:
+        if record_fingerprints is not None:
+            exact_fingerprints, near_fingerprints = zip(*record_fingerprints)
+            return fingerprints.find_duplicates_from_fingerprints(
+                [marche.get("uid") for marche in marches],
+                exact_fingerprints,
+                near_fingerprints,
+            )
+        return fingerprints.find_duplicates(marches, ignored_fields)
+    if record_fingerprints is not None:
+        near_fingerprints = (near for _, near in record_fingerprints)
+    else:
+        ignored_fields = set(ignored_fields)
+        near_fingerprints = (
+            fingerprints.fingerprint(marche, ignored_fields) for marche in marches
+        )
+    duplicates = fingerprints.find_duplicates_approximate(
+        [marche.get("uid") for marche in marches],
+        near_fingerprints,
+        probabilistic.capacite,
+        error_rate=probabilistic.taux_faux_positifs,
+        precision=probabilistic.precision_hyperloglog,
+        max_candidates=probabilistic.nombre_max_candidats,
+    )
+    logging.debug(
+        "Recherche probabiliste des doublons : marge d'erreur de %.1f lignes",
+        duplicates.error_bound,
+    )
+    return duplicates
 
 
-def is_market_amount_abnormal(amount: int):
-    """Vérifie si le montant du marché est anormal.
+def count_source_defects(
+    source_data: dict,
+    schema: dict,
+    columns: typed_columns.MarchesColumns = None,
+    record_audits: RecordAudits = None,
+    extreme_values: statistics.ExtremeValues = None,
+):
+    """Compte les défauts de qualité de la donnée d'une source.
 
     Args:
-        amount (int): Montant du marché en euros
+        source_data (dict): Donnée à auditer. Doit contenir un champ "marches" non vide
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+        columns (typed_columns.MarchesColumns, optional): Colonnes typées des marchés lues depuis
+            l'instantané colonnaire. Defaults to None (construites à partir des marchés).
+        record_audits (RecordAudits, optional): Résultats calculés marché par marché au fil de la
+            lecture (voir RecordAuditor). Defaults to None (calculés ici).
+        extreme_values (statistics.ExtremeValues, optional): Statistiques des valeurs extrêmes calculées
+            au fil de la lecture (voir rules.ExtremeValuesReader). Defaults to None (calculées à partir des colonnes).
 
     Returns:
-        bool: True si le montant est anormal, False sinon.
+        dict: Nombre de lignes concernées par indicateur (jours_depuis_derniere_publication
+            contient quant à lui un nombre de jours)
     """
-    return not (
-        conf.audit.bornes_montant_aberrant.borne_inf
-        < amount
-        < conf.audit.bornes_montant_aberrant.borne_sup
+    num_lines = len(source_data["marches"])
+    with profiling.span("validation_schema", records=num_lines):
+        if record_audits is not None and record_audits.schema_results is not None:
+            schema_audit_results = schema_errors_by_uid(
+                source_data["marches"], record_audits.schema_results
+            )
+        else:
+            schema_audit_results = audit_against_schema(source_data, schema)
+    with profiling.span("doublons", records=num_lines):
+        duplicates = find_duplicates(
+            source_data["marches"],
+            None if record_audits is None else record_audits.record_fingerprints,
+        )
+    logging.debug(
+        "%d lignes dupliquées à l'identique trouvées, UIDs : %s",
+        len(duplicates.duplicated_lines),
+        duplicates.duplicated_lines,
     )
+    logging.debug(
+        "%d lignes dupliquées (hors colonnes %s) trouvées, UIDs : %s",
+        len(duplicates.near_duplicated_lines),
+        conf.audit.lignes_dupliquees.colonnes_excluses,
+        duplicates.near_duplicated_lines,
+    )
+    counts = dict()
+    counts["identifiants_non_uniques"] = duplicates.num_non_unique_uids
+    counts["lignes_dupliquees"] = duplicates.num_near_duplicated_lines
+    if duplicates.error_bound is not None:
+        counts["marge_erreur_singularite"] = duplicates.error_bound
+
+    if columns is None:
+        # Seuls les champs lus par les règles sont extraits, et convertis une seule fois
+        with profiling.span("colonnes_typees", records=num_lines):
+            columns = rules.build_columns(source_data["marches"])
+    # Règles portant sur l'ensemble de la source (dernière publication, valeurs extrêmes)
+    for rule in rules.source_rules():
+        with profiling.span(rule.indicator, records=num_lines):
+            if rule.indicator == "valeurs_extremes" and extreme_values is not None:
+                counts[rule.indicator] = rules.count_extreme_values_from_statistics(
+                    extreme_values,
+                    rules.iter_extreme_values_chunks(source_data["marches"]),
+                )
+            else:
+                counts[rule.indicator] = rule.count(columns)
+
+    # Confrontation au schéma - Formats, valeurs
+    with profiling.span("erreurs_schema", records=num_lines):
+        uids = [marche["uid"] for marche in source_data["marches"]]
+        counts.update(
+            classify_failed_validators(
+                count_schema_failed_validators(uids, schema_audit_results)
+            )
+        )
+
+    # Analyse de toutes les lignes, colonne par colonne
+    with profiling.span("regles_lignes", records=num_lines):
+        counts.update(count_row_rules(columns))
+    return counts
 
 
-def are_market_amount_and_duration_inconsistent(amount: int, duration: int):
-    """Varifie si le montant et la durée d'un marché son incohérents.
+def count_row_rules(columns: typed_columns.MarchesColumns):
+    """Compte les lignes enfreignant chaque règle évaluée ligne à ligne (voir rules.row_rules).
 
     Args:
-        amount (int): Montant du marché (euros)
-        duration (int): Durée du marché (mois)
+        columns (typed_columns.MarchesColumns): Colonnes typées des marchés d'une source
 
     Returns:
-        bool: True si incohérence, False sinon
+        dict: Nombre de lignes concernées par indicateur
     """
-    if duration == amount:
-        return True
-    elif amount / max(duration, 1) < 100:
-        return True
-    elif amount / max(duration, 1) < 1000 and amount < 200000:
-        return True
-    elif duration in [360, 365, 366] and amount < 10000000:
-        return True
-    elif duration > 120 and amount < 2000000:
-        return True
-    else:
-        return False
+    return {rule.indicator: rule.count(columns) for rule in rules.row_rules()}
 
 
-def has_unsupported_character(text: str):
-    """Vérifie si une chaîne contient des caractères mal encodés.
+def build_source_results(source_name: str, num_lines: int, counts: dict):
+    """Construit les résultats d'audit d'une source à partir des défauts comptés.
 
     Args:
-        text (str): La chaîne à vérifier
+        source_name (str): Nom de la source
+        num_lines (int): Nombre de lignes auditées
+        counts (dict): Nombre de lignes concernées par indicateur (voir count_source_defects)
 
     Returns:
-        bool: True si la chaîne contient au moins un caractère mal encodé, False sinon
+        audit_results_one_source.AuditResultsOneSource: Résultats de l'audit pour la source.
     """
-    return "�" in text
+    if num_lines == 0:
+        values = {name: 0.0 for name in counts}
+    else:
+        # Conversion vers un pourcentage des lignes concernées
+        values = {
+            name: divide_and_round(count, num_lines) for name, count in counts.items()
+        }
 
+    singularite = measures.Singularite(
+        identifiants_non_uniques=values["identifiants_non_uniques"],
+        lignes_dupliquees=values["lignes_dupliquees"],
+        marge_erreur=values.get("marge_erreur_singularite"),
+    )
+    conformite = measures.Conformite(
+        caracteres_mal_encodes=values["caracteres_mal_encodes"],
+        formats_non_valides=values["formats_non_valides"],
+        valeurs_non_valides=values["valeurs_non_valides"],
+    )
+    completude = measures.Completude(
+        donnees_manquantes=values["donnees_manquantes"],
+        valeurs_non_renseignees=values["valeurs_non_renseignees"],
+    )
+    validite = measures.Validite(
+        jours_depuis_derniere_publication=values["jours_depuis_derniere_publication"],
+        depassements_delai_entre_notification_et_publication=values[
+            "depassements_delai_entre_notification_et_publication"
+        ],
+    )
+    coherence = measures.Coherence(
+        incoherences_temporelles=values["incoherences_temporelles"],
+        incoherences_montant_duree=values["incoherences_montant_duree"],
+    )
+    exactitude = measures.Exactitude(
+        valeurs_aberrantes=values["valeurs_aberrantes"],
+        valeurs_extremes=values["valeurs_extremes"],
+    )
+
+    new_source_results = audit_results_one_source.AuditResultsOneSource(
+        source=source_name,
+        singularite=singularite,
+        conformite=conformite,
+        completude=completude,
+        validite=validite,
+        coherence=coherence,
+        exactitude=exactitude,
+    )
+
+    new_source_results.compute_general()
+    return new_source_results
 
-def count_duplicated_lines(dataframe: pandas.DataFrame):
-    """Compte le nombre de lignes étant dupliquées sur les coolonnes configurées
+
+# Indicateurs comptés pour chaque source
+DEFECT_COUNTS = [
+    "identifiants_non_uniques",
+    "formats_non_valides",
+    "valeurs_non_valides",
+    "donnees_manquantes",
+    "valeurs_non_renseignees",
+    "lignes_dupliquees",
+    "caracteres_mal_encodes",
+    "jours_depuis_derniere_publication",
+    "depassements_delai_entre_notification_et_publication",
+    "incoherences_temporelles",
+    "incoherences_montant_duree",
+    "valeurs_aberrantes",
+    "valeurs_extremes",
+]
+
+
+def audit_source_quality(
+    source_name: str,
+    source_data: dict,
+    schema: dict,
+    columns: typed_columns.MarchesColumns = None,
+    record_audits: RecordAudits = None,
+    extreme_values: statistics.ExtremeValues = None,
+):
+    """Audite la donnée consolidée pour une source.
 
     Args:
-        dataframe (pandas.DataFrame): Dataframe contenant les données
+        source_name (str): Nom de la source
+        source_data (dict): Donnée à auditer. Doit contenir un champ "marches"
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+        columns (typed_columns.MarchesColumns, optional): Colonnes typées des marchés lues depuis
+            l'instantané colonnaire. Defaults to None.
+        record_audits (RecordAudits, optional): Résultats calculés marché par marché au fil de la
+            lecture. Defaults to None.
+        extreme_values (statistics.ExtremeValues, optional): Statistiques des valeurs extrêmes calculées
+            au fil de la lecture. Defaults to None.
 
     Returns:
-        int: Nombre de lignes étant duliquées
+        audit_results_one_source.AuditResultsOneSource: Résultats de l'audit pour la source.
     """
-    exclude_columns = conf.audit.lignes_dupliquees.colonnes_excluses
-    include_columns = [c for c in dataframe.columns if c not in exclude_columns]
-    logging.debug(
-        "Comptage des informations dupliquées dans les colonnes : %s", include_columns
-    )
-    duplicates = dataframe.duplicated(keep=False, subset=include_columns)
-    num_duplicates = duplicates.sum()
-    duplicates_uids = duplicates[duplicates == True].index.to_list()
-    logging.debug(
-        "%d lignes dupliquées trouvées, UIDs : %s", num_duplicates, duplicates_uids
-    )
-    return num_duplicates
+
+    num_lines = len(source_data["marches"])
+    logging.info("%d lignes pour la source %s", num_lines, source_name)
+    if num_lines == 0:
+        counts = {name: 0 for name in DEFECT_COUNTS}
+    else:
+        counts = count_source_defects(
+            source_data, schema, columns, record_audits, extreme_values
+        )
+    return build_source_results(source_name, num_lines, counts)
 
 
-def get_days_since_last_publishing(dataframe: pandas.DataFrame):
-    """Calcule le nombre de jour depuis la dernière publication.
+def partition_marches(
+    marches, sources: list, marche_type: str = "marché", kept_consumer=None
+):
+    """Répartit les marchés par source configurée en un seul parcours.
+
+    Les valeurs de _type et de source sont comparées sans tenir compte de la casse.
+    Les marchés d'un autre _type ou d'une source non configurée sont seulement comptés.
+    Les marchés conservés le sont tous en mémoire, les indicateurs portant sur l'ensemble
+    d'une source : la mémoire utilisée reste proportionnelle au nombre de marchés audités,
+    la lecture en flux évitant seulement la copie brute et la copie décodée du fichier.
 
     Args:
-        dataframe (pandas.DataFrame): Dataframe contenant les données
+        marches (iterable): Marchés à répartir (liste ou générateur)
+        sources (list): Sources configurées
+        marche_type (str, optional): Valeur de _type à conserver. Defaults to "marché".
+        kept_consumer (callable, optional): Fonction recevant aussi chaque marché conservé,
+            dès sa lecture (source, marche). Defaults to None.
 
     Returns:
-        int: Nombre de jours depuis dernière publication
+        dict, collections.Counter: Marchés par source configurée ({source: [marche, ...]}),
+            et nombre de marchés par couple (_type, source) normalisé
     """
-    dataframe["datePublicationDonnees"] = pandas.to_datetime(
-        dataframe["datePublicationDonnees"], format="%Y-%m-%d", errors="coerce"
+    marche_type = marche_type.lower()
+    sources_by_key = {source.lower(): source for source in sources}
+    marches_by_source = {source: [] for source in sources}
+    counts = collections.Counter()
+    normalized = dict()
+    for marche in marches:
+        raw_type = marche.get("_type")
+        raw_source = marche.get("source")
+        # Les valeurs distinctes étant peu nombreuses, leur normalisation est mise en cache
+        if raw_type not in normalized:
+            normalized[raw_type] = None if raw_type is None else raw_type.lower()
+        if raw_source not in normalized:
+            normalized[raw_source] = None if raw_source is None else raw_source.lower()
+        bucket_type = normalized[raw_type]
+        bucket_source = normalized[raw_source]
+        counts[(bucket_type, bucket_source)] += 1
+        if bucket_type == marche_type and bucket_source in sources_by_key:
+            source = sources_by_key[bucket_source]
+            marches_by_source[source].append(marche)
+            if kept_consumer is not None:
+                kept_consumer(source, marche)
+    num_total = sum(counts.values())
+    num_kept = sum(len(source_marches) for source_marches in marches_by_source.values())
+    logging.debug(
+        "Valeurs de la colonne _type : %s", set(key[0] for key in counts.keys())
     )
-    most_recent_date = dataframe["datePublicationDonnees"].max().date()
-    logging.debug("Dernière publication : %s", most_recent_date)
-    today_date = datetime.now().date()
-    delta_days = (today_date - most_recent_date).days
-    logging.debug("Ecart avec aujourd'hui : %d jours", delta_days)
-    return delta_days
+    logging.debug(
+        "Passage de %d à %d entrées suite au filtrage sur le _type '%s' et les sources configurées",
+        num_total,
+        num_kept,
+        marche_type,
+    )
+    for (bucket_type, bucket_source), count in sorted(
+        counts.items(), key=lambda item: str(item[0])
+    ):
+        logging.debug(
+            "%d entrées de _type %s pour la source %s",
+            count,
+            bucket_type,
+            bucket_source,
+        )
+    unknown_sources = set(
+        bucket_source
+        for bucket_type, bucket_source in counts.keys()
+        if bucket_type == marche_type and bucket_source not in sources_by_key
+    )
+    if len(unknown_sources) > 0:
+        logging.warning(
+            "%d marchés issus de sources non configurées ignorés : %s",
+            sum(
+                count
+                for (bucket_type, bucket_source), count in counts.items()
+                if bucket_type == marche_type and bucket_source in unknown_sources
+            ),
+            unknown_sources,
+        )
+    return marches_by_source, counts
 
 
-def count_extreme_values(dataframe: pandas.DataFrame):
-    """Compte le nombre de lignes possédant des valeurs extrêmes dans les colonnes configurées
+def audit_sources_quality(
+    marches_by_source: dict,
+    schema: dict,
+    workers: int = None,
+    incremental: bool = False,
+    columns_by_source: dict = None,
+    record_audits_by_source: dict = None,
+    extreme_values_by_source: dict = None,
+):
+    """Audite la donnée consolidée de chaque source, éventuellement en parallèle.
+
+    Les sources étant indépendantes, elles peuvent être auditées dans un pool de processus.
+    Les plus volumineuses sont soumises en premier, mais les résultats sont renvoyés
+    dans l'ordre des sources reçues, comme pour un audit séquentiel.
 
     Args:
-        dataframe (pandas.DataFrame): Dataframe contenant les données
+        marches_by_source (dict): Marchés par source ({source: [marche, ...]})
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+        workers (int, optional): Nombre de processus. Defaults to None (audit séquentiel).
+        incremental (bool, optional): Si l'audit doit s'appuyer sur l'état de l'exécution précédente. Defaults to False.
+        columns_by_source (dict, optional): Colonnes typées des marchés lues depuis l'instantané colonnaire,
+            par source (ignorées en mode incrémental). Defaults to None.
+        record_audits_by_source (dict, optional): Résultats calculés marché par marché au fil de la
+            lecture, par source (ignorés en mode incrémental). Defaults to None.
+        extreme_values_by_source (dict, optional): Statistiques des valeurs extrêmes calculées au fil de la
+            lecture, par source (ignorées en mode incrémental). Defaults to None.
 
     Returns:
-        int: Nombre de lignes contenant au moins une valeur extrême
+        list: Résultats d'audit (audit_results_one_source.AuditResultsOneSource) par source
     """
-    include_columns = conf.audit.valeurs_extremes.colonnes_incluses
-    extrem_values_lines_uids = list()
-    num_stdev = conf.audit.valeurs_extremes.nombre_deviations_standards
-    for col in include_columns:
-        series = dataframe[col]
-        series = series.dropna()
-        series = pandas.to_numeric(series, errors="coerce")
-        series = series.abs()
-        extreme_values = series[(series - series.mean()) > (num_stdev * series.std())]
-        extrem_values_lines_uids += extreme_values.index.to_list()
-    extrem_values_lines_uids = list(set(extrem_values_lines_uids))
-    num_extrem_values_lines = len(extrem_values_lines_uids)
-    logging.debug(
-        "%d lignes avec valeurs extrêmes trouvées, UIDs: %s",
-        num_extrem_values_lines,
-        extrem_values_lines_uids,
-    )
-    return num_extrem_values_lines
-
-
-def audit_source_quality(source_name: str, source_data: dict, schema: dict):
-    """Audite la donnée consolidée pour une source.
+    if columns_by_source is None:
+        columns_by_source = dict()
+    if record_audits_by_source is None:
+        record_audits_by_source = dict()
+    if extreme_values_by_source is None:
+        extreme_values_by_source = dict()
+
+    if incremental:
+        audit_function = incremental_audit.audit_source_quality_incremental
+    else:
+        audit_function = audit_source_quality
+
+    def audit_arguments(source):
+        arguments = [
+            audit_function,
+            source,
+            {"marches": marches_by_source[source]},
+            schema,
+        ]
+        if not incremental:
+            arguments.append(columns_by_source.get(source))
+            arguments.append(record_audits_by_source.get(source))
+            arguments.append(extreme_values_by_source.get(source))
+        return arguments
+
+    if workers is None or workers <= 1:
+        results = list()
+        for source in marches_by_source:
+            logging.info("Audit de la qualité pour la source %s...", source)
+            results.append(audit_source_in_span(*audit_arguments(source)))
+        return results
+    logging.info("Audit de la qualité des sources sur %d processus...", workers)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = dict()
+        for source in sorted(
+            marches_by_source, key=lambda s: len(marches_by_source[s]), reverse=True
+        ):
+            logging.info("Audit de la qualité pour la source %s...", source)
+            if profiling.is_enabled():
+                # Les étapes mesurées dans le processus enfant sont rapatriées avec le résultat
+                futures[source] = executor.submit(
+                    profiling.call_with_spans,
+                    profiling.current.trace_memory,
+                    audit_source_in_span,
+                    *audit_arguments(source),
+                )
+            else:
+                futures[source] = executor.submit(
+                    audit_source_in_span, *audit_arguments(source)
+                )
+        results = list()
+        for source in marches_by_source:
+            result = futures[source].result()
+            if profiling.is_enabled():
+                result, spans, started = result
+                profiling.add_spans(spans, started)
+            results.append(result)
+        return results
+
+
+def audit_source_in_span(audit_function, source_name: str, source_data: dict, *args):
+    """Audite une source en mesurant la durée de l'audit (si le profilage est démarré).
 
     Args:
+        audit_function (callable): Fonction d'audit (audit_source_quality ou son équivalent incrémental)
         source_name (str): Nom de la source
         source_data (dict): Donnée à auditer. Doit contenir un champ "marches"
-        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
 
     Returns:
         audit_results_one_source.AuditResultsOneSource: Résultats de l'audit pour la source.
     """
+    with profiling.span(
+        "audit_source", records=len(source_data["marches"]), source=source_name
+    ):
+        return audit_function(source_name, source_data, *args)
 
-    num_lines = len(source_data["marches"])
-    uids = [marche["uid"] for marche in source_data["marches"]]
-    non_unique_uids = [uid for uid in uids if len([u for u in uids if u == uid]) > 1]
-    num_non_unique_uids = len(non_unique_uids)
-    logging.info("%d lignes pour la source %s", num_lines, source_name)
-    if len(source_data["marches"]) == 0:
-        identifiants_non_uniques = 0.0
-        formats_non_valides = 0.0
-        valeurs_non_valides = 0.0
-        donnees_manquantes = 0.0
-        valeurs_non_renseignees = 0.0
-        lignes_dupliquees = 0.0
-        caracteres_mal_encodes = 0.0
-        jours_depuis_derniere_publication = 0.0
-        depassements_delai_entre_notification_et_publication = 0.0
-        incoherences_temporelles = 0.0
-        incoherences_montant_duree = 0.0
-        valeurs_aberrantes = 0.0
-        valeurs_extremes = 0.0
-    else:
-        schema_audit_results = audit_against_schema(source_data, schema)
-        identifiants_non_uniques = num_non_unique_uids
-        formats_non_valides = 0
-        valeurs_non_valides = 0
-        donnees_manquantes = 0
-        valeurs_non_renseignees = 0
-        lignes_dupliquees = 0
-        caracteres_mal_encodes = 0
-        jours_depuis_derniere_publication = 0
-        depassements_delai_entre_notification_et_publication = 0
-        incoherences_temporelles = 0
-        incoherences_montant_duree = 0
-        valeurs_aberrantes = 0
-        valeurs_extremes = 0
-
-        dataframe = download.json_dict_to_dataframe(
-            source_data, record_path="marches", index_column="uid"
-        )
-        lignes_dupliquees = count_duplicated_lines(dataframe)
-        jours_depuis_derniere_publication = get_days_since_last_publishing(dataframe)
-        jours_depuis_derniere_publication = max(jours_depuis_derniere_publication, 100)
-        valeurs_extremes = count_extreme_values(dataframe)
-
-        # Analyse ligne par ligne
-        for marche in source_data["marches"]:
-
-            # Confrontation au schéma - Formats, valeurs
-            marche_uid = marche["uid"]
-            marche_schema_audit_results = schema_audit_results.get(marche_uid)
-            if marche_schema_audit_results is not None:
-                failed_validators = marche_schema_audit_results["failed_validators"]
-                for v in failed_validators:
-                    if v == "minLength" or v == "maxLength" or v == "pattern":
-                        formats_non_valides += 1
-                    elif v == "enum" or v == "minimum" or v == "maximum":
-                        valeurs_non_valides += 1
-                    elif v == "required":
-                        donnees_manquantes += 1
-                        valeurs_non_renseignees += 1
-                    else:
-                        logging.warning("Validateur non géré : %s", v)
-
-            # Cohérence temporelle
-            if (
-                "dateNotification" in marche.keys()
-                and "datePublicationDonnees" in marche.keys()
-            ):
-                if is_after(
-                    marche["dateNotification"], marche["datePublicationDonnees"]
-                ):
-                    incoherences_temporelles += 1
-
-            # Valeurs aberrantes
-            if "montant" in marche.keys():
-                if is_market_amount_abnormal(marche["montant"]):
-                    valeurs_aberrantes += 1
-
-            # Incohérences montant/durée
-            if "montant" in marche.keys() and "dureeMois" in marche.keys():
-                if are_market_amount_and_duration_inconsistent(
-                    marche["montant"], marche["dureeMois"]
-                ):
-                    incoherences_montant_duree += 1
-
-            # Caractères non supportés (utf8 non respecté)
-            if "objet" in marche.keys():
-                if has_unsupported_character(marche["objet"]):
-                    caracteres_mal_encodes += 1
-
-            # Dépassement du délai reglemntaire entre notification et publication
-            if (
-                "dateNotification" in marche.keys()
-                and "datePublicationDonnees" in marche.keys()
-            ):
-                if is_market_publishing_delay_overdue(
-                    marche["dateNotification"], marche["datePublicationDonnees"]
-                ):
-                    depassements_delai_entre_notification_et_publication += 1
 
-        # Conversion vers un pourcentage des lignes concernées
-        identifiants_non_uniques = divide_and_round(identifiants_non_uniques, num_lines)
-        formats_non_valides = divide_and_round(formats_non_valides, num_lines)
-        valeurs_non_valides = divide_and_round(valeurs_non_valides, num_lines)
-        donnees_manquantes = divide_and_round(donnees_manquantes, num_lines)
-        valeurs_non_renseignees = divide_and_round(valeurs_non_renseignees, num_lines)
-        lignes_dupliquees = divide_and_round(lignes_dupliquees, num_lines)
-        caracteres_mal_encodes = divide_and_round(caracteres_mal_encodes, num_lines)
-        jours_depuis_derniere_publication = divide_and_round(
-            jours_depuis_derniere_publication, num_lines
-        )
-        depassements_delai_entre_notification_et_publication = divide_and_round(
-            depassements_delai_entre_notification_et_publication, num_lines
+def read_snapshot_columns(marches_by_source: dict, rows: int = None):
+    """Charge depuis l'instantané colonnaire les colonnes des marchés de chaque source.
+
+    Seules les colonnes lues par les indicateurs sont chargées. Les marchés sont sélectionnés
+    comme dans partition_marches, dans l'ordre du fichier JSON.
+
+    Args:
+        marches_by_source (dict): Marchés par source ({source: [marche, ...]}), pour contrôle
+        rows (int, optional): Nombre de lignes auditées. Defaults to None.
+
+    Returns:
+        dict: Colonnes typées par source ({source: typed_columns.MarchesColumns}).
+            Vide si l'instantané est absent ou n'est pas à jour.
+    """
+    path = conf.download.instantane_colonnes.chemin
+    if not path:
+        return dict()
+    # Import local : pyarrow n'est requis que si l'instantané colonnaire est activé
+    from qualite_decp import snapshot
+
+    if not snapshot.is_up_to_date(conf.download.chemin_donnes_consolidees, path):
+        logging.info("Instantané colonnaire %s absent ou non à jour, ignoré", path)
+        return dict()
+    logging.info("Lecture de l'instantané colonnaire %s...", path)
+    columns = [snapshot.LINE_COLUMN, "_type", "source", "uid"]
+    columns += [field for field in rules.required_fields() if field not in columns]
+    dataframe = snapshot.read_columns(path, columns)
+    for column in ("_type", "source", "uid"):
+        if column not in dataframe.columns:
+            dataframe[column] = None
+    if rows is not None:
+        dataframe = dataframe[dataframe[snapshot.LINE_COLUMN] < rows]
+    # Même sélection que partition_marches
+    dataframe = dataframe[dataframe["_type"].str.lower() == "marché"]
+    normalized_sources = dataframe["source"].str.lower()
+    columns_by_source = dict()
+    for source, marches in marches_by_source.items():
+        source_dataframe = (
+            dataframe[normalized_sources == source.lower()]
+            .drop(columns=[snapshot.LINE_COLUMN, "_type", "source"])
+            .set_index("uid")
         )
-        incoherences_temporelles = divide_and_round(incoherences_temporelles, num_lines)
-        incoherences_montant_duree = divide_and_round(
-            incoherences_montant_duree, num_lines
+        if len(source_dataframe) != len(marches):
+            logging.warning(
+                "Instantané colonnaire incohérent pour la source %s (%d lignes au lieu de %d), ignoré",
+                source,
+                len(source_dataframe),
+                len(marches),
+            )
+            return dict()
+        columns_by_source[source] = typed_columns.MarchesColumns.from_dataframe(
+            source_dataframe, rules.required_fields()
         )
-        valeurs_aberrantes = divide_and_round(valeurs_aberrantes, num_lines)
-        valeurs_extremes = divide_and_round(valeurs_extremes, num_lines)
+    return columns_by_source
 
-    singularite = measures.Singularite(
-        identifiants_non_uniques=identifiants_non_uniques,
-        lignes_dupliquees=lignes_dupliquees,
-    )
-    conformite = measures.Conformite(
-        caracteres_mal_encodes=caracteres_mal_encodes,
-        formats_non_valides=formats_non_valides,
-        valeurs_non_valides=valeurs_non_valides,
-    )
-    completude = measures.Completude(
-        donnees_manquantes=donnees_manquantes,
-        valeurs_non_renseignees=valeurs_non_renseignees,
-    )
-    validite = measures.Validite(
-        jours_depuis_derniere_publication=jours_depuis_derniere_publication,
-        depassements_delai_entre_notification_et_publication=depassements_delai_entre_notification_et_publication,
-    )
-    coherence = measures.Coherence(
-        incoherences_temporelles=incoherences_temporelles,
-        incoherences_montant_duree=incoherences_montant_duree,
-    )
-    exactitude = measures.Exactitude(
-        valeurs_aberrantes=valeurs_aberrantes, valeurs_extremes=valeurs_extremes
-    )
 
-    new_source_results = audit_results_one_source.AuditResultsOneSource(
-        source=source_name,
-        singularite=singularite,
-        conformite=conformite,
-        completude=completude,
-        validite=validite,
-        coherence=coherence,
-        exactitude=exactitude,
-    )
+def add_cross_source_duplicates(
+    source_results: audit_results_one_source.AuditResultsOneSource,
+    num_duplicates: int,
+    num_lines: int,
+):
+    """Ajoute aux résultats d'une source la part de ses marchés également publiés par une autre source.
 
-    new_source_results.compute_general()
-    return new_source_results
+    Args:
+        source_results (audit_results_one_source.AuditResultsOneSource): Résultats de la source
+        num_duplicates (int): Nombre de marchés également publiés par une autre source
+            (voir fingerprints.count_cross_source_duplicates)
+        num_lines (int): Nombre de marchés de la source
+    """
+    source_results.singularite.doublons_inter_sources = (
+        divide_and_round(num_duplicates, num_lines) if num_lines > 0 else 0.0
+    )
 
 
-def run(rows: int = None):
-    """Audite la donnée consolidée et stocke les résultats.
+def audit_marches(
+    marches,
+    schema: dict,
+    rows: int = None,
+    workers: int = None,
+    incremental: bool = False,
+    use_snapshot: bool = True,
+    audit_while_reading: bool = False,
+):
+    """Audite des marchés de la donnée consolidée, reçus un par un.
 
     Args:
+        marches (iterable): Marchés de la donnée consolidée, dans l'ordre du fichier (liste ou générateur)
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
         rows (int, optional): Nombre de lignes desquelles auditer la qualité. Defaults to None.
+        workers (int, optional): Nombre de processus auditant les sources en parallèle. Defaults to None.
+        incremental (bool, optional): Si seuls les marchés ajoutés, supprimés ou modifiés depuis
+            l'exécution précédente doivent être audités. Defaults to False.
+        use_snapshot (bool, optional): Si les colonnes des marchés peuvent être lues depuis l'instantané
+            colonnaire (à désactiver si les marchés ne proviennent pas du fichier local). Defaults to True.
+        audit_while_reading (bool, optional): Si les étapes ne dépendant que du marché (validation, empreintes)
+            doivent être exécutées au fil de la lecture, par exemple pendant un téléchargement
+            (voir RecordAuditor ; ignoré en mode incrémental). Defaults to False.
+
+    Returns:
+        audit_results.AuditResults: Résultats de l'audit, classements compris
     """
-    data = download.open_json(conf.download.chemin_donnes_consolidees)
-    schema = download.open_json(conf.download.chemin_schema_donnees)
     # Choix d'un sous-ensemble des marchés, si requis
     if rows is not None:
-        data["marches"] = data["marches"][:rows]
-    # Filtrage sur le _type 'marché'
-    num_total = len(data["marches"])
-    availables_types = set([m.get("_type") for m in data["marches"]])
-    logging.debug("Valeurs de la colonne _type : %s", availables_types)
-    logging.debug("Filtrage de la colonne _type sur la valeur 'marché'")
-    data["marches"] = [
-        m for m in data["marches"] if m.get("_type").lower() == "marché".lower()
-    ]
-    num_filtered = len(data["marches"])
-    logging.debug(
-        "Passage de %d à %d entrées suite au filtrage", num_total, num_filtered
-    )
-    # Audit par source
-    available_sources = set([m.get("source") for m in data["marches"]])
+        marches = itertools.islice(marches, rows)
+    # Répartition des marchés par source, en une seule lecture
+    consumers = list()
+    extreme_values_reader = None
+    if not incremental:
+        extreme_values_reader = rules.ExtremeValuesReader()
+        consumers.append(extreme_values_reader.add)
+    record_auditor = None
+    if audit_while_reading and not incremental:
+        record_auditor = RecordAuditor(schema)
+        consumers.append(record_auditor.add)
+
+    def consume(source, marche):
+        for consumer in consumers:
+            consumer(source, marche)
+
+    try:
+        with profiling.span("lecture_et_repartition") as measured_span:
+            marches_by_source, counts = partition_marches(
+                marches, conf.audit.sources, kept_consumer=consume
+            )
+            measured_span["records"] = sum(counts.values())
+        extreme_values_by_source = dict()
+        if extreme_values_reader is not None:
+            extreme_values_by_source = extreme_values_reader.finish()
+        record_audits_by_source = dict()
+        if record_auditor is not None:
+            with profiling.span("fin_audit_au_fil_de_la_lecture"):
+                record_audits_by_source = record_auditor.finish()
+    finally:
+        if record_auditor is not None:
+            record_auditor.close()
+    columns_by_source = dict()
+    if use_snapshot and not incremental:
+        with profiling.span("instantane_colonnes"):
+            columns_by_source = read_snapshot_columns(marches_by_source, rows)
+    with profiling.span(
+        "doublons_inter_sources",
+        records=sum(
+            len(source_marches) for source_marches in marches_by_source.values()
+        ),
+    ):
+        cross_source_duplicates = fingerprints.count_cross_source_duplicates(
+            marches_by_source
+        )
     results = audit_results.AuditResults()
-    for source in conf.audit.sources:
-        logging.info("Audit de la qualité pour la source %s...", source)
-        source_data = {
-            "marches": [
-                m for m in data["marches"] if m.get("source").lower() == source.lower()
-            ]
-        }
-        new_source_results = audit_source_quality(source, source_data, schema)
-        results.add_results(new_source_results)
+    with profiling.span(
+        "audit_sources",
+        records=sum(
+            len(source_marches) for source_marches in marches_by_source.values()
+        ),
+    ):
+        for new_source_results in audit_sources_quality(
+            marches_by_source,
+            schema,
+            workers=workers,
+            incremental=incremental,
+            columns_by_source=columns_by_source,
+            record_audits_by_source=record_audits_by_source,
+            extreme_values_by_source=extreme_values_by_source,
+        ):
+            add_cross_source_duplicates(
+                new_source_results,
+                cross_source_duplicates[new_source_results.source],
+                len(marches_by_source[new_source_results.source]),
+            )
+            results.add_results(new_source_results)
+
+    with profiling.span("classement"):
+        results.compute_ranks()
+    return results
+
+
+def run(
+    rows: int = None,
+    workers: int = None,
+    incremental: bool = False,
+    profile: bool = False,
+    cprofile: bool = False,
+):
+    """Audite la donnée consolidée et stocke les résultats.
 
-    results.compute_ranks()
-    results.to_json(conf.audit.chemin_resultats)
+    Args:
+        rows (int, optional): Nombre de lignes desquelles auditer la qualité. Defaults to None.
+        workers (int, optional): Nombre de processus auditant les sources en parallèle. Defaults to None.
+        incremental (bool, optional): Si seuls les marchés ajoutés, supprimés ou modifiés depuis
+            l'exécution précédente doivent être audités. Defaults to False.
+        profile (bool, optional): Si la durée, le temps CPU et la mémoire de chaque étape doivent être
+            mesurés et stockés à côté des résultats (.profil.json). Defaults to False.
+        cprofile (bool, optional): Si le profil cProfile du processus principal doit être stocké
+            à côté des résultats (.prof). Defaults to False.
+    """
+    results_root, _ = os.path.splitext(conf.audit.chemin_resultats)
+    if profile:
+        profiling.start()
+    if cprofile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with profiling.span("audit"):
+            marches = download.iter_json_array(
+                conf.download.chemin_donnes_consolidees, "marches"
+            )
+            with profiling.span("lecture_schema"):
+                schema = download.open_json(conf.download.chemin_schema_donnees)
+            results = audit_marches(
+                marches, schema, rows=rows, workers=workers, incremental=incremental
+            )
+            with profiling.span("ecriture_resultats"):
+                results.to_json(conf.audit.chemin_resultats)
+    finally:
+        if cprofile:
+            profiler.disable()
+            profiler.dump_stats(results_root + ".prof")
+            logging.info("Profil cProfile stocké dans %s.prof", results_root)
+        if profile:
+            report = profiling.build_report(profiling.stop())
+            download.save_json(report, results_root + ".profil.json")
+            logging.info(
+                "Rapport de profilage stocké dans %s.profil.json", results_root
+            )
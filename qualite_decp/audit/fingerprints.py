@@ -0,0 +1,491 @@
+""" Ce module contient les fonctions de calcul d'empreintes des marchés, utilisées
+pour détecter en un seul parcours les identifiants non uniques et les lignes dupliquées.
+
+Une variante probabiliste confirme seulement les doublons candidats signalés par des filtres
+de Bloom de taille fixe (voir find_duplicates_approximate). Les marchés publiés par
+plusieurs sources sont détectés à partir d'une clé normalisée (voir count_cross_source_duplicates).
+"""
+
+import array
+import collections
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+
+from qualite_decp.audit import sketches
+
+
+class DuplicatesReport:
+    def __init__(
+        self,
+        non_unique_uids: list = None,
+        duplicated_lines: list = None,
+        near_duplicated_lines: list = None,
+        num_non_unique_uids: float = None,
+        num_near_duplicated_lines: float = None,
+        error_bound: float = None,
+    ):
+        if non_unique_uids is None:
+            non_unique_uids = list()
+        if duplicated_lines is None:
+            duplicated_lines = list()
+        if near_duplicated_lines is None:
+            near_duplicated_lines = list()
+        if num_non_unique_uids is None:
+            num_non_unique_uids = len(non_unique_uids)
+        if num_near_duplicated_lines is None:
+            num_near_duplicated_lines = len(near_duplicated_lines)
+        self.non_unique_uids = non_unique_uids
+        self.duplicated_lines = duplicated_lines
+        self.near_duplicated_lines = near_duplicated_lines
+        # Nombres de lignes concernées, estimés si les UIDs ne sont pas tous connus
+        self.num_non_unique_uids = num_non_unique_uids
+        self.num_near_duplicated_lines = num_near_duplicated_lines
+        # Marge d'erreur des nombres de lignes (None pour une recherche exacte)
+        self.error_bound = error_bound
+
+
+def canonicalize(value, ignored_fields: set = None, prefix: str = ""):
+    """Construit une forme canonique d'une valeur JSON, champs imbriqués compris.
+
+    Les clés sont triées, les valeurs nulles sont assimilées à des champs absents
+    et les nombres entiers sont comparés indépendamment de leur type (1 == 1.0).
+
+    Args:
+        value: Valeur issue d'un JSON (dict, list, str, nombre...)
+        ignored_fields (set, optional): Champs à ignorer, en notation pointée (exemple : "acheteur.nom"). Defaults to None.
+        prefix (str, optional): Chemin de la valeur courante. Defaults to "".
+
+    Returns:
+        Valeur canonique
+    """
+    if isinstance(value, dict):
+        return {
+            key: canonicalize(sub_value, ignored_fields, f"{prefix}{key}.")
+            for key, sub_value in value.items()
+            if sub_value is not None
+            and (ignored_fields is None or f"{prefix}{key}" not in ignored_fields)
+        }
+    if isinstance(value, list):
+        return [canonicalize(item, ignored_fields, prefix) for item in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def fingerprint(record: dict, ignored_fields: set = None):
+    """Calcule l'empreinte d'un enregistrement à partir de sa forme canonique.
+
+    Args:
+        record (dict): Enregistrement (marché)
+        ignored_fields (set, optional): Champs à ignorer, en notation pointée. Defaults to None.
+
+    Returns:
+        bytes: Empreinte (blake2b, 16 octets)
+    """
+    canonical = json.dumps(
+        canonicalize(record, ignored_fields),
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).digest()
+
+
+def record_fingerprints(record: dict, ignored_fields: set = None):
+    """Calcule les empreintes d'un enregistrement utilisées pour la recherche des doublons.
+
+    Args:
+        record (dict): Enregistrement (marché)
+        ignored_fields (set, optional): Champs ignorés pour l'empreinte des lignes quasi-dupliquées. Defaults to None.
+
+    Returns:
+        bytes, bytes: Empreinte exacte, et empreinte hors champs ignorés
+    """
+    return fingerprint(record), fingerprint(record, ignored_fields)
+
+
+def find_duplicates(
+    marches: list, ignored_fields: list = None, uid_field: str = "uid"
+) -> DuplicatesReport:
+    """Recherche les identifiants non uniques et les lignes dupliquées, en un seul parcours.
+
+    Args:
+        marches (list): Marchés à analyser
+        ignored_fields (list, optional): Champs ignorés pour la recherche de lignes quasi-dupliquées. Defaults to None.
+        uid_field (str, optional): Champ identifiant les marchés. Defaults to "uid".
+
+    Returns:
+        DuplicatesReport: UIDs des marchés concernés par chaque type de doublon
+    """
+    ignored_fields = set(ignored_fields) if ignored_fields is not None else set()
+    uids = list()
+    exact_fingerprints = list()
+    near_fingerprints = list()
+    for marche in marches:
+        uids.append(marche.get(uid_field))
+        exact_fingerprint, near_fingerprint = record_fingerprints(
+            marche, ignored_fields
+        )
+        exact_fingerprints.append(exact_fingerprint)
+        near_fingerprints.append(near_fingerprint)
+    return find_duplicates_from_fingerprints(
+        uids, exact_fingerprints, near_fingerprints
+    )
+
+
+def find_duplicates_from_fingerprints(
+    uids: list, exact_fingerprints: list, near_fingerprints: list
+) -> DuplicatesReport:
+    """Recherche les identifiants non uniques et les lignes dupliquées à partir d'empreintes déjà calculées.
+
+    Args:
+        uids (list): UIDs des marchés
+        exact_fingerprints (list): Empreinte exacte de chaque marché (voir record_fingerprints)
+        near_fingerprints (list): Empreinte hors champs ignorés de chaque marché
+
+    Returns:
+        DuplicatesReport: UIDs des marchés concernés par chaque type de doublon
+    """
+    uid_counts = collections.Counter(uids)
+    exact_counts = collections.Counter(exact_fingerprints)
+    near_counts = collections.Counter(near_fingerprints)
+    return DuplicatesReport(
+        non_unique_uids=[uid for uid in uids if uid_counts[uid] > 1],
+        duplicated_lines=[
+            uid
+            for uid, digest in zip(uids, exact_fingerprints)
+            if exact_counts[digest] > 1
+        ],
+        near_duplicated_lines=[
+            uid
+            for uid, digest in zip(uids, near_fingerprints)
+            if near_counts[digest] > 1
+        ],
+    )
+
+
+def uid_hash(uid):
+    """Calcule l'empreinte de 64 bits d'un UID (ou de toute valeur JSON).
+
+    Args:
+        uid: UID
+
+    Returns:
+        int: Empreinte
+    """
+    return sketches.hash64(json.dumps(uid, ensure_ascii=False).encode("utf-8"))
+
+
+def estimate_duplicated_lines(num_lines: int, distinct_counter: sketches.HyperLogLog):
+    """Estime le nombre de lignes partageant une clé avec au moins une autre ligne.
+
+    Avec D clés distinctes parmi N lignes, N - D lignes sont redondantes et le nombre de
+    lignes concernées est compris entre N - D (clés très répétées) et 2 (N - D) (paires).
+
+    Args:
+        num_lines (int): Nombre de lignes
+        distinct_counter (sketches.HyperLogLog): Estimateur du nombre de clés distinctes
+
+    Returns:
+        float, float: Estimation, et marge d'erreur (nombre de lignes)
+    """
+    distinct = distinct_counter.count()
+    redundant = max(num_lines - distinct, 0)
+    lower_bound = redundant
+    upper_bound = min(num_lines, 2 * redundant)
+    # Trois écarts-types de l'estimation du nombre de clés distinctes
+    distinct_error = 3 * distinct_counter.relative_error() * distinct
+    return (lower_bound + upper_bound) / 2, (
+        upper_bound - lower_bound
+    ) / 2 + distinct_error
+
+
+class ApproximateKeyCounter:
+    def __init__(
+        self,
+        capacity: int,
+        error_rate: float = 0.01,
+        precision: int = 14,
+        max_candidates: int = 1000000,
+    ):
+        """Crée un compteur vide des lignes partageant une clé avec au moins une autre ligne.
+
+        Le compteur est alimenté en deux parcours des lignes : add insère chaque clé dans un
+        filtre de Bloom, dimensionné pour capacity lignes (au-delà, son taux de faux positifs
+        augmente), et retient comme candidates les clés déjà (peut-être) présentes ; confirm
+        compte ensuite exactement les occurrences des seules clés candidates.
+
+        Args:
+            capacity (int): Nombre de lignes pour lequel le filtre de Bloom est dimensionné
+            error_rate (float, optional): Taux de faux positifs du filtre de Bloom. Defaults to 0.01.
+            precision (int, optional): Précision de l'estimateur HyperLogLog. Defaults to 14.
+            max_candidates (int, optional): Nombre maximal de clés candidates, et d'UIDs de lignes
+                candidates conservés. Defaults to 1000000.
+        """
+        self.bloom = sketches.BloomFilter(capacity, error_rate)
+        self.distinct_counter = sketches.HyperLogLog(precision)
+        self.max_candidates = max_candidates
+        self.num_lines = 0
+        # Clés signalées par le filtre, None si elles sont trop nombreuses
+        self.candidates = set()
+        self.occurrences = collections.Counter()
+        self.candidate_lines = list()
+
+    def add(self, key_hash: int):
+        """Ajoute une ligne (premier parcours).
+
+        Args:
+            key_hash (int): Empreinte de 64 bits de la clé de la ligne
+        """
+        self.num_lines += 1
+        self.distinct_counter.add(key_hash)
+        if self.bloom.add(key_hash) and self.candidates is not None:
+            self.candidates.add(key_hash)
+            if len(self.candidates) > self.max_candidates:
+                # Le nombre de lignes concernées sera estimé
+                self.candidates = None
+
+    def needs_confirmation(self):
+        """Indique si le second parcours (confirm) est nécessaire.
+
+        Returns:
+            bool: True si des clés candidates doivent être confirmées
+        """
+        return bool(self.candidates)
+
+    def confirm(self, uid, key_hash: int):
+        """Compte une ligne si sa clé est candidate (second parcours).
+
+        Args:
+            uid: UID du marché
+            key_hash (int): Empreinte de 64 bits de la clé de la ligne
+        """
+        if key_hash not in self.candidates:
+            return
+        self.occurrences[key_hash] += 1
+        if len(self.candidate_lines) < self.max_candidates:
+            self.candidate_lines.append((uid, key_hash))
+
+    def count(self):
+        """Compte les lignes partageant une clé avec au moins une autre ligne.
+
+        Les clés candidates étant confirmées exactement, le décompte est exact. Si elles sont
+        trop nombreuses, le nombre de lignes est estimé à partir du nombre de clés distinctes
+        (voir estimate_duplicated_lines).
+
+        Returns:
+            float, float: Nombre de lignes, et marge d'erreur (nombre de lignes, 0 si exact)
+        """
+        if self.candidates is None:
+            return estimate_duplicated_lines(self.num_lines, self.distinct_counter)
+        duplicated_keys = sum(1 for count in self.occurrences.values() if count > 1)
+        logging.debug(
+            "%d clés candidates dont %d confirmées (taux de faux positifs du filtre : %.2g)",
+            len(self.candidates),
+            duplicated_keys,
+            self.bloom.false_positive_rate(),
+        )
+        return sum(count for count in self.occurrences.values() if count > 1), 0.0
+
+    def duplicated_uids(self):
+        """Liste les UIDs des lignes dont la clé est confirmée comme répétée.
+
+        Returns:
+            list: UIDs (au plus max_candidates), vide si le nombre de lignes a été estimé
+        """
+        if self.candidates is None:
+            return list()
+        return [
+            uid
+            for uid, key_hash in self.candidate_lines
+            if self.occurrences[key_hash] > 1
+        ]
+
+
+def find_duplicates_approximate(
+    uids: list,
+    near_fingerprints,
+    capacity: int,
+    error_rate: float = 0.01,
+    precision: int = 14,
+    max_candidates: int = 1000000,
+) -> DuplicatesReport:
+    """Recherche les identifiants non uniques et les lignes quasi-dupliquées avec des filtres de taille fixe.
+
+    L'empreinte de 64 bits de chaque clé (UID, empreinte hors champs ignorés) est calculée une
+    seule fois et conservée (8 octets par ligne et par clé). Pour chaque clé, un premier parcours
+    des empreintes retient les clés candidates signalées par un filtre de Bloom, puis un second
+    parcours compte exactement les seules candidates, ce qui élimine les faux positifs du
+    filtre (voir ApproximateKeyCounter).
+
+    Les lignes dupliquées à l'identique (duplicated_lines) ne sont pas recherchées.
+
+    Args:
+        uids (list): UIDs des marchés
+        near_fingerprints (iterable): Empreintes hors champs ignorés de chaque marché
+            (voir fingerprint), parcourues une seule fois
+        capacity (int): Nombre de lignes pour lequel les filtres de Bloom sont dimensionnés
+        error_rate (float, optional): Taux de faux positifs des filtres de Bloom. Defaults to 0.01.
+        precision (int, optional): Précision des estimateurs HyperLogLog. Defaults to 14.
+        max_candidates (int, optional): Nombre maximal de clés candidates par type de clé. Defaults to 1000000.
+
+    Returns:
+        DuplicatesReport: UIDs des marchés concernés (si confirmés), nombres de lignes concernées
+            et marge d'erreur (nombre de lignes, 0 si toutes les candidates ont été confirmées)
+    """
+    key_hashes = {
+        "uid": array.array("Q", (uid_hash(uid) for uid in uids)),
+        "near": array.array(
+            "Q", (int.from_bytes(digest[:8], "big") for digest in near_fingerprints)
+        ),
+    }
+    duplicated_uids = dict()
+    num_lines_by_key = dict()
+    error_bound = 0.0
+    for key, hashes in key_hashes.items():
+        counter = ApproximateKeyCounter(capacity, error_rate, precision, max_candidates)
+        for key_hash in hashes:
+            counter.add(key_hash)
+        if counter.needs_confirmation():
+            for uid, key_hash in zip(uids, hashes):
+                counter.confirm(uid, key_hash)
+        num_lines_by_key[key], key_error_bound = counter.count()
+        duplicated_uids[key] = counter.duplicated_uids()
+        error_bound = max(error_bound, key_error_bound)
+    return DuplicatesReport(
+        non_unique_uids=duplicated_uids["uid"],
+        near_duplicated_lines=duplicated_uids["near"],
+        num_non_unique_uids=num_lines_by_key["uid"],
+        num_near_duplicated_lines=num_lines_by_key["near"],
+        error_bound=error_bound,
+    )
+
+
+def normalize_identifier(value):
+    """Normalise un identifiant (SIRET...) : espaces et ponctuation retirés, en minuscules.
+
+    Args:
+        value: Identifiant
+
+    Returns:
+        str: Identifiant normalisé, "" s'il est absent
+    """
+    if value is None:
+        return ""
+    return re.sub(r"[\W_]+", "", str(value)).lower()
+
+
+def normalize_text(value):
+    """Normalise un texte libre : accents et ponctuation retirés, en minuscules, espaces réduits.
+
+    Args:
+        value: Texte
+
+    Returns:
+        str: Texte normalisé, "" s'il est absent
+    """
+    if not isinstance(value, str):
+        return ""
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return " ".join(re.sub(r"[\W_]+", " ", value.lower()).split())
+
+
+def normalize_amount(value):
+    """Normalise un montant (arrondi au centime, 1 == 1.0 == "1").
+
+    Args:
+        value: Montant
+
+    Returns:
+        str: Montant normalisé, "" s'il est absent ou non numérique
+    """
+    try:
+        return f"{float(value):.2f}"
+    except (TypeError, ValueError):
+        return ""
+
+
+def cross_source_key(marche: dict):
+    """Calcule la clé identifiant un marché indépendamment de sa source de publication.
+
+    La clé porte sur l'acheteur, les titulaires, le montant, la date de notification et l'objet,
+    normalisés afin de rapprocher les publications d'un même marché par des plateformes différentes.
+
+    Args:
+        marche (dict): Marché
+
+    Returns:
+        bytes: Clé (blake2b, 16 octets), None si l'acheteur ou la date de notification manque
+    """
+    acheteur = marche.get("acheteur")
+    acheteur_id = normalize_identifier(
+        acheteur.get("id") if isinstance(acheteur, dict) else None
+    )
+    date_notification = marche.get("dateNotification")
+    date_notification = (
+        date_notification[:10] if isinstance(date_notification, str) else ""
+    )
+    if acheteur_id == "" or date_notification == "":
+        return None
+    titulaires = marche.get("titulaires")
+    titulaires_ids = sorted(
+        normalize_identifier(titulaire.get("id"))
+        for titulaire in (titulaires if isinstance(titulaires, list) else [])
+        if isinstance(titulaire, dict)
+    )
+    objet = hashlib.blake2b(
+        normalize_text(marche.get("objet")).encode("utf-8"), digest_size=8
+    ).hexdigest()
+    key = "\x1f".join(
+        [
+            acheteur_id,
+            ",".join(titulaires_ids),
+            normalize_amount(marche.get("montant")),
+            date_notification,
+            objet,
+        ]
+    )
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def count_cross_source_duplicates(marches_by_source: dict):
+    """Compte, pour chaque source, les marchés également publiés par une autre source.
+
+    Un seul index (clé normalisée vers nombre de marchés par source) est construit en un
+    parcours de toutes les sources, puis parcouru une fois : le coût est linéaire en nombre
+    de marchés, sans comparaison des sources deux à deux.
+
+    Args:
+        marches_by_source (dict): Marchés par source ({source: [marche, ...]})
+
+    Returns:
+        dict: Nombre de marchés de chaque source dont la clé apparaît dans au moins une autre source
+    """
+    sources = list(marches_by_source)
+    # Clé -> (indice de la source, nombre de marchés) tant qu'une seule source publie la clé,
+    # puis clé -> {indice de la source: nombre de marchés}
+    index = dict()
+    for source_index, source in enumerate(sources):
+        for marche in marches_by_source[source]:
+            key = cross_source_key(marche)
+            if key is None:
+                continue
+            entry = index.get(key)
+            if entry is None:
+                index[key] = (source_index, 1)
+            elif isinstance(entry, tuple):
+                if entry[0] == source_index:
+                    index[key] = (source_index, entry[1] + 1)
+                else:
+                    index[key] = {entry[0]: entry[1], source_index: 1}
+            else:
+                entry[source_index] = entry.get(source_index, 0) + 1
+    counts = collections.Counter()
+    for entry in index.values():
+        if isinstance(entry, dict):
+            counts.update(entry)
+    return {source: counts[source_index] for source_index, source in enumerate(sources)}
@@ -0,0 +1,617 @@
+""" Ce module contient l'audit incrémental, qui s'appuie sur un état par marché conservé
+d'une exécution à l'autre dans une base SQLite.
+
+Les résultats des règles ne dépendant que du contenu d'un marché, ils sont stockés par
+empreinte de marché. Seuls les marchés ajoutés ou modifiés depuis l'exécution précédente
+sont audités. Les agrégats d'une source (nombre de lignes par règle, occurrences de chaque
+clé de doublon, nombre, somme et somme des carrés des valeurs examinées pour les valeurs
+extrêmes) sont mis à jour avec les seules différences, puis les indicateurs en sont déduits.
+"""
+
+import collections
+import json
+import logging
+import math
+import sqlite3
+from datetime import datetime
+
+import numpy
+
+from qualite_decp import conf
+from qualite_decp.audit import app
+from qualite_decp.audit import fingerprints
+from qualite_decp.audit import rules
+from qualite_decp.audit import typed_columns
+from qualite_decp.audit import validation_cache
+
+# A incrémenter lorsque le contenu de l'état change
+STATE_VERSION = 2
+
+# Règles évaluées ligne par ligne, stockées pour chaque marché
+ROW_RULES = [rule.indicator for rule in rules.row_rules()]
+
+# Clé comparée par indicateur de doublons
+DUPLICATE_KEYS = {
+    "identifiants_non_uniques": "uid",
+    "lignes_dupliquees": "near_fingerprint",
+}
+
+
+def state_parameters_digest(schema: dict):
+    """Calcule l'empreinte des paramètres dont dépend l'état stocké.
+
+    Args:
+        schema (dict): Schéma de donnée
+
+    Returns:
+        str: Empreinte. Si elle change, l'état de l'exécution précédente est invalidé.
+    """
+    parameters = {
+        "version": STATE_VERSION,
+        "schema": validation_cache.schema_digest(schema),
+        "bornes_montant_aberrant": conf.audit.bornes_montant_aberrant,
+        "delai_publication": conf.audit.delai_publication,
+        "colonnes_excluses": conf.audit.lignes_dupliquees.colonnes_excluses,
+        "colonnes_incluses": conf.audit.valeurs_extremes.colonnes_incluses,
+    }
+    return json.dumps(parameters, sort_keys=True, default=str)
+
+
+def encode_key(value):
+    """Encode une clé de doublon (UID ou empreinte) pour la stocker.
+
+    Args:
+        value: UID (valeur JSON quelconque) ou empreinte (bytes)
+
+    Returns:
+        bytes ou str: Clé encodée, les UIDs absents étant distincts de la chaîne "None"
+    """
+    if isinstance(value, bytes):
+        return value
+    return json.dumps(value, ensure_ascii=False)
+
+
+def duplicated_lines(occurrences: int):
+    """Renvoie le nombre de lignes concernées par une clé présente plusieurs fois.
+
+    Args:
+        occurrences (int): Nombre d'occurrences de la clé
+
+    Returns:
+        int: Nombre d'occurrences si la clé est répétée, 0 sinon
+    """
+    return occurrences if occurrences > 1 else 0
+
+
+class AuditStateStore:
+    # Nombre maximal de paramètres par requête SQLite
+    batch_size = 500
+
+    def __init__(self, path: str, schema: dict):
+        """Ouvre (ou crée) l'état de l'audit incrémental.
+
+        Args:
+            path (str): Chemin vers le fichier SQLite
+            schema (dict): Schéma de donnée utilisé pour la validation
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        rule_columns = ", ".join(f"{rule} INTEGER NOT NULL" for rule in ROW_RULES)
+        self.connection.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS parametres (
+                source TEXT PRIMARY KEY,
+                empreinte TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS marches (
+                source TEXT NOT NULL,
+                digest BLOB NOT NULL,
+                occurrences INTEGER NOT NULL,
+                uid TEXT,
+                near_fingerprint BLOB NOT NULL,
+                failed_validators TEXT,
+                date_publication TEXT,
+                {rule_columns},
+                PRIMARY KEY (source, digest)
+            );
+            CREATE INDEX IF NOT EXISTS marches_date_publication
+                ON marches (source, date_publication);
+            CREATE TABLE IF NOT EXISTS valeurs (
+                source TEXT NOT NULL,
+                digest BLOB NOT NULL,
+                colonne TEXT NOT NULL,
+                valeur REAL NOT NULL,
+                PRIMARY KEY (source, digest, colonne)
+            );
+            CREATE INDEX IF NOT EXISTS valeurs_colonne_valeur
+                ON valeurs (source, colonne, valeur);
+            CREATE TABLE IF NOT EXISTS compteurs (
+                source TEXT NOT NULL,
+                nom TEXT NOT NULL,
+                valeur INTEGER NOT NULL,
+                PRIMARY KEY (source, nom)
+            );
+            CREATE TABLE IF NOT EXISTS occurrences_cles (
+                source TEXT NOT NULL,
+                type TEXT NOT NULL,
+                cle BLOB NOT NULL,
+                occurrences INTEGER NOT NULL,
+                PRIMARY KEY (source, type, cle)
+            );
+            CREATE TABLE IF NOT EXISTS statistiques (
+                source TEXT NOT NULL,
+                colonne TEXT NOT NULL,
+                nombre INTEGER NOT NULL,
+                somme REAL NOT NULL,
+                somme_carres REAL NOT NULL,
+                PRIMARY KEY (source, colonne)
+            );
+            """
+        )
+        self.parameters_digest = state_parameters_digest(schema)
+
+    def reset_if_outdated(self, source: str):
+        """Supprime l'état d'une source s'il a été produit avec d'autres paramètres.
+
+        Args:
+            source (str): Nom de la source
+        """
+        row = self.connection.execute(
+            "SELECT empreinte FROM parametres WHERE source = ?", (source,)
+        ).fetchone()
+        if row is not None and row[0] == self.parameters_digest:
+            return
+        if row is not None:
+            logging.info(
+                "Paramètres modifiés, état réinitialisé pour la source %s", source
+            )
+        for table in (
+            "marches",
+            "valeurs",
+            "compteurs",
+            "occurrences_cles",
+            "statistiques",
+        ):
+            self.connection.execute(f"DELETE FROM {table} WHERE source = ?", (source,))
+        self.connection.execute(
+            "INSERT OR REPLACE INTO parametres (source, empreinte) VALUES (?, ?)",
+            (source, self.parameters_digest),
+        )
+        self.connection.commit()
+
+    def get_occurrences(self, source: str):
+        """Liste les marchés stockés pour une source.
+
+        Args:
+            source (str): Nom de la source
+
+        Returns:
+            dict: Nombre d'occurrences par empreinte de marché
+        """
+        rows = self.connection.execute(
+            "SELECT digest, occurrences FROM marches WHERE source = ?", (source,)
+        )
+        return {bytes(digest): occurrences for digest, occurrences in rows}
+
+    def get_states(self, source: str, digests: list):
+        """Lit l'état stocké de marchés.
+
+        Args:
+            source (str): Nom de la source
+            digests (list): Empreintes des marchés
+
+        Returns:
+            dict: Etat de chaque marché (voir compute_marches_state), par empreinte
+        """
+        columns = ["digest", "occurrences", "uid", "near_fingerprint"] + ROW_RULES
+        states = dict()
+        for start in range(0, len(digests), self.batch_size):
+            batch = digests[start : start + self.batch_size]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.connection.execute(
+                f"SELECT {', '.join(columns)} FROM marches "
+                f"WHERE source = ? AND digest IN ({placeholders})",
+                [source] + batch,
+            )
+            for row in rows:
+                state = dict(zip(columns, row))
+                state["digest"] = bytes(state["digest"])
+                state["near_fingerprint"] = bytes(state["near_fingerprint"])
+                state["valeurs"] = dict()
+                states[state["digest"]] = state
+            rows = self.connection.execute(
+                f"SELECT digest, colonne, valeur FROM valeurs "
+                f"WHERE source = ? AND digest IN ({placeholders})",
+                [source] + batch,
+            )
+            for digest, column, value in rows:
+                states[bytes(digest)]["valeurs"][column] = value
+        return states
+
+    def apply_changes(
+        self,
+        source: str,
+        added: list,
+        removed: list,
+        occurrences: dict,
+    ):
+        """Met à jour l'état d'une source, et ses agrégats à partir des seules différences.
+
+        Args:
+            source (str): Nom de la source
+            added (list): Etats des marchés ajoutés (voir compute_marches_state)
+            removed (list): Empreintes des marchés supprimés
+            occurrences (dict): Nouveau nombre d'occurrences par empreinte, pour les marchés
+                conservés dont le nombre d'occurrences a changé
+        """
+        if len(added) == 0 and len(removed) == 0 and len(occurrences) == 0:
+            return
+        stored_states = self.get_states(source, list(removed) + list(occurrences))
+        # Différence du nombre d'occurrences de chaque marché modifié
+        changes = [(state, state["occurrences"]) for state in added]
+        for digest in removed:
+            state = stored_states[digest]
+            changes.append((state, -state["occurrences"]))
+        for digest, count in occurrences.items():
+            state = stored_states[digest]
+            changes.append((state, count - state["occurrences"]))
+        self.update_aggregates(source, changes)
+
+        self.connection.executemany(
+            "DELETE FROM marches WHERE source = ? AND digest = ?",
+            [(source, digest) for digest in removed],
+        )
+        self.connection.executemany(
+            "DELETE FROM valeurs WHERE source = ? AND digest = ?",
+            [(source, digest) for digest in removed],
+        )
+        self.connection.executemany(
+            "UPDATE marches SET occurrences = ? WHERE source = ? AND digest = ?",
+            [(count, source, digest) for digest, count in occurrences.items()],
+        )
+        columns = [
+            "source",
+            "digest",
+            "occurrences",
+            "uid",
+            "near_fingerprint",
+            "failed_validators",
+            "date_publication",
+        ] + ROW_RULES
+        self.connection.executemany(
+            f"INSERT INTO marches ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            [[source] + [state[column] for column in columns[1:]] for state in added],
+        )
+        self.connection.executemany(
+            "INSERT INTO valeurs (source, digest, colonne, valeur) VALUES (?, ?, ?, ?)",
+            [
+                (source, state["digest"], column, value)
+                for state in added
+                for column, value in state["valeurs"].items()
+            ],
+        )
+        self.connection.commit()
+
+    def update_aggregates(self, source: str, changes: list):
+        """Met à jour les agrégats d'une source à partir des marchés modifiés.
+
+        Args:
+            source (str): Nom de la source
+            changes (list): Couples (état du marché, différence de son nombre d'occurrences)
+        """
+        counters = collections.Counter()
+        key_changes = {
+            key_type: collections.Counter() for key_type in DUPLICATE_KEYS.values()
+        }
+        statistics = collections.defaultdict(lambda: [0, 0.0, 0.0])
+        for state, delta in changes:
+            for rule in ROW_RULES:
+                counters[rule] += state[rule] * delta
+            for key_type, key_counter in key_changes.items():
+                key_counter[encode_key(state[key_type])] += delta
+            for column, value in state["valeurs"].items():
+                column_statistics = statistics[column]
+                column_statistics[0] += delta
+                column_statistics[1] += value * delta
+                column_statistics[2] += value * value * delta
+
+        # Lignes partageant une clé : variation due aux seules clés modifiées
+        for indicator, key_type in DUPLICATE_KEYS.items():
+            for key, delta in key_changes[key_type].items():
+                if delta == 0:
+                    continue
+                row = self.connection.execute(
+                    "SELECT occurrences FROM occurrences_cles "
+                    "WHERE source = ? AND type = ? AND cle = ?",
+                    (source, key_type, key),
+                ).fetchone()
+                previous = 0 if row is None else row[0]
+                current = previous + delta
+                counters[indicator] += duplicated_lines(current) - duplicated_lines(
+                    previous
+                )
+                if current == 0:
+                    self.connection.execute(
+                        "DELETE FROM occurrences_cles "
+                        "WHERE source = ? AND type = ? AND cle = ?",
+                        (source, key_type, key),
+                    )
+                else:
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO occurrences_cles "
+                        "(source, type, cle, occurrences) VALUES (?, ?, ?, ?)",
+                        (source, key_type, key, current),
+                    )
+
+        self.connection.executemany(
+            "INSERT INTO compteurs (source, nom, valeur) VALUES (?, ?, ?) "
+            "ON CONFLICT (source, nom) DO UPDATE SET valeur = valeur + excluded.valeur",
+            [(source, name, delta) for name, delta in counters.items() if delta != 0],
+        )
+        self.connection.executemany(
+            "INSERT INTO statistiques (source, colonne, nombre, somme, somme_carres) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT (source, colonne) DO UPDATE SET "
+            "nombre = nombre + excluded.nombre, somme = somme + excluded.somme, "
+            "somme_carres = somme_carres + excluded.somme_carres",
+            [
+                (source, column, count, total, squares)
+                for column, (count, total, squares) in statistics.items()
+            ],
+        )
+        # Sommes remises à zéro lorsqu'il n'y a plus de valeurs (erreurs d'arrondi)
+        self.connection.execute(
+            "UPDATE statistiques SET somme = 0, somme_carres = 0 "
+            "WHERE source = ? AND nombre = 0",
+            (source,),
+        )
+
+    def get_counter(self, source: str, name: str):
+        """Lit un compteur d'une source.
+
+        Args:
+            source (str): Nom de la source
+            name (str): Nom du compteur (règle ou indicateur de doublons)
+
+        Returns:
+            int: Valeur du compteur
+        """
+        row = self.connection.execute(
+            "SELECT valeur FROM compteurs WHERE source = ? AND nom = ?",
+            (source, name),
+        ).fetchone()
+        return 0 if row is None else int(row[0])
+
+    def count_row_rules(self, source: str):
+        """Compte les marchés concernés par chaque règle évaluée ligne par ligne.
+
+        Args:
+            source (str): Nom de la source
+
+        Returns:
+            dict: Nombre de lignes concernées par règle
+        """
+        return {rule: self.get_counter(source, rule) for rule in ROW_RULES}
+
+    def count_duplicates(self, source: str, indicator: str):
+        """Compte les lignes partageant la même clé avec au moins une autre ligne.
+
+        Args:
+            source (str): Nom de la source
+            indicator (str): Indicateur de doublons (voir DUPLICATE_KEYS)
+
+        Returns:
+            int: Nombre de lignes concernées
+        """
+        return self.get_counter(source, indicator)
+
+    def get_most_recent_publishing_date(self, source: str):
+        """Obtient la date de publication la plus récente d'une source (lue dans l'index des dates).
+
+        Args:
+            source (str): Nom de la source
+
+        Returns:
+            str: Date (YYYY-MM-DD), ou None si aucune date n'est valide
+        """
+        (date,) = self.connection.execute(
+            "SELECT MAX(date_publication) FROM marches WHERE source = ?", (source,)
+        ).fetchone()
+        return date
+
+    def get_failed_validators(self, source: str):
+        """Obtient les validateurs en échec des marchés non conformes au schéma.
+
+        Args:
+            source (str): Nom de la source
+
+        Returns:
+            dict: Validateurs en échec par empreinte de marché
+        """
+        rows = self.connection.execute(
+            "SELECT digest, failed_validators FROM marches "
+            "WHERE source = ? AND failed_validators IS NOT NULL",
+            (source,),
+        )
+        return {bytes(digest): json.loads(validators) for digest, validators in rows}
+
+    def count_extreme_values(self, source: str):
+        """Compte les lignes possédant des valeurs extrêmes dans les colonnes configurées.
+
+        La moyenne et l'écart-type (échantillon) sont déduits du nombre, de la somme et de la
+        somme des carrés des valeurs, tenus à jour par apply_changes. Seules les valeurs
+        dépassant le seuil sont lues, dans l'index des valeurs.
+
+        Args:
+            source (str): Nom de la source
+
+        Returns:
+            int: Nombre de lignes (UIDs distincts) contenant au moins une valeur extrême
+        """
+        num_stdev = conf.audit.valeurs_extremes.nombre_deviations_standards
+        extreme_uids = set()
+        for column in conf.audit.valeurs_extremes.colonnes_incluses:
+            row = self.connection.execute(
+                "SELECT nombre, somme, somme_carres FROM statistiques "
+                "WHERE source = ? AND colonne = ?",
+                (source, column),
+            ).fetchone()
+            if row is None or row[0] < 2:
+                continue
+            count, total, squares = row
+            mean = total / count
+            variance = max(squares - total * mean, 0.0) / (count - 1)
+            rows = self.connection.execute(
+                "SELECT DISTINCT uid FROM valeurs JOIN marches USING (source, digest) "
+                "WHERE valeurs.source = ? AND valeurs.colonne = ? AND valeurs.valeur > ?",
+                (source, column, mean + num_stdev * math.sqrt(variance)),
+            )
+            extreme_uids.update(uid for (uid,) in rows)
+        logging.debug(
+            "%d lignes avec valeurs extrêmes trouvées, UIDs: %s",
+            len(extreme_uids),
+            extreme_uids,
+        )
+        return len(extreme_uids)
+
+    def close(self):
+        """Ferme la connexion à la base."""
+        self.connection.close()
+
+
+def compute_marches_state(marches: list, digests: list, schema: dict):
+    """Audite des marchés et construit leur état, indépendant des autres marchés de la source.
+
+    Args:
+        marches (list): Marchés à auditer
+        digests (list): Empreintes exactes des marchés
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+
+    Returns:
+        list: Etat de chaque marché (dict)
+    """
+    if len(marches) == 0:
+        return []
+    validation_results = app.validate_marches(marches, schema)
+    columns = rules.build_columns(marches)
+    masks = rules.evaluate_row_rules(columns)
+    publishing_days = columns.exact_days("datePublicationDonnees")
+    values = {
+        column: numpy.abs(columns.numbers(column))
+        for column in conf.audit.valeurs_extremes.colonnes_incluses
+    }
+    ignored_fields = set(conf.audit.lignes_dupliquees.colonnes_excluses)
+    states = list()
+    for index, (marche, digest, validation_result) in enumerate(
+        zip(marches, digests, validation_results)
+    ):
+        publishing_day = publishing_days[index]
+        state = {
+            "digest": digest,
+            "occurrences": 0,
+            "uid": marche.get("uid"),
+            "near_fingerprint": fingerprints.fingerprint(marche, ignored_fields),
+            "failed_validators": None
+            if validation_result is None
+            else json.dumps(sorted(validation_result["failed_validators"])),
+            "date_publication": None
+            if publishing_day == typed_columns.MISSING_DAY
+            else typed_columns.day_to_date(publishing_day).isoformat(),
+            "valeurs": {
+                column: float(column_values[index])
+                for column, column_values in values.items()
+                if not math.isnan(column_values[index])
+            },
+        }
+        for rule, mask in masks.items():
+            state[rule] = int(bool(mask[index]))
+        states.append(state)
+    return states
+
+
+def audit_source_quality_incremental(source_name: str, source_data: dict, schema: dict):
+    """Audite la donnée consolidée pour une source, à partir de l'état de l'exécution précédente.
+
+    Seuls les marchés ajoutés ou modifiés sont audités. Les indicateurs, y compris ceux
+    portant sur l'ensemble de la source (doublons, valeurs extrêmes, dernière publication),
+    sont recalculés à partir de l'état mis à jour et sont identiques à ceux d'un audit complet.
+
+    Args:
+        source_name (str): Nom de la source
+        source_data (dict): Donnée à auditer. Doit contenir un champ "marches"
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+
+    Returns:
+        audit_results_one_source.AuditResultsOneSource: Résultats de l'audit pour la source.
+    """
+    marches = source_data["marches"]
+    num_lines = len(marches)
+    logging.info("%d lignes pour la source %s", num_lines, source_name)
+    store = AuditStateStore(conf.audit.etat_incremental.chemin, schema)
+    store.reset_if_outdated(source_name)
+
+    # Différences avec l'état de l'exécution précédente
+    digests = [validation_cache.record_digest(marche) for marche in marches]
+    occurrences = collections.Counter(digests)
+    stored_occurrences = store.get_occurrences(source_name)
+    first_index = dict()
+    for index, digest in enumerate(digests):
+        first_index.setdefault(digest, index)
+    added = [digest for digest in occurrences if digest not in stored_occurrences]
+    removed = [digest for digest in stored_occurrences if digest not in occurrences]
+    changed_occurrences = {
+        digest: count
+        for digest, count in occurrences.items()
+        if digest in stored_occurrences and stored_occurrences[digest] != count
+    }
+    logging.info(
+        "Source %s : %d marchés ajoutés ou modifiés, %d supprimés ou modifiés, %d inchangés",
+        source_name,
+        len(added),
+        len(removed),
+        len(occurrences) - len(added),
+    )
+    added_states = compute_marches_state(
+        [marches[first_index[digest]] for digest in added], added, schema
+    )
+    for state in added_states:
+        state["occurrences"] = occurrences[state["digest"]]
+    store.apply_changes(source_name, added_states, removed, changed_occurrences)
+
+    if num_lines == 0:
+        store.close()
+        return app.build_source_results(
+            source_name, num_lines, {name: 0 for name in app.DEFECT_COUNTS}
+        )
+
+    counts = store.count_row_rules(source_name)
+    for indicator in DUPLICATE_KEYS:
+        counts[indicator] = store.count_duplicates(source_name, indicator)
+    counts["valeurs_extremes"] = store.count_extreme_values(source_name)
+    most_recent_date = store.get_most_recent_publishing_date(source_name)
+    jours_depuis_derniere_publication = 0
+    if most_recent_date is not None:
+        most_recent_date = datetime.strptime(most_recent_date, "%Y-%m-%d").date()
+        jours_depuis_derniere_publication = (
+            datetime.now().date() - most_recent_date
+        ).days
+    counts["jours_depuis_derniere_publication"] = max(
+        jours_depuis_derniere_publication, 100
+    )
+
+    # Confrontation au schéma : comme pour un audit complet, le résultat retenu
+    # pour un uid est celui de sa dernière occurrence non conforme
+    failed_validators = store.get_failed_validators(source_name)
+    uids = [marche["uid"] for marche in marches]
+    schema_audit_results = dict()
+    for uid, digest in zip(uids, digests):
+        if digest in failed_validators:
+            schema_audit_results[uid] = {"failed_validators": failed_validators[digest]}
+    counts.update(
+        app.classify_failed_validators(
+            app.count_schema_failed_validators(uids, schema_audit_results)
+        )
+    )
+    store.close()
+    return app.build_source_results(source_name, num_lines, counts)
@@ -295,11 +295,17 @@ class Singularite(Measure):
         rang: int = None,
         identifiants_non_uniques=None,
         lignes_dupliquees=None,
+        marge_erreur=None,
+        doublons_inter_sources=None,
     ):
         self.valeur = valeur
         self.rang = rang
         self.identifiants_non_uniques = identifiants_non_uniques
         self.lignes_dupliquees = lignes_dupliquees
+        # Marge d'erreur des indicateurs, en recherche probabiliste des doublons (None si exacte)
+        self.marge_erreur = marge_erreur
+        # Part des marchés également publiés par une autre source (hors valeur de synthèse)
+        self.doublons_inter_sources = doublons_inter_sources
 
     def compute_value(self):
         self.valeur = app.divide_and_round(
@@ -307,12 +313,17 @@ class Singularite(Measure):
         )
 
     def to_dict(self):
+        detail = {
+            "identifiants_non_uniques": self.identifiants_non_uniques,
+            "lignes_dupliquees": self.lignes_dupliquees,
+        }
+        if self.marge_erreur is not None:
+            detail["marge_erreur"] = self.marge_erreur
+        if self.doublons_inter_sources is not None:
+            detail["doublons_inter_sources"] = self.doublons_inter_sources
         return {
             "synthese": {"valeur": self.valeur, "rang": self.rang},
-            "detail": {
-                "identifiants_non_uniques": self.identifiants_non_uniques,
-                "lignes_dupliquees": self.lignes_dupliquees,
-            },
+            "detail": detail,
         }
 
     @classmethod
@@ -329,4 +340,13 @@ class Singularite(Measure):
         rang = d["synthese"]["rang"]
         identifiants_non_uniques = d["detail"]["identifiants_non_uniques"]
         lignes_dupliquees = d["detail"]["lignes_dupliquees"]
-        return cls(valeur, rang, identifiants_non_uniques, lignes_dupliquees)
+        marge_erreur = d["detail"].get("marge_erreur")
+        doublons_inter_sources = d["detail"].get("doublons_inter_sources")
+        return cls(
+            valeur,
+            rang,
+            identifiants_non_uniques,
+            lignes_dupliquees,
+            marge_erreur,
+            doublons_inter_sources,
+        )
@@ -0,0 +1,457 @@
+""" Ce module contient le registre des règles calculées sur les colonnes des marchés.
+
+Chaque règle déclare l'indicateur qu'elle alimente, les champs des marchés qu'elle lit
+(notation pointée pour les champs imbriqués) avec leur type, et la manière dont son résultat est agrégé :
+- "lignes" : la règle est évaluée ligne par ligne, l'indicateur compte les lignes en infraction ;
+- "source" : la règle est évaluée sur l'ensemble des lignes d'une source et renvoie directement l'indicateur.
+
+Les règles sont évaluées sur les colonnes typées des marchés d'une source (voir
+typed_columns.MarchesColumns), construites pour l'union des champs lus (voir required_fields).
+Ajouter un indicateur revient à déclarer une règle avec register.
+"""
+
+import collections
+import logging
+from datetime import datetime
+
+import numpy
+import pandas
+
+from qualite_decp import conf
+from qualite_decp.audit import statistics
+from qualite_decp.audit import typed_columns
+from qualite_decp.audit.typed_columns import DATE, NUMBER, TEXT
+
+# Agrégation des règles évaluées ligne par ligne
+ROW_AGGREGATION = "lignes"
+# Agrégation des règles évaluées sur l'ensemble d'une source
+SOURCE_AGGREGATION = "source"
+
+# Règles déclarées, par indicateur, dans l'ordre de leur déclaration
+REGISTRY = collections.OrderedDict()
+
+
+class Rule:
+    def __init__(self, indicator: str, fields, evaluate, aggregation: str):
+        """Déclare une règle.
+
+        Args:
+            indicator (str): Nom de l'indicateur alimenté (voir app.DEFECT_COUNTS)
+            fields (dict ou callable): Type (NUMBER, DATE ou TEXT) de chaque champ lu par la règle,
+                ou fonction les renvoyant (champs dépendant de la configuration)
+            evaluate (callable): Fonction évaluant la règle sur les colonnes typées des marchés
+            aggregation (str): ROW_AGGREGATION ou SOURCE_AGGREGATION
+        """
+        if aggregation not in (ROW_AGGREGATION, SOURCE_AGGREGATION):
+            raise ValueError(f"Agrégation inconnue : {aggregation}")
+        self.indicator = indicator
+        self.fields = fields
+        self.evaluate = evaluate
+        self.aggregation = aggregation
+
+    def get_fields(self):
+        """Renvoie les champs lus par la règle.
+
+        Returns:
+            dict: Type de chaque champ (notation pointée)
+        """
+        if callable(self.fields):
+            return dict(self.fields())
+        return dict(self.fields)
+
+    def count(self, columns):
+        """Calcule l'indicateur sur les marchés d'une source.
+
+        Args:
+            columns (typed_columns.MarchesColumns): Colonnes typées des marchés de la source
+
+        Returns:
+            int: Valeur de l'indicateur (nombre de lignes en infraction pour une règle ligne à ligne)
+        """
+        if self.aggregation == ROW_AGGREGATION:
+            return int(self.evaluate(columns).sum())
+        return self.evaluate(columns)
+
+
+def register(indicator: str, fields, aggregation: str = ROW_AGGREGATION):
+    """Décorateur déclarant une fonction comme règle.
+
+    Args:
+        indicator (str): Nom de l'indicateur alimenté
+        fields (dict ou callable): Type de chaque champ lu par la règle
+        aggregation (str, optional): Agrégation du résultat. Defaults to ROW_AGGREGATION.
+
+    Returns:
+        callable: Décorateur
+    """
+
+    def decorator(evaluate):
+        REGISTRY[indicator] = Rule(indicator, fields, evaluate, aggregation)
+        return evaluate
+
+    return decorator
+
+
+def row_rules():
+    """Liste les règles évaluées ligne par ligne.
+
+    Returns:
+        list: Règles (Rule)
+    """
+    return [rule for rule in REGISTRY.values() if rule.aggregation == ROW_AGGREGATION]
+
+
+def source_rules():
+    """Liste les règles évaluées sur l'ensemble d'une source.
+
+    Returns:
+        list: Règles (Rule)
+    """
+    return [
+        rule for rule in REGISTRY.values() if rule.aggregation == SOURCE_AGGREGATION
+    ]
+
+
+def required_fields(rules: list = None):
+    """Calcule l'union des champs lus par des règles.
+
+    Args:
+        rules (list, optional): Règles. Defaults to None (toutes les règles déclarées).
+
+    Returns:
+        dict: Type de chaque champ, dans l'ordre de leur première déclaration
+    """
+    if rules is None:
+        rules = REGISTRY.values()
+    fields = dict()
+    for rule in rules:
+        for field, kind in rule.get_fields().items():
+            if fields.setdefault(field, kind) != kind:
+                raise ValueError(
+                    f"Champ {field} déclaré avec les types {fields[field]} et {kind}"
+                )
+    return fields
+
+
+def build_columns(records: list):
+    """Construit les colonnes typées lues par les règles à partir de marchés.
+
+    Args:
+        records (list): Marchés d'une source
+
+    Returns:
+        typed_columns.MarchesColumns: Colonnes typées
+    """
+    return typed_columns.MarchesColumns.from_records(records, required_fields())
+
+
+def evaluate_row_rules(columns):
+    """Evalue les règles ligne par ligne sur des marchés.
+
+    Args:
+        columns (typed_columns.MarchesColumns): Colonnes typées des marchés
+
+    Returns:
+        dict: Infractions ligne par ligne (numpy.ndarray de booléens), par indicateur
+    """
+    return {rule.indicator: rule.evaluate(columns) for rule in row_rules()}
+
+
+def is_after(date_1: numpy.ndarray, date_2: numpy.ndarray):
+    """Vérifie, ligne par ligne, si date_1 est strictement ultérieure à date_2.
+
+    Args:
+        date_1 (numpy.ndarray): Premières dates (jours, voir typed_columns.MarchesColumns.days)
+        date_2 (numpy.ndarray): Secondes dates (jours)
+
+    Returns:
+        numpy.ndarray: True si date_1 est ultérieure à date_2, False sinon ou si une date manque.
+    """
+    return (
+        (date_1 != typed_columns.MISSING_DAY)
+        & (date_2 != typed_columns.MISSING_DAY)
+        & (date_1 > date_2)
+    )
+
+
+def is_market_publishing_delay_overdue(
+    notification_date: numpy.ndarray, publishing_date: numpy.ndarray
+):
+    """Vérifie, ligne par ligne, si le délai maximal entre notification et publication est dépassé.
+
+    Args:
+        notification_date (numpy.ndarray): Dates de notification (jours, voir typed_columns.MarchesColumns.days)
+        publishing_date (numpy.ndarray): Dates de publication (jours)
+
+    Returns:
+        numpy.ndarray: True si le délai est dépassé, False sinon ou si une date manque
+    """
+    delta = publishing_date.astype(numpy.int64) - notification_date
+    return (
+        (notification_date != typed_columns.MISSING_DAY)
+        & (publishing_date != typed_columns.MISSING_DAY)
+        & (delta > conf.audit.delai_publication)
+    )
+
+
+def is_market_amount_abnormal(amount: numpy.ndarray):
+    """Vérifie, ligne par ligne, si le montant du marché est anormal.
+
+    Args:
+        amount (numpy.ndarray): Montants des marchés en euros (NaN si absent)
+
+    Returns:
+        numpy.ndarray: True si le montant est anormal, False sinon ou si le montant manque.
+    """
+    lower_bound = conf.audit.bornes_montant_aberrant.borne_inf
+    upper_bound = conf.audit.bornes_montant_aberrant.borne_sup
+    return ~numpy.isnan(amount) & ~((lower_bound < amount) & (amount < upper_bound))
+
+
+def are_market_amount_and_duration_inconsistent(
+    amount: numpy.ndarray, duration: numpy.ndarray
+):
+    """Varifie, ligne par ligne, si le montant et la durée d'un marché son incohérents.
+
+    Args:
+        amount (numpy.ndarray): Montants des marchés (euros, NaN si absent)
+        duration (numpy.ndarray): Durées des marchés (mois, NaN si absente)
+
+    Returns:
+        numpy.ndarray: True si incohérence, False sinon ou si le montant ou la durée manque
+    """
+    amount_per_month = amount / numpy.clip(duration, 1, None)
+    inconsistent = (
+        (duration == amount)
+        | (amount_per_month < 100)
+        | ((amount_per_month < 1000) & (amount < 200000))
+        | (numpy.isin(duration, [360, 365, 366]) & (amount < 10000000))
+        | ((duration > 120) & (amount < 2000000))
+    )
+    return inconsistent & ~numpy.isnan(amount) & ~numpy.isnan(duration)
+
+
+def has_unsupported_character(text: pandas.Series):
+    """Vérifie, ligne par ligne, si une chaîne contient des caractères mal encodés.
+
+    Args:
+        text (pandas.Series): Les chaînes à vérifier
+
+    Returns:
+        pandas.Series: True si la chaîne contient au moins un caractère mal encodé, False sinon
+    """
+    return text.astype(object).str.contains("�", regex=False, na=False).astype(bool)
+
+
+def get_days_since_last_publishing(columns):
+    """Calcule le nombre de jour depuis la dernière publication.
+
+    Args:
+        columns (typed_columns.MarchesColumns): Colonnes typées des marchés
+
+    Returns:
+        int: Nombre de jours depuis dernière publication (0 si aucune date n'est valide)
+    """
+    publishing_days = columns.exact_dates("datePublicationDonnees")
+    if len(publishing_days) == 0:
+        return 0
+    most_recent_date = typed_columns.day_to_date(publishing_days.max())
+    logging.debug("Dernière publication : %s", most_recent_date)
+    today_date = datetime.now().date()
+    delta_days = (today_date - most_recent_date).days
+    logging.debug("Ecart avec aujourd'hui : %d jours", delta_days)
+    return delta_days
+
+
+def new_extreme_values():
+    """Crée les statistiques vides des colonnes examinées pour les valeurs extrêmes.
+
+    Returns:
+        statistics.ExtremeValues: Statistiques des colonnes conf.audit.valeurs_extremes.colonnes_incluses
+    """
+    return statistics.ExtremeValues(
+        conf.audit.valeurs_extremes.colonnes_incluses,
+        conf.audit.valeurs_extremes.nombre_deviations_standards,
+        conf.audit.valeurs_extremes.taille_tampon,
+    )
+
+
+def extreme_values_chunk(records: list):
+    """Extrait d'un lot de marchés les valeurs examinées pour les valeurs extrêmes.
+
+    Args:
+        records (list): Lot de marchés
+
+    Returns:
+        numpy.ndarray, dict: UIDs des marchés, et valeurs absolues de chaque colonne examinée
+    """
+    include_columns = conf.audit.valeurs_extremes.colonnes_incluses
+    columns = typed_columns.MarchesColumns.from_records(
+        records, {column: NUMBER for column in include_columns}
+    )
+    return columns.uids, {
+        column: numpy.abs(columns.numbers(column)) for column in include_columns
+    }
+
+
+def iter_extreme_values_chunks(records: list, chunk_size: int = None):
+    """Parcourt par lots les valeurs examinées pour les valeurs extrêmes.
+
+    Args:
+        records (list): Marchés
+        chunk_size (int, optional): Nombre de marchés par lot. Defaults to None (conf.audit.valeurs_extremes.taille_lot).
+
+    Yields:
+        numpy.ndarray, dict: UIDs et valeurs d'un lot (voir extreme_values_chunk)
+    """
+    if chunk_size is None:
+        chunk_size = conf.audit.valeurs_extremes.taille_lot
+    for start in range(0, len(records), chunk_size):
+        yield extreme_values_chunk(records[start : start + chunk_size])
+
+
+class ExtremeValuesReader:
+    def __init__(self, chunk_size: int = None):
+        """Calcule les statistiques des valeurs extrêmes de chaque source au fil de la lecture des marchés.
+
+        Args:
+            chunk_size (int, optional): Nombre de marchés d'une source par lot. Defaults to None
+                (conf.audit.valeurs_extremes.taille_lot).
+        """
+        if chunk_size is None:
+            chunk_size = conf.audit.valeurs_extremes.taille_lot
+        self.chunk_size = chunk_size
+        self.pending = collections.defaultdict(list)
+        self.extreme_values = collections.defaultdict(new_extreme_values)
+
+    def add(self, source: str, marche: dict):
+        """Ajoute un marché, pris en compte avec le lot en cours de sa source une fois celui-ci complet.
+
+        Args:
+            source (str): Source du marché
+            marche (dict): Marché
+        """
+        pending = self.pending[source]
+        pending.append(marche)
+        if len(pending) >= self.chunk_size:
+            self.flush(source)
+
+    def flush(self, source: str):
+        """Prend en compte le lot en cours d'une source.
+
+        Args:
+            source (str): Source
+        """
+        pending = self.pending.pop(source, None)
+        if pending:
+            self.extreme_values[source].update(*extreme_values_chunk(pending))
+
+    def finish(self):
+        """Prend en compte les lots en cours.
+
+        Returns:
+            dict: Statistiques par source ({source: statistics.ExtremeValues})
+        """
+        for source in list(self.pending):
+            self.flush(source)
+        return dict(self.extreme_values)
+
+
+def count_extreme_values_from_statistics(extreme_values, chunks):
+    """Compte le nombre de lignes possédant des valeurs extrêmes à partir de statistiques déjà calculées.
+
+    Args:
+        extreme_values (statistics.ExtremeValues): Statistiques des colonnes examinées
+        chunks (iterable): Lots (UIDs, valeurs) parcourus une seconde fois si le tampon des plus
+            grandes valeurs est insuffisant
+
+    Returns:
+        int: Nombre de lignes contenant au moins une valeur extrême
+    """
+    extrem_values_lines_uids = extreme_values.extreme_ids()
+    if extrem_values_lines_uids is None:
+        logging.debug("Tampon des plus grandes valeurs insuffisant, second parcours")
+        extrem_values_lines_uids = extreme_values.extreme_ids_in_chunks(chunks)
+    num_extrem_values_lines = len(extrem_values_lines_uids)
+    logging.debug(
+        "%d lignes avec valeurs extrêmes trouvées, UIDs: %s",
+        num_extrem_values_lines,
+        extrem_values_lines_uids,
+    )
+    return num_extrem_values_lines
+
+
+def count_extreme_values(columns):
+    """Compte le nombre de lignes possédant des valeurs extrêmes dans les colonnes configurées
+
+    Args:
+        columns (typed_columns.MarchesColumns): Colonnes typées des marchés
+
+    Returns:
+        int: Nombre de lignes contenant au moins une valeur extrême
+    """
+    values = {
+        column: numpy.abs(columns.numbers(column))
+        for column in conf.audit.valeurs_extremes.colonnes_incluses
+    }
+    extreme_values = new_extreme_values().update(columns.uids, values)
+    return count_extreme_values_from_statistics(
+        extreme_values, [(columns.uids, values)]
+    )
+
+
+@register(
+    "incoherences_temporelles",
+    {"dateNotification": DATE, "datePublicationDonnees": DATE},
+)
+def temporal_inconsistencies(columns):
+    return is_after(
+        columns.days("dateNotification"), columns.days("datePublicationDonnees")
+    )
+
+
+@register(
+    "depassements_delai_entre_notification_et_publication",
+    {"dateNotification": DATE, "datePublicationDonnees": DATE},
+)
+def publishing_delays_overdue(columns):
+    return is_market_publishing_delay_overdue(
+        columns.days("dateNotification"), columns.days("datePublicationDonnees")
+    )
+
+
+@register("valeurs_aberrantes", {"montant": NUMBER})
+def abnormal_amounts(columns):
+    return is_market_amount_abnormal(columns.numbers("montant"))
+
+
+@register("incoherences_montant_duree", {"montant": NUMBER, "dureeMois": NUMBER})
+def amount_and_duration_inconsistencies(columns):
+    return are_market_amount_and_duration_inconsistent(
+        columns.numbers("montant"), columns.numbers("dureeMois")
+    )
+
+
+@register("caracteres_mal_encodes", {"objet": TEXT})
+def unsupported_characters(columns):
+    return columns.flags("objet", has_unsupported_character)
+
+
+@register(
+    "jours_depuis_derniere_publication",
+    {"datePublicationDonnees": DATE},
+    aggregation=SOURCE_AGGREGATION,
+)
+def days_since_last_publishing(columns):
+    return max(get_days_since_last_publishing(columns), 100)
+
+
+@register(
+    "valeurs_extremes",
+    lambda: {
+        column: NUMBER for column in conf.audit.valeurs_extremes.colonnes_incluses
+    },
+    aggregation=SOURCE_AGGREGATION,
+)
+def extreme_values(columns):
+    return count_extreme_values(columns)
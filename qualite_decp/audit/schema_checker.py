@@ -0,0 +1,230 @@
+""" Ce module compile un schéma de données (draft 4) en fonctions de vérification spécialisées.
+
+Chaque noeud du schéma est converti une seule fois en une fonction ne testant que les
+mots-clés qu'il utilise. Ces fonctions indiquent seulement si une donnée est valide :
+le détail des erreurs reste produit par jsonschema, pour les seules données invalides.
+"""
+
+import re
+
+import jsonschema
+
+
+def is_number(instance):
+    """Vérifie si une valeur est un nombre au sens JSON (les booléens sont exclus)."""
+    return isinstance(instance, (int, float)) and not isinstance(instance, bool)
+
+
+TYPE_CHECKS = {
+    "string": lambda instance: isinstance(instance, str),
+    "integer": lambda instance: isinstance(instance, int)
+    and not isinstance(instance, bool),
+    "number": is_number,
+    "object": lambda instance: isinstance(instance, dict),
+    "array": lambda instance: isinstance(instance, list),
+    "boolean": lambda instance: isinstance(instance, bool),
+    "null": lambda instance: instance is None,
+}
+
+# Mots-clés du draft 4 pris en charge par la compilation. Un noeud utilisant un autre
+# mot-clé de validation est délégué à jsonschema.
+SUPPORTED_KEYWORDS = {
+    "$ref",
+    "allOf",
+    "anyOf",
+    "enum",
+    "format",
+    "items",
+    "maxItems",
+    "maxLength",
+    "maximum",
+    "minItems",
+    "minLength",
+    "minimum",
+    "not",
+    "oneOf",
+    "pattern",
+    "properties",
+    "required",
+    "type",
+}
+
+
+class SchemaChecker:
+    def __init__(self, schema: dict):
+        """Prépare la compilation d'un schéma.
+
+        Args:
+            schema (dict): Schéma racine (format http://json-schema.org/draft-04/schema#)
+        """
+        self.schema = schema
+        self.resolver = jsonschema.RefResolver.from_schema(schema)
+        self.compiled_refs = dict()
+
+    def resolve(self, ref: str):
+        """Résout une référence ($ref) par rapport au schéma racine.
+
+        Args:
+            ref (str): Référence (exemple : "#/definitions/marche")
+
+        Returns:
+            dict: Sous-schéma référencé
+        """
+        _, resolved = self.resolver.resolve(ref)
+        return resolved
+
+    def validator(self, subschema: dict):
+        """Construit un validateur jsonschema pour un sous-schéma, les références étant résolues depuis la racine.
+
+        Args:
+            subschema (dict): Sous-schéma
+
+        Returns:
+            jsonschema.Draft4Validator: Validateur
+        """
+        return jsonschema.Draft4Validator(subschema, resolver=self.resolver)
+
+    def compile(self, subschema: dict):
+        """Compile un sous-schéma en fonction de vérification.
+
+        Args:
+            subschema (dict): Sous-schéma
+
+        Returns:
+            callable: Fonction renvoyant True si la donnée est valide, False sinon
+        """
+        if "$ref" in subschema:
+            # En draft 4, $ref rend les autres mots-clés du noeud inopérants
+            return self.compile_ref(subschema["$ref"])
+        keywords = set(subschema.keys()) & set(jsonschema.Draft4Validator.VALIDATORS)
+        if not keywords <= SUPPORTED_KEYWORDS:
+            return self.validator(subschema).is_valid
+        checks = list()
+        for keyword in sorted(keywords):
+            check = self.compile_keyword(keyword, subschema[keyword], subschema)
+            if check is None:
+                return self.validator(subschema).is_valid
+            checks.append(check)
+        if len(checks) == 1:
+            return checks[0]
+
+        def check_all(instance):
+            for check in checks:
+                if not check(instance):
+                    return False
+            return True
+
+        return check_all
+
+    def compile_ref(self, ref: str):
+        """Compile un sous-schéma référencé, une seule fois par référence.
+
+        La compilation est différée au premier appel afin de supporter les références récursives.
+
+        Args:
+            ref (str): Référence (exemple : "#/definitions/marche")
+
+        Returns:
+            callable: Fonction de vérification
+        """
+
+        def check_ref(instance):
+            if ref not in self.compiled_refs:
+                self.compiled_refs[ref] = self.compile(self.resolve(ref))
+            return self.compiled_refs[ref](instance)
+
+        return check_ref
+
+    def compile_keyword(self, keyword: str, value, subschema: dict):
+        """Compile un mot-clé de validation.
+
+        Args:
+            keyword (str): Mot-clé (exemple : "pattern")
+            value: Valeur du mot-clé dans le schéma
+            subschema (dict): Sous-schéma contenant le mot-clé
+
+        Returns:
+            callable: Fonction de vérification, ou None si le mot-clé n'est pas pris en charge sous cette forme
+        """
+        if keyword == "format":
+            # Les formats ne sont pas vérifiés par défaut par jsonschema
+            return lambda instance: True
+        if keyword == "type":
+            types = [value] if isinstance(value, str) else value
+            if not all(t in TYPE_CHECKS for t in types):
+                return None
+            type_checks = [TYPE_CHECKS[t] for t in types]
+            if len(type_checks) == 1:
+                return type_checks[0]
+            return lambda instance: any(check(instance) for check in type_checks)
+        if keyword == "enum":
+            if not all(isinstance(v, str) for v in value):
+                return None
+            values = frozenset(value)
+            return lambda instance: isinstance(instance, str) and instance in values
+        if keyword == "pattern":
+            regex = re.compile(value)
+            return (
+                lambda instance: not isinstance(instance, str)
+                or regex.search(instance) is not None
+            )
+        if keyword == "minLength":
+            return (
+                lambda instance: not isinstance(instance, str) or len(instance) >= value
+            )
+        if keyword == "maxLength":
+            return (
+                lambda instance: not isinstance(instance, str) or len(instance) <= value
+            )
+        if keyword == "minimum":
+            if subschema.get("exclusiveMinimum", False):
+                return lambda instance: not is_number(instance) or instance > value
+            return lambda instance: not is_number(instance) or instance >= value
+        if keyword == "maximum":
+            if subschema.get("exclusiveMaximum", False):
+                return lambda instance: not is_number(instance) or instance < value
+            return lambda instance: not is_number(instance) or instance <= value
+        if keyword == "minItems":
+            return (
+                lambda instance: not isinstance(instance, list)
+                or len(instance) >= value
+            )
+        if keyword == "maxItems":
+            return (
+                lambda instance: not isinstance(instance, list)
+                or len(instance) <= value
+            )
+        if keyword == "required":
+            return lambda instance: not isinstance(instance, dict) or all(
+                name in instance for name in value
+            )
+        if keyword == "properties":
+            properties = [(name, self.compile(sub)) for name, sub in value.items()]
+
+            def check_properties(instance):
+                if not isinstance(instance, dict):
+                    return True
+                for name, check in properties:
+                    if name in instance and not check(instance[name]):
+                        return False
+                return True
+
+            return check_properties
+        if keyword == "items":
+            if not isinstance(value, dict):
+                return None
+            check_item = self.compile(value)
+            return lambda instance: not isinstance(instance, list) or all(
+                check_item(item) for item in instance
+            )
+        if keyword in ("allOf", "anyOf", "oneOf"):
+            checks = [self.compile(sub) for sub in value]
+            if keyword == "allOf":
+                return lambda instance: all(check(instance) for check in checks)
+            if keyword == "anyOf":
+                return lambda instance: any(check(instance) for check in checks)
+            return lambda instance: sum(1 for check in checks if check(instance)) == 1
+        if keyword == "not":
+            check_not = self.compile(value)
+            return lambda instance: not check_not(instance)
+        return None
@@ -0,0 +1,124 @@
+""" Ce module contient des structures probabilistes de taille fixe (filtre de Bloom, HyperLogLog),
+utilisées pour présélectionner les doublons parmi un très grand nombre de marchés.
+
+Les éléments sont représentés par une empreinte de 64 bits (voir hash64).
+"""
+
+import hashlib
+import math
+
+# Masque des entiers de 64 bits
+MASK_64 = (1 << 64) - 1
+
+
+def hash64(data: bytes):
+    """Calcule une empreinte de 64 bits.
+
+    Args:
+        data (bytes): Donnée
+
+    Returns:
+        int: Empreinte (blake2b, 8 octets)
+    """
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """Crée un filtre de Bloom vide, dimensionné pour un nombre d'éléments et un taux de faux positifs.
+
+        Args:
+            capacity (int): Nombre d'éléments attendus
+            error_rate (float, optional): Taux de faux positifs visé. Defaults to 0.01.
+        """
+        capacity = max(capacity, 1)
+        self.num_bits = max(
+            int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 8
+        )
+        self.num_hashes = max(int(round(self.num_bits / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.num_set_bits = 0
+
+    def add(self, element_hash: int):
+        """Ajoute un élément et indique s'il était (peut-être) déjà présent.
+
+        Args:
+            element_hash (int): Empreinte de 64 bits de l'élément
+
+        Returns:
+            bool: True si l'élément était peut-être présent (faux positif possible),
+                False s'il était certainement absent
+        """
+        # Double hachage : les positions sont dérivées des deux moitiés de l'empreinte
+        position = element_hash & 0xFFFFFFFF
+        step = (element_hash >> 32) | 1
+        present = True
+        for _ in range(self.num_hashes):
+            index = position % self.num_bits
+            mask = 1 << (index & 7)
+            if not self.bits[index >> 3] & mask:
+                present = False
+                self.bits[index >> 3] |= mask
+                self.num_set_bits += 1
+            position += step
+        return present
+
+    def false_positive_rate(self):
+        """Estime la probabilité qu'un nouvel élément soit signalé comme déjà présent.
+
+        Returns:
+            float: Probabilité (proportion de bits à 1, à la puissance du nombre de fonctions de hachage)
+        """
+        return (self.num_set_bits / self.num_bits) ** self.num_hashes
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = 14):
+        """Crée un estimateur vide du nombre d'éléments distincts.
+
+        Args:
+            precision (int, optional): Nombre de bits de l'empreinte désignant un registre
+                (2^precision registres d'un octet). Defaults to 14.
+        """
+        if not 4 <= precision <= 18:
+            raise ValueError(f"Précision HyperLogLog non gérée : {precision}")
+        self.precision = precision
+        self.num_registers = 1 << precision
+        self.registers = bytearray(self.num_registers)
+
+    def add(self, element_hash: int):
+        """Ajoute un élément.
+
+        Args:
+            element_hash (int): Empreinte de 64 bits de l'élément
+        """
+        index = element_hash >> (64 - self.precision)
+        remaining = (element_hash << self.precision) & MASK_64
+        rank = (
+            64 - self.precision + 1 if remaining == 0 else 65 - remaining.bit_length()
+        )
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        """Estime le nombre d'éléments distincts.
+
+        Returns:
+            float: Estimation
+        """
+        m = self.num_registers
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # Correction pour les petits nombres d'éléments (comptage linéaire)
+            estimate = m * math.log(m / zeros)
+        return estimate
+
+    def relative_error(self):
+        """Renvoie l'erreur relative type de l'estimation.
+
+        Returns:
+            float: Ecart-type relatif (1,04 / racine du nombre de registres)
+        """
+        return 1.04 / math.sqrt(self.num_registers)
@@ -0,0 +1,212 @@
+""" Ce module contient le calcul par lots des statistiques utilisées pour détecter les valeurs extrêmes.
+
+La moyenne et la variance sont calculées lot par lot, puis fusionnées (algorithme de Chan et al.,
+généralisant celui de Welford). Les plus grandes valeurs de chaque colonne sont conservées dans
+un tampon de taille fixe : les valeurs extrêmes en sont extraites une fois la moyenne et
+l'écart-type connus, sauf si le tampon n'a pas pu toutes les retenir, auquel cas les lots
+sont parcourus une seconde fois.
+"""
+
+import math
+
+import numpy
+
+
+class RunningStatistics:
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        """Statistiques d'une série de valeurs, mises à jour au fil des lots.
+
+        Args:
+            count (int, optional): Nombre de valeurs. Defaults to 0.
+            mean (float, optional): Moyenne des valeurs. Defaults to 0.0.
+            m2 (float, optional): Somme des carrés des écarts à la moyenne. Defaults to 0.0.
+        """
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def merge(self, other):
+        """Fusionne les statistiques d'une autre série de valeurs.
+
+        Args:
+            other (RunningStatistics): Statistiques à fusionner
+
+        Returns:
+            RunningStatistics: Statistiques fusionnées (self)
+        """
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        return self
+
+    def update(self, values: numpy.ndarray):
+        """Ajoute un lot de valeurs (les NaN sont ignorés).
+
+        Args:
+            values (numpy.ndarray): Valeurs
+
+        Returns:
+            RunningStatistics: Statistiques mises à jour (self)
+        """
+        values = values[~numpy.isnan(values)]
+        if len(values) == 0:
+            return self
+        mean = values.mean()
+        deviations = values - mean
+        return self.merge(
+            RunningStatistics(
+                len(values), mean, float(numpy.dot(deviations, deviations))
+            )
+        )
+
+    def std(self, ddof: int = 1):
+        """Renvoie l'écart-type des valeurs.
+
+        Args:
+            ddof (int, optional): Degrés de liberté retranchés au nombre de valeurs. Defaults to 1 (échantillon).
+
+        Returns:
+            float: Ecart-type, NaN s'il n'y a pas assez de valeurs
+        """
+        if self.count <= ddof:
+            return math.nan
+        return math.sqrt(self.m2 / (self.count - ddof))
+
+
+def keep_largest(ids: numpy.ndarray, values: numpy.ndarray, size: int):
+    """Conserve les plus grandes valeurs d'une série.
+
+    Args:
+        ids (numpy.ndarray): Identifiants des lignes
+        values (numpy.ndarray): Valeurs (sans NaN)
+        size (int): Nombre de valeurs conservées
+
+    Returns:
+        numpy.ndarray, numpy.ndarray, float: Identifiants et valeurs conservés, et plus grande
+            valeur écartée (-inf si aucune)
+    """
+    num_dropped = len(values) - size
+    if num_dropped <= 0:
+        return ids, values, -math.inf
+    order = numpy.argpartition(values, num_dropped)
+    dropped, kept = order[:num_dropped], order[num_dropped:]
+    return ids[kept], values[kept], float(values[dropped].max())
+
+
+class ExtremeValues:
+    def __init__(self, columns: list, num_stdev: float, buffer_size: int):
+        """Statistiques de plusieurs colonnes, mises à jour au fil des lots, pour en détecter les valeurs extrêmes.
+
+        Une valeur est extrême si elle dépasse la moyenne de sa colonne de plus de num_stdev
+        écarts-types.
+
+        Args:
+            columns (list): Colonnes à examiner
+            num_stdev (float): Nombre d'écarts-types au-delà duquel une valeur est extrême
+            buffer_size (int): Nombre de plus grandes valeurs conservées par colonne
+        """
+        self.columns = list(columns)
+        self.num_stdev = num_stdev
+        self.buffer_size = buffer_size
+        self.statistics = {column: RunningStatistics() for column in self.columns}
+        # Plus grandes valeurs de chaque colonne : (identifiants, valeurs, plus grande valeur écartée)
+        self.largest = {
+            column: (numpy.empty(0, dtype=object), numpy.empty(0), -math.inf)
+            for column in self.columns
+        }
+
+    def merge(self, other):
+        """Fusionne les statistiques d'autres lots des mêmes colonnes.
+
+        Args:
+            other (ExtremeValues): Statistiques à fusionner
+
+        Returns:
+            ExtremeValues: Statistiques fusionnées (self)
+        """
+        for column in self.columns:
+            self.statistics[column].merge(other.statistics[column])
+            ids, values, dropped = self.largest[column]
+            other_ids, other_values, other_dropped = other.largest[column]
+            ids, values, trimmed = keep_largest(
+                numpy.concatenate((ids, other_ids)),
+                numpy.concatenate((values, other_values)),
+                self.buffer_size,
+            )
+            self.largest[column] = (ids, values, max(dropped, other_dropped, trimmed))
+        return self
+
+    def update(self, ids: numpy.ndarray, values: dict):
+        """Ajoute un lot de lignes (les NaN sont ignorés).
+
+        Args:
+            ids (numpy.ndarray): Identifiants des lignes
+            values (dict): Valeurs (numpy.ndarray) de chaque colonne
+
+        Returns:
+            ExtremeValues: Statistiques mises à jour (self)
+        """
+        chunk = ExtremeValues(self.columns, self.num_stdev, self.buffer_size)
+        for column in self.columns:
+            present = ~numpy.isnan(values[column])
+            column_values = values[column][present]
+            chunk.statistics[column].update(column_values)
+            chunk.largest[column] = keep_largest(
+                ids[present], column_values, self.buffer_size
+            )
+        return self.merge(chunk)
+
+    def thresholds(self):
+        """Calcule le seuil des valeurs extrêmes de chaque colonne.
+
+        Returns:
+            dict: Moyenne et écart maximal à la moyenne par colonne ({colonne: (moyenne, écart)}),
+                pour les colonnes d'au moins deux valeurs
+        """
+        return {
+            column: (column_statistics.mean, self.num_stdev * column_statistics.std())
+            for column, column_statistics in self.statistics.items()
+            if column_statistics.count >= 2
+        }
+
+    def extreme_ids(self):
+        """Renvoie les identifiants des lignes possédant une valeur extrême, lus dans le tampon.
+
+        Returns:
+            set: Identifiants des lignes contenant au moins une valeur extrême, None si des valeurs
+                extrêmes ont été écartées du tampon (voir extreme_ids_in_chunks)
+        """
+        extreme_ids = set()
+        for column, (mean, threshold) in self.thresholds().items():
+            ids, values, dropped = self.largest[column]
+            if dropped - mean > threshold:
+                return None
+            extreme_ids.update(ids[(values - mean) > threshold])
+        return extreme_ids
+
+    def extreme_ids_in_chunks(self, chunks):
+        """Renvoie les identifiants des lignes possédant une valeur extrême, en parcourant une seconde fois les lots.
+
+        Args:
+            chunks (iterable): Lots déjà ajoutés, sous forme de couples (identifiants, {colonne: valeurs})
+
+        Returns:
+            set: Identifiants des lignes contenant au moins une valeur extrême
+        """
+        thresholds = self.thresholds()
+        extreme_ids = set()
+        if len(thresholds) == 0:
+            return extreme_ids
+        for ids, values in chunks:
+            extreme = numpy.zeros(len(ids), dtype=bool)
+            for column, (mean, threshold) in thresholds.items():
+                extreme |= (values[column] - mean) > threshold
+            extreme_ids.update(ids[extreme])
+        return extreme_ids
@@ -0,0 +1,268 @@
+""" Ce module contient la représentation colonnaire typée des marchés d'une source.
+
+Les champs lus par les règles (voir rules) sont convertis une seule fois par source :
+- les nombres en tableaux NumPy (float64, NaN si absent ou non numérique) ;
+- les dates et les textes en codes (int32) vers leurs valeurs distinctes, chaque valeur
+  distincte n'étant convertie qu'une fois (les dates en nombre de jours depuis le 1er janvier 1970).
+"""
+
+import datetime
+
+import numpy
+import pandas
+
+from qualite_decp import download
+
+# Types de champs
+NUMBER = "nombre"
+DATE = "date"
+TEXT = "texte"
+
+# Jour représentant une date absente ou non valide
+MISSING_DAY = numpy.iinfo(numpy.int32).min
+# Origine des jours
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def to_day_ordinals(dates: pandas.Series):
+    """Convertit des dates en nombres de jours depuis le 1er janvier 1970.
+
+    Args:
+        dates (pandas.Series): Dates (NaT si absente ou non valide)
+
+    Returns:
+        numpy.ndarray: Jours (int32), MISSING_DAY si la date est absente ou non valide
+    """
+    days = dates.to_numpy(dtype="datetime64[D]")
+    missing = numpy.isnat(days)
+    days = days.astype(numpy.int64)
+    days[missing] = MISSING_DAY
+    return days.astype(numpy.int32)
+
+
+def day_to_date(day: int):
+    """Convertit un nombre de jours depuis le 1er janvier 1970 en date.
+
+    Args:
+        day (int): Jours
+
+    Returns:
+        datetime.date: Date
+    """
+    return EPOCH + datetime.timedelta(days=int(day))
+
+
+def get_column(dataframe: pandas.DataFrame, column: str):
+    """Extrait une colonne d'un DataFrame, ou une colonne vide si elle est absente.
+
+    Args:
+        dataframe (pandas.DataFrame): Dataframe contenant les données
+        column (str): Nom de la colonne
+
+    Returns:
+        pandas.Series: Colonne extraite
+    """
+    if column in dataframe.columns:
+        return dataframe[column]
+    return pandas.Series(numpy.nan, index=dataframe.index, dtype="object")
+
+
+def str_to_datetime_date(dates: pandas.Series):
+    """Convertit une colonne de dates sous forme de chaîne en dates.
+
+    Args:
+        dates (pandas.Series): Dates à convertir (YYYY-MM-DD, suivi éventuellement d'une heure)
+
+    Returns:
+        pandas.Series: Dates converties (NaT si absente ou non valide)
+    """
+    dates = dates.astype(str).str[:10]
+    return pandas.to_datetime(dates, format="%Y-%m-%d", errors="coerce")
+
+
+def to_numeric(values: pandas.Series):
+    """Convertit une colonne en nombres.
+
+    Args:
+        values (pandas.Series): Valeurs à convertir
+
+    Returns:
+        pandas.Series: Nombres (NaN si absent ou non numérique)
+    """
+    return pandas.to_numeric(values, errors="coerce")
+
+
+def parse_publishing_dates(dates: pandas.Series):
+    """Convertit une colonne de dates de publication en dates.
+
+    Args:
+        dates (pandas.Series): Dates de publication (YYYY-MM-DD)
+
+    Returns:
+        pandas.Series: Dates converties (NaT si non valide)
+    """
+    return pandas.to_datetime(dates, format="%Y-%m-%d", errors="coerce")
+
+
+def hashable_or_none(value):
+    """Remplace une valeur non hachable (liste) par None, afin de pouvoir la coder.
+
+    Une liste n'étant ni une date ni un texte, elle est traitée comme une valeur absente.
+    """
+    return None if isinstance(value, list) else value
+
+
+class MarchesColumns:
+    def __init__(self, uids, numbers: dict, codes: dict, categories: dict):
+        """Colonnes typées des marchés d'une source.
+
+        Args:
+            uids (numpy.ndarray): UIDs des marchés, dans l'ordre des marchés
+            numbers (dict): Nombres (numpy.ndarray de float64) par champ
+            codes (dict): Codes (numpy.ndarray d'int32, -1 si absent) par champ de date ou de texte
+            categories (dict): Valeurs distinctes (pandas.Series) par champ de date ou de texte
+        """
+        self.uids = uids
+        self.number_columns = numbers
+        self.codes = codes
+        self.categories = categories
+        self.day_columns = dict()
+
+    def __len__(self):
+        return len(self.uids)
+
+    @classmethod
+    def from_dataframe(cls, dataframe: pandas.DataFrame, fields: dict):
+        """Construit les colonnes typées à partir de marchés aplatis.
+
+        Args:
+            dataframe (pandas.DataFrame): Marchés aplatis, indexés par uid
+            fields (dict): Type de chaque champ à convertir (NUMBER, DATE ou TEXT)
+
+        Returns:
+            MarchesColumns: Colonnes typées
+        """
+        numbers = dict()
+        codes = dict()
+        categories = dict()
+        for field, kind in fields.items():
+            values = get_column(dataframe, field)
+            if kind == NUMBER:
+                numbers[field] = to_numeric(values).to_numpy(
+                    dtype=numpy.float64, na_value=numpy.nan
+                )
+            elif kind in (DATE, TEXT):
+                if values.dtype == object:
+                    values = values.map(hashable_or_none)
+                field_codes, uniques = pandas.factorize(values)
+                codes[field] = field_codes.astype(numpy.int32)
+                categories[field] = pandas.Series(uniques, dtype=object)
+            else:
+                raise ValueError(f"Type de champ inconnu : {kind}")
+        uids = dataframe.index.to_numpy(dtype=object)
+        return cls(uids, numbers, codes, categories)
+
+    @classmethod
+    def from_records(cls, records: list, fields: dict, index_column: str = "uid"):
+        """Construit les colonnes typées à partir de marchés, en un seul parcours.
+
+        Args:
+            records (list): Marchés
+            fields (dict): Type de chaque champ à convertir (NUMBER, DATE ou TEXT)
+            index_column (str, optional): Champ identifiant les marchés. Defaults to "uid".
+
+        Returns:
+            MarchesColumns: Colonnes typées
+        """
+        dataframe = download.records_to_dataframe(records, list(fields), index_column)
+        return cls.from_dataframe(dataframe, fields)
+
+    def numbers(self, field: str):
+        """Renvoie les nombres d'un champ.
+
+        Args:
+            field (str): Champ de type NUMBER
+
+        Returns:
+            numpy.ndarray: Nombres (float64), NaN si absent ou non numérique
+        """
+        return self.number_columns[field]
+
+    def map_categories(self, field: str, function):
+        """Evalue une fonction sur les valeurs distinctes d'un champ et renvoie son résultat par marché.
+
+        Args:
+            field (str): Champ de type DATE ou TEXT
+            function (callable): Fonction prenant les valeurs distinctes (pandas.Series) et
+                renvoyant un résultat par valeur (pandas.Series ou numpy.ndarray)
+
+        Returns:
+            numpy.ndarray, numpy.ndarray: Résultat par marché (quelconque si le champ est absent),
+                et marchés dont le champ est absent
+        """
+        codes = self.codes[field]
+        missing = codes < 0
+        results = numpy.asarray(function(self.categories[field]))
+        if len(results) == 0:
+            return numpy.zeros(len(codes), dtype=results.dtype), missing
+        return results.take(codes, mode="clip"), missing
+
+    def days(self, field: str):
+        """Renvoie les dates d'un champ, lues sur leurs 10 premiers caractères (voir str_to_datetime_date).
+
+        Args:
+            field (str): Champ de type DATE
+
+        Returns:
+            numpy.ndarray: Jours depuis le 1er janvier 1970 (int32), MISSING_DAY si absente ou non valide
+        """
+        if field not in self.day_columns:
+            days, missing = self.map_categories(
+                field, lambda dates: to_day_ordinals(str_to_datetime_date(dates))
+            )
+            days[missing] = MISSING_DAY
+            self.day_columns[field] = days
+        return self.day_columns[field]
+
+    def flags(self, field: str, predicate):
+        """Evalue un prédicat sur les valeurs distinctes d'un champ et renvoie son résultat par marché.
+
+        Args:
+            field (str): Champ de type DATE ou TEXT
+            predicate (callable): Fonction prenant les valeurs distinctes (pandas.Series)
+                et renvoyant un booléen par valeur
+
+        Returns:
+            numpy.ndarray: Booléens par marché, False si le champ est absent
+        """
+        flags, missing = self.map_categories(field, predicate)
+        flags = flags.astype(bool)
+        flags[missing] = False
+        return flags
+
+    def exact_dates(self, field: str):
+        """Renvoie les dates distinctes d'un champ au format exact YYYY-MM-DD (voir parse_publishing_dates).
+
+        Args:
+            field (str): Champ de type DATE
+
+        Returns:
+            numpy.ndarray: Jours depuis le 1er janvier 1970 (int32) des valeurs distinctes valides
+        """
+        days = to_day_ordinals(parse_publishing_dates(self.categories[field]))
+        return days[days != MISSING_DAY]
+
+    def exact_days(self, field: str):
+        """Renvoie les dates d'un champ au format exact YYYY-MM-DD, par marché.
+
+        Args:
+            field (str): Champ de type DATE
+
+        Returns:
+            numpy.ndarray: Jours depuis le 1er janvier 1970 (int32), MISSING_DAY si absente ou non valide
+        """
+        days, missing = self.map_categories(
+            field, lambda dates: to_day_ordinals(parse_publishing_dates(dates))
+        )
+        days[missing] = MISSING_DAY
+        return days
@@ -0,0 +1,161 @@
+""" Ce module contient un cache persistant des résultats de validation des marchés par rapport au schéma.
+
+Les résultats sont stockés dans une base SQLite, indexés par l'empreinte du schéma et
+l'empreinte exacte de chaque marché. D'une exécution à l'autre, seuls les marchés
+nouveaux ou modifiés doivent être validés.
+"""
+
+import hashlib
+import importlib.metadata
+import json
+import logging
+import sqlite3
+import time
+
+
+def schema_digest(schema: dict):
+    """Calcule l'empreinte d'un schéma, incluant la version de jsonschema (qui produit les messages d'erreur).
+
+    Args:
+        schema (dict): Schéma de donnée
+
+    Returns:
+        str: Empreinte hexadécimale
+    """
+    content = json.dumps(
+        [schema, importlib.metadata.version("jsonschema")],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def record_digest(record: dict):
+    """Calcule l'empreinte exacte d'un marché.
+
+    Contrairement aux empreintes de fingerprints, les valeurs nulles et les types numériques
+    sont conservés tels quels, car ils influent sur la validation.
+
+    Args:
+        record (dict): Marché
+
+    Returns:
+        bytes: Empreinte (blake2b, 16 octets)
+    """
+    content = json.dumps(
+        record, sort_keys=True, ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+
+
+class ValidationCache:
+    # Nombre maximal de paramètres par requête SQLite
+    batch_size = 500
+
+    def __init__(self, path: str, schema: dict, max_entries: int = None):
+        """Ouvre (ou crée) un cache de résultats de validation.
+
+        Args:
+            path (str): Chemin vers le fichier SQLite
+            schema (dict): Schéma de donnée utilisé pour la validation
+            max_entries (int, optional): Nombre maximal de résultats conservés. Defaults to None (illimité).
+        """
+        self.path = path
+        self.schema_digest = schema_digest(schema)
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS validation (
+                schema_digest TEXT NOT NULL,
+                record_digest BLOB NOT NULL,
+                result TEXT,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (schema_digest, record_digest)
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS validation_last_used ON validation (last_used)"
+        )
+        self.connection.commit()
+
+    def get_many(self, digests: list):
+        """Recherche des résultats de validation dans le cache.
+
+        Args:
+            digests (list): Empreintes des marchés recherchés
+
+        Returns:
+            dict: Résultats trouvés {empreinte: résultat}, le résultat valant None pour un marché valide
+        """
+        found = dict()
+        now = time.time()
+        unique_digests = list(set(digests))
+        for start in range(0, len(unique_digests), self.batch_size):
+            batch = unique_digests[start : start + self.batch_size]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.connection.execute(
+                f"SELECT record_digest, result FROM validation "
+                f"WHERE schema_digest = ? AND record_digest IN ({placeholders})",
+                [self.schema_digest] + batch,
+            ).fetchall()
+            for digest, result in rows:
+                found[bytes(digest)] = None if result is None else json.loads(result)
+        # Les résultats utilisés sont rafraîchis pour l'éviction (LRU)
+        self.connection.executemany(
+            "UPDATE validation SET last_used = ? WHERE schema_digest = ? AND record_digest = ?",
+            [(now, self.schema_digest, digest) for digest in found],
+        )
+        self.connection.commit()
+        logging.debug(
+            "%d résultats de validation trouvés en cache sur %d marchés",
+            len(found),
+            len(unique_digests),
+        )
+        return found
+
+    def put_many(self, results: dict):
+        """Stocke des résultats de validation dans le cache, puis applique l'éviction.
+
+        Args:
+            results (dict): Résultats {empreinte: résultat}, le résultat valant None pour un marché valide
+        """
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO validation (schema_digest, record_digest, result, last_used) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (
+                    self.schema_digest,
+                    digest,
+                    None if result is None else json.dumps(result, ensure_ascii=False),
+                    now,
+                )
+                for digest, result in results.items()
+            ],
+        )
+        self.connection.commit()
+        self.evict()
+
+    def evict(self):
+        """Supprime les résultats les moins récemment utilisés au-delà du nombre maximal d'entrées."""
+        if self.max_entries is None:
+            return
+        (num_entries,) = self.connection.execute(
+            "SELECT COUNT(*) FROM validation"
+        ).fetchone()
+        num_evicted = num_entries - self.max_entries
+        if num_evicted > 0:
+            self.connection.execute(
+                "DELETE FROM validation WHERE rowid IN "
+                "(SELECT rowid FROM validation ORDER BY last_used ASC LIMIT ?)",
+                (num_evicted,),
+            )
+            self.connection.commit()
+            logging.debug("%d résultats de validation évincés du cache", num_evicted)
+
+    def close(self):
+        """Ferme la connexion à la base."""
+        self.connection.close()
@@ -0,0 +1,4 @@
+""" Ce module sert à mesurer les performances de l'audit de qualité de données sur des données synthétiques.
+"""
+
+from . import app
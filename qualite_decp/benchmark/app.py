@@ -0,0 +1,183 @@
+""" Ce module mesure la durée et la mémoire des étapes de l'audit sur des marchés synthétiques.
+
+Les mesures sont stockées dans un fichier JSON afin de comparer les versions successives du projet.
+"""
+
+import datetime
+import logging
+import os
+import platform
+import subprocess
+import time
+
+from qualite_decp import conf
+from qualite_decp import download
+from qualite_decp import profiling
+from qualite_decp.audit import app
+from qualite_decp.audit import audit_results
+from qualite_decp.audit import fingerprints
+from qualite_decp.audit import rules
+from qualite_decp.audit import validation_cache
+from qualite_decp.benchmark import generator
+
+
+def measure(stage: str, num_rows: int, function, *args, **kwargs):
+    """Exécute une étape en mesurant sa durée, son temps CPU et son pic de mémoire résidente.
+
+    Args:
+        stage (str): Nom de l'étape
+        num_rows (int): Nombre de marchés traités
+        function (callable): Fonction exécutant l'étape
+
+    Returns:
+        object, dict: Résultat de la fonction, et mesures de l'étape
+    """
+    peak_reset = profiling.reset_peak_rss()
+    rss_before, _ = profiling.get_rss()
+    cpu_before = profiling.get_cpu_time()
+    wall_before = time.perf_counter()
+    result = function(*args, **kwargs)
+    wall_time = time.perf_counter() - wall_before
+    cpu_time = profiling.get_cpu_time() - cpu_before
+    _, peak_rss = profiling.get_rss()
+    measurement = {
+        "etape": stage,
+        "lignes": num_rows,
+        "duree_s": round(wall_time, 4),
+        "duree_cpu_s": round(cpu_time, 4),
+        "lignes_par_s": round(num_rows / wall_time, 1) if wall_time > 0 else None,
+        # Pic de mémoire résidente pendant l'étape, au-delà de la mémoire déjà occupée
+        "memoire_max_mo": round(max(peak_rss - rss_before, 0) / 2 ** 20, 1)
+        if peak_reset and peak_rss is not None
+        else None,
+    }
+    logging.info(
+        "%s (%d lignes) : %.2f s, %.2f s CPU, %s Mo",
+        stage,
+        num_rows,
+        wall_time,
+        cpu_time,
+        measurement["memoire_max_mo"],
+    )
+    return result, measurement
+
+
+def get_version():
+    """Renvoie le commit git du projet, s'il est disponible.
+
+    Returns:
+        str: Identifiant du commit, ou None
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_rows(num_rows: int, schema: dict, seed: int):
+    """Mesure les étapes de l'audit pour un nombre de marchés.
+
+    Args:
+        num_rows (int): Nombre de marchés générés
+        schema (dict): Schéma de donnée (format http://json-schema.org/draft-04/schema#)
+        seed (int): Graine du générateur de marchés
+
+    Returns:
+        list: Mesures des étapes
+    """
+    os.makedirs(conf.benchmark.dossier_donnees, exist_ok=True)
+    data_path = os.path.join(conf.benchmark.dossier_donnees, f"marches-{num_rows}.json")
+    results_path = os.path.join(
+        conf.benchmark.dossier_donnees, f"resultats-{num_rows}.json"
+    )
+    measurements = list()
+
+    def run_stage(stage, function, *args, **kwargs):
+        result, measurement = measure(stage, num_rows, function, *args, **kwargs)
+        measurements.append(measurement)
+        return result
+
+    marches = generator.generate_marches(
+        num_rows, conf.audit.sources, conf.benchmark.taux_defauts, seed
+    )
+    run_stage("generation", generator.write_marches, marches, data_path)
+    run_stage("open_json", download.open_json, data_path)
+    marches = run_stage(
+        "iter_json_array", lambda: list(download.iter_json_array(data_path, "marches"))
+    )
+    marches_by_source, _ = run_stage(
+        "partition_marches", app.partition_marches, marches, conf.audit.sources
+    )
+    columns = run_stage("build_columns", rules.build_columns, marches)
+    run_stage("count_row_rules", app.count_row_rules, columns)
+    run_stage("count_extreme_values", rules.count_extreme_values, columns)
+    del columns
+    run_stage(
+        "find_duplicates",
+        fingerprints.find_duplicates,
+        marches,
+        conf.audit.lignes_dupliquees.colonnes_excluses,
+    )
+    run_stage(
+        "audit_against_schema", app.audit_against_schema, {"marches": marches}, schema
+    )
+    del marches
+    results = run_stage(
+        "audit_source_quality",
+        lambda: audit_results.AuditResults(
+            [
+                app.audit_source_quality(source, {"marches": source_marches}, schema)
+                for source, source_marches in marches_by_source.items()
+            ]
+        ),
+    )
+    del marches_by_source
+    run_stage("compute_ranks", results.compute_ranks)
+    run_stage("AuditResults.to_json", results.to_json, results_path)
+    run_stage(
+        "AuditResults.from_json", audit_results.AuditResults.from_json, results_path
+    )
+    os.remove(data_path)
+    os.remove(results_path)
+    return measurements
+
+
+def run(rows: list = None, output: str = None):
+    """Mesure les performances de l'audit sur des marchés synthétiques et stocke les mesures.
+
+    Le cache de validation est désactivé, afin que chaque exécution valide tous les marchés.
+
+    Args:
+        rows (list, optional): Nombres de marchés à générer. Defaults to None (conf.benchmark.nombres_lignes).
+        output (str, optional): Chemin vers le fichier de mesures. Defaults to None (conf.benchmark.chemin_resultats).
+    """
+    if rows is None:
+        rows = conf.benchmark.nombres_lignes
+    if output is None:
+        output = conf.benchmark.chemin_resultats
+    conf.audit.cache_validation.chemin = None
+    schema = download.open_json(conf.download.chemin_schema_donnees)
+    seed = conf.benchmark.graine
+    measurements = list()
+    for num_rows in rows:
+        logging.info("Mesure des performances sur %d marchés synthétiques...", num_rows)
+        measurements += benchmark_rows(num_rows, schema, seed)
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "version": get_version(),
+        "python": platform.python_version(),
+        "plateforme": platform.platform(),
+        "processeurs": os.cpu_count(),
+        "graine": seed,
+        "taux_defauts": dict(conf.benchmark.taux_defauts),
+        "empreinte_schema": validation_cache.schema_digest(schema),
+        "validation_schema": dict(conf.audit.validation_schema),
+        "mesures": measurements,
+    }
+    download.save_json(report, output)
+    logging.info("Mesures de performance stockées dans %s", output)
@@ -0,0 +1,206 @@
+""" Ce module génère des marchés synthétiques, conformes au format des DECP consolidées, avec des défauts en proportions contrôlées.
+
+La génération est déterministe : une même graine produit toujours les mêmes marchés.
+"""
+
+import datetime
+import json
+import random
+
+NATURES = ["Marché", "Marché de partenariat", "Accord-cadre", "Marché subséquent"]
+PROCEDURES = [
+    "Procédure adaptée",
+    "Appel d'offres ouvert",
+    "Appel d'offres restreint",
+    "Procédure concurrentielle avec négociation",
+    "Procédure négociée avec mise en concurrence préalable",
+    "Marché négocié sans publicité ni mise en concurrence préalable",
+    "Dialogue compétitif",
+]
+FORMES_PRIX = ["Ferme", "Ferme et actualisable", "Révisable"]
+OBJETS = [
+    "Travaux de voirie et réseaux divers",
+    "Fourniture de matériel informatique",
+    "Prestations de nettoyage des locaux",
+    "Maintenance des installations de chauffage",
+    "Restauration scolaire",
+    "Assurance dommages aux biens",
+    "Mission de maîtrise d'oeuvre",
+    "Entretien des espaces verts",
+]
+# Source non configurée et _type non audité, présents dans la donnée consolidée
+AUTRE_SOURCE = "autre-source"
+TYPE_CONCESSION = "Contrat de concession"
+# Nombre de marchés récents conservés pour produire des doublons
+NOMBRE_MARCHES_RECENTS = 1000
+DATE_DEBUT = datetime.date(2019, 1, 1)
+
+
+def generate_marche(rng: random.Random, line: int, sources: list):
+    """Génère un marché valide.
+
+    Args:
+        rng (random.Random): Générateur aléatoire
+        line (int): Position du marché
+        sources (list): Sources parmi lesquelles choisir
+
+    Returns:
+        dict: Marché
+    """
+    date_notification = DATE_DEBUT + datetime.timedelta(days=rng.randrange(1500))
+    date_publication = date_notification + datetime.timedelta(days=rng.randrange(60))
+    duree_mois = rng.choice([1, 3, 6, 12, 12, 24, 36, 48])
+    montant = round(rng.lognormvariate(11, 1.2) * max(1, duree_mois / 12), 2)
+    return {
+        "_type": "Marché",
+        "uid": f"UID{line:010d}",
+        "id": f"{date_notification.year}{line:010d}",
+        "source": rng.choice(sources),
+        "acheteur": {
+            "id": str(rng.randrange(10 ** 13, 10 ** 14)),
+            "nom": f"Acheteur {rng.randrange(5000)}",
+        },
+        "nature": rng.choice(NATURES),
+        "objet": rng.choice(OBJETS),
+        "codeCPV": f"{rng.randrange(3000000, 98000000):08d}-{rng.randrange(10)}",
+        "procedure": rng.choice(PROCEDURES),
+        "lieuExecution": {
+            "code": f"{rng.randrange(1000, 96000):05d}",
+            "typeCode": "Code postal",
+            "nom": f"Commune {rng.randrange(30000)}",
+        },
+        "dureeMois": duree_mois,
+        "dateNotification": date_notification.isoformat(),
+        "datePublicationDonnees": date_publication.isoformat(),
+        "montant": montant,
+        "formePrix": rng.choice(FORMES_PRIX),
+        "titulaires": [
+            {
+                "typeIdentifiant": "SIRET",
+                "id": str(rng.randrange(10 ** 13, 10 ** 14)),
+                "denominationSociale": f"Entreprise {rng.randrange(100000)}",
+            }
+            for _ in range(rng.choice([1, 1, 1, 2, 3]))
+        ],
+        "modifications": [],
+    }
+
+
+def add_defects(rng: random.Random, marche: dict, defect_rates: dict, recent: list):
+    """Ajoute des défauts à un marché, chacun selon sa proportion.
+
+    Args:
+        rng (random.Random): Générateur aléatoire
+        marche (dict): Marché valide, modifié
+        defect_rates (dict): Proportion de marchés présentant chaque défaut
+        recent (list): Marchés récemment générés, pour les doublons
+
+    Returns:
+        dict: Marché, éventuellement remplacé par un doublon
+    """
+
+    def draw(defect):
+        return rng.random() < defect_rates.get(defect, 0)
+
+    if draw("doublon") and len(recent) > 0:
+        duplicate = json.loads(json.dumps(rng.choice(recent)))
+        duplicate["uid"] = marche["uid"]
+        duplicate["id"] = marche["id"]
+        return duplicate
+    if draw("uid_non_unique") and len(recent) > 0:
+        marche["uid"] = rng.choice(recent)["uid"]
+    if draw("champ_manquant"):
+        del marche[
+            rng.choice(["objet", "codeCPV", "montant", "dureeMois", "formePrix"])
+        ]
+    if draw("valeur_invalide"):
+        field, value = rng.choice(
+            [
+                ("nature", "Marché public"),
+                ("codeCPV", "4500"),
+                ("procedure", "Procédure inconnue"),
+                ("formePrix", "Forfaitaire"),
+            ]
+        )
+        marche[field] = value
+    if draw("date_incoherente"):
+        marche["dateNotification"], marche["datePublicationDonnees"] = (
+            marche["datePublicationDonnees"],
+            marche["dateNotification"],
+        )
+    if draw("publication_tardive"):
+        date_notification = datetime.date.fromisoformat(marche["dateNotification"])
+        marche["datePublicationDonnees"] = (
+            date_notification + datetime.timedelta(days=rng.randrange(63, 400))
+        ).isoformat()
+    if draw("montant_aberrant") and "montant" in marche:
+        marche["montant"] = rng.choice([0, 1, 12, 1e12])
+    if draw("valeur_extreme") and "montant" in marche:
+        marche["montant"] = round(marche["montant"] * 10000, 2)
+    if draw("incoherence_montant_duree") and "montant" in marche:
+        marche["dureeMois"] = marche["montant"]
+    if draw("caractere_non_supporte") and "objet" in marche:
+        marche["objet"] = marche["objet"].replace("e", "�", 1)
+    return marche
+
+
+def generate_marches(
+    num_rows: int,
+    sources: list,
+    defect_rates: dict,
+    seed: int = 0,
+    other_rate: float = 0.02,
+):
+    """Génère des marchés synthétiques un par un, sans les conserver en mémoire.
+
+    Args:
+        num_rows (int): Nombre de marchés
+        sources (list): Sources configurées, réparties uniformément
+        defect_rates (dict): Proportion de marchés présentant chaque défaut
+            (doublon, uid_non_unique, champ_manquant, valeur_invalide, date_incoherente,
+            publication_tardive, montant_aberrant, valeur_extreme, incoherence_montant_duree,
+            caractere_non_supporte)
+        seed (int, optional): Graine du générateur aléatoire. Defaults to 0.
+        other_rate (float, optional): Proportion de marchés d'une source non configurée,
+            et de contrats de concession. Defaults to 0.02.
+
+    Yields:
+        dict: Marchés
+    """
+    rng = random.Random(seed)
+    recent = list()
+    for line in range(num_rows):
+        marche = generate_marche(rng, line, sources)
+        if rng.random() < other_rate:
+            marche["source"] = AUTRE_SOURCE
+        if rng.random() < other_rate:
+            marche["_type"] = TYPE_CONCESSION
+        marche = add_defects(rng, marche, defect_rates, recent)
+        if len(recent) < NOMBRE_MARCHES_RECENTS:
+            recent.append(marche)
+        else:
+            recent[rng.randrange(NOMBRE_MARCHES_RECENTS)] = marche
+        yield marche
+
+
+def write_marches(marches, path: str):
+    """Ecrit des marchés dans un fichier au format de la donnée consolidée, au fil de leur génération.
+
+    Args:
+        marches (iterable): Marchés
+        path (str): Chemin vers le fichier JSON
+
+    Returns:
+        int: Nombre de marchés écrits
+    """
+    num_rows = 0
+    with open(path, "w", encoding="utf-8") as file_writer:
+        file_writer.write('{"marches": [')
+        for marche in marches:
+            if num_rows > 0:
+                file_writer.write(",")
+            file_writer.write("\n")
+            file_writer.write(json.dumps(marche, ensure_ascii=False))
+            num_rows += 1
+        file_writer.write("\n]}\n")
+    return num_rows
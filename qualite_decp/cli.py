@@ -7,7 +7,9 @@ import sys
 import streamlit.cli
 
 from qualite_decp import audit
+from qualite_decp import benchmark
 from qualite_decp import download
+from qualite_decp import pipeline
 
 
 def command_download(args=None):
@@ -17,7 +19,23 @@ def command_download(args=None):
 
 def command_audit(args=None):
     """Audite la donnée consolidée et stocke les résultats."""
-    audit.app.run(rows=args.rows)
+    audit.app.run(
+        rows=args.rows,
+        workers=args.workers,
+        incremental=args.incremental,
+        profile=args.profile,
+        cprofile=args.cprofile,
+    )
+
+
+def command_pipeline(args=None):
+    """Télécharge et audite la donnée consolidée en une seule étape, puis stocke les résultats."""
+    pipeline.run(rows=args.rows, workers=args.workers, incremental=args.incremental)
+
+
+def command_benchmark(args=None):
+    """Mesure les performances de l'audit sur des marchés synthétiques."""
+    benchmark.app.run(rows=args.rows, output=args.output)
 
 
 def command_web(args=None):
@@ -44,6 +62,64 @@ def get_parser():
         help="nombre de lignes desquelles auditer la qualité",
         type=int,
     )
+    audit.add_argument(
+        "--workers",
+        required=False,
+        help="nombre de processus auditant les sources en parallèle",
+        type=int,
+    )
+    audit.add_argument(
+        "--incremental",
+        action="store_true",
+        help="n'auditer que les marchés ajoutés, supprimés ou modifiés depuis l'exécution précédente",
+    )
+    audit.add_argument(
+        "--profile",
+        action="store_true",
+        help="mesurer chaque étape et stocker le rapport à côté des résultats (.profil.json)",
+    )
+    audit.add_argument(
+        "--cprofile",
+        action="store_true",
+        help="stocker le profil cProfile à côté des résultats (.prof)",
+    )
+    pipeline = subparser.add_parser(
+        "pipeline",
+        help="télécharger la donnée consolidée et auditer sa qualité au fil de la réception",
+    )
+    pipeline.add_argument(
+        "--rows",
+        required=False,
+        help="nombre de lignes desquelles auditer la qualité",
+        type=int,
+    )
+    pipeline.add_argument(
+        "--workers",
+        required=False,
+        help="nombre de processus auditant les sources en parallèle",
+        type=int,
+    )
+    pipeline.add_argument(
+        "--incremental",
+        action="store_true",
+        help="n'auditer que les marchés ajoutés, supprimés ou modifiés depuis l'exécution précédente",
+    )
+    benchmark = subparser.add_parser(
+        "benchmark",
+        help="mesurer les performances de l'audit sur des marchés synthétiques",
+    )
+    benchmark.add_argument(
+        "--rows",
+        required=False,
+        help="nombres de marchés synthétiques à générer",
+        type=int,
+        nargs="+",
+    )
+    benchmark.add_argument(
+        "--output",
+        required=False,
+        help="chemin vers le fichier JSON des mesures",
+    )
     web = subparser.add_parser(
         "web", help="lancer l'application web de présentation des résultats"
     )
@@ -62,5 +138,9 @@ def run(args=None):
         command_download(args)
     elif args.command == "audit":
         command_audit(args)
+    elif args.command == "pipeline":
+        command_pipeline(args)
+    elif args.command == "benchmark":
+        command_benchmark(args)
     elif args.command == "web":
         command_web(args)
@@ -1,52 +1,531 @@
 """ Ce module contient les fonctions nécessaires au téléchargement des données consolidées.
 """
 
+import codecs
+import concurrent.futures
+import hashlib
 import logging
 import json
+import mmap
+import os
+import re
+import time
 
 import requests
+import requests.adapters
 import pandas
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from qualite_decp import conf
 
 
 def run():
     """Télécharge la donnée consolidée (.json depuis data.gouv.fr)."""
-    logging.info("Téléchargement des données consolidées...")
-    download_data_from_url_to_file(
-        conf.download.url_donnees_consolidees,
-        conf.download.chemin_donnes_consolidees,
-        stream=True,
+    connections = conf.download.connexions_paralleles
+    # Le schéma est téléchargé en même temps que les données, sur la même session
+    with pooled_session(connections + 1) as session:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            logging.info("Téléchargement des données consolidées...")
+            data_download = executor.submit(
+                download_data_from_url_to_file,
+                conf.download.url_donnees_consolidees,
+                conf.download.chemin_donnes_consolidees,
+                stream=True,
+                session=session,
+                connections=connections,
+                range_size=conf.download.taille_plage,
+            )
+            logging.info("Téléchargement du schéma de données...")
+            schema_download = executor.submit(
+                download_data_from_url_to_file,
+                conf.download.url_schema_donnees,
+                conf.download.chemin_schema_donnees,
+                stream=False,
+                session=session,
+            )
+            schema_download.result()
+            data_download.result()
+    snapshot_path = conf.download.instantane_colonnes.chemin
+    if not snapshot_path:
+        return
+    # Import local : pyarrow n'est requis que si l'instantané colonnaire est activé
+    from qualite_decp import snapshot
+
+    if snapshot.is_up_to_date(conf.download.chemin_donnes_consolidees, snapshot_path):
+        logging.info("Instantané colonnaire %s déjà à jour", snapshot_path)
+    else:
+        logging.info("Conversion des données consolidées en instantané colonnaire...")
+        snapshot.write_snapshot(
+            conf.download.chemin_donnes_consolidees,
+            snapshot_path,
+            conf.download.instantane_colonnes.tables_filles,
+        )
+
+
+# Bornes de la taille des blocs lus lors d'un téléchargement streamé (en octets)
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+# Durée visée pour la lecture d'un bloc (en secondes), la taille des blocs s'adaptant au débit
+CHUNK_DURATION = 0.25
+
+
+def metadata_path(path: str):
+    """Construit le chemin du fichier de métadonnées d'un fichier téléchargé.
+
+    Args:
+        path (str): Chemin vers le fichier téléchargé
+
+    Returns:
+        str: Chemin vers le fichier de métadonnées (exemple : data/consolidated_data.json.meta.json)
+    """
+    return path + ".meta.json"
+
+
+def read_download_metadata(path: str):
+    """Charge les métadonnées d'un fichier téléchargé (URL, ETag, Last-Modified, taille, empreinte SHA-256).
+
+    Args:
+        path (str): Chemin vers le fichier téléchargé (ou vers son fichier .part)
+
+    Returns:
+        dict: Métadonnées, ou None si le fichier ou ses métadonnées sont absents ou illisibles
+    """
+    if not os.path.exists(path) or not os.path.exists(metadata_path(path)):
+        return None
+    try:
+        return open_json(metadata_path(path))
+    except ValueError:
+        return None
+
+
+def write_download_metadata(metadata: dict, path: str):
+    """Stocke les métadonnées d'un fichier téléchargé, de manière atomique.
+
+    Args:
+        metadata (dict): Métadonnées
+        path (str): Chemin vers le fichier téléchargé
+    """
+    temporary_path = metadata_path(path) + ".tmp"
+    save_json(metadata, temporary_path)
+    os.replace(temporary_path, metadata_path(path))
+
+
+def remove_files(*paths):
+    """Supprime des fichiers, s'ils existent."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def check_cancelled(cancel):
+    """Interrompt un téléchargement dont l'annulation a été demandée.
+
+    Args:
+        cancel (threading.Event): Drapeau d'annulation, ou None
+
+    Raises:
+        IOError: Si l'annulation a été demandée
+    """
+    if cancel is not None and cancel.is_set():
+        raise IOError("Téléchargement annulé")
+
+
+def file_sha256(path: str, chunk_consumer=None, cancel=None):
+    """Calcule l'empreinte SHA-256 d'un fichier local.
+
+    Args:
+        path (str): Chemin vers le fichier
+        chunk_consumer (callable, optional): Fonction recevant aussi chaque bloc lu (bytes). Defaults to None.
+        cancel (threading.Event, optional): Drapeau d'annulation, vérifié entre deux blocs. Defaults to None.
+
+    Raises:
+        IOError: Si l'annulation a été demandée
+
+    Returns:
+        hashlib._Hash: Empreinte, pouvant être complétée avec la suite du contenu
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file_reader:
+        for block in iter(lambda: file_reader.read(MAX_CHUNK_SIZE), b""):
+            check_cancelled(cancel)
+            digest.update(block)
+            if chunk_consumer is not None:
+                chunk_consumer(block)
+    return digest
+
+
+def write_response(
+    response: requests.Response,
+    file_writer,
+    digest,
+    stream: bool,
+    chunk_consumer=None,
+    cancel=None,
+):
+    """Ecrit le contenu d'une réponse HTTP dans un fichier en calculant son empreinte.
+
+    En mode streamé, la taille des blocs est ajustée au débit observé, entre
+    MIN_CHUNK_SIZE et MAX_CHUNK_SIZE.
+
+    Args:
+        response (requests.Response): Réponse HTTP
+        file_writer: Fichier ouvert en écriture binaire
+        digest: Empreinte à compléter (hashlib), ou None
+        stream (bool): Si la réponse est lue par blocs
+        chunk_consumer (callable, optional): Fonction recevant aussi chaque bloc reçu (bytes). Defaults to None.
+        cancel (threading.Event, optional): Drapeau d'annulation, vérifié entre deux blocs. Defaults to None.
+
+    Raises:
+        IOError: Si l'annulation a été demandée (les blocs déjà reçus restent écrits)
+
+    Returns:
+        int: Nombre d'octets écrits
+    """
+    if not stream:
+        file_writer.write(response.content)
+        if digest is not None:
+            digest.update(response.content)
+        if chunk_consumer is not None:
+            chunk_consumer(response.content)
+        return len(response.content)
+    num_bytes = 0
+    chunk_size = MIN_CHUNK_SIZE
+    while True:
+        check_cancelled(cancel)
+        started = time.monotonic()
+        chunk = response.raw.read(chunk_size, decode_content=True)
+        if not chunk:
+            return num_bytes
+        file_writer.write(chunk)
+        if digest is not None:
+            digest.update(chunk)
+        if chunk_consumer is not None:
+            chunk_consumer(chunk)
+        num_bytes += len(chunk)
+        elapsed = time.monotonic() - started
+        if elapsed < CHUNK_DURATION / 2:
+            chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+        elif elapsed > CHUNK_DURATION * 2:
+            chunk_size = max(chunk_size // 2, MIN_CHUNK_SIZE)
+
+
+def pooled_session(pool_size: int):
+    """Crée une session HTTP dont le pool de connexions permet des requêtes concurrentes.
+
+    Args:
+        pool_size (int): Nombre de connexions simultanées par hôte
+
+    Returns:
+        requests.Session: Session HTTP
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def parse_content_range(content_range: str):
+    """Analyse un en-tête Content-Range (exemple : "bytes 0-99/1000").
+
+    Args:
+        content_range (str): Valeur de l'en-tête
+
+    Returns:
+        int, int, int: Premier octet, dernier octet, et taille totale (None si inconnue)
+    """
+    match = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+|\*)", content_range.strip())
+    if match is None:
+        raise IOError(f"En-tête Content-Range invalide : {content_range}")
+    total = None if match.group(3) == "*" else int(match.group(3))
+    return int(match.group(1)), int(match.group(2)), total
+
+
+def download_range(
+    url: str,
+    part_path: str,
+    first: int,
+    last: int,
+    validator: str,
+    session,
+    auth=None,
+):
+    """Télécharge une plage d'octets d'un fichier dans un fichier local préalloué.
+
+    Args:
+        url (str): URL du fichier à télécharger
+        part_path (str): Chemin vers le fichier local, déjà alloué à la taille totale
+        first (int): Premier octet de la plage
+        last (int): Dernier octet de la plage (inclus)
+        validator (str): ETag ou Last-Modified de la première réponse, garantissant que
+            toutes les plages proviennent de la même version du fichier
+        session (requests.Session): Session HTTP
+        auth (optional): Authentification transmise à requests. Defaults to None.
+
+    Raises:
+        IOError: Si le serveur ne renvoie pas la plage demandée, ou si elle est incomplète
+    """
+    headers = {"Accept-Encoding": "identity", "Range": f"bytes={first}-{last}"}
+    if validator:
+        headers["If-Range"] = validator
+    response = session.get(
+        url, allow_redirects=True, verify=True, stream=True, auth=auth, headers=headers
     )
-    logging.info("Téléchargement du schéma de données...")
-    download_data_from_url_to_file(
-        conf.download.url_schema_donnees,
-        conf.download.chemin_schema_donnees,
-        stream=False,
+    with response:
+        response.raise_for_status()
+        if response.status_code != 206 or parse_content_range(
+            response.headers.get("Content-Range", "")
+        )[:2] != (first, last):
+            raise IOError(
+                f"Plage {first}-{last} non reçue pour {url} (fichier modifié pendant le téléchargement ?)"
+            )
+        with open(part_path, "r+b") as file_writer:
+            file_writer.seek(first)
+            num_bytes = write_response(response, file_writer, None, stream=True)
+    if num_bytes != last - first + 1:
+        raise IOError(
+            f"Plage {first}-{last} de {url} incomplète : {num_bytes} octets reçus"
+        )
+
+
+def download_remaining_ranges(
+    url: str,
+    part_path: str,
+    response: requests.Response,
+    validator: str,
+    session,
+    auth=None,
+    connections: int = 4,
+    range_size: int = 67108864,
+):
+    """Télécharge un fichier par plages d'octets concurrentes, à partir de la réponse à la première plage.
+
+    Le fichier local est préalloué à la taille totale, la première plage y est écrite depuis
+    la réponse reçue, puis les plages suivantes sont téléchargées par `connections` fils
+    d'exécution et écrites directement à leur position.
+
+    Args:
+        url (str): URL du fichier à télécharger
+        part_path (str): Chemin vers le fichier local
+        response (requests.Response): Réponse (206) à la requête de la première plage
+        validator (str): ETag ou Last-Modified de la réponse
+        session (requests.Session): Session HTTP, dont le pool accepte `connections` connexions
+        auth (optional): Authentification transmise à requests. Defaults to None.
+        connections (int, optional): Nombre de plages téléchargées simultanément. Defaults to 4.
+        range_size (int, optional): Taille des plages (en octets). Defaults to 67108864.
+
+    Returns:
+        int: Taille totale du fichier (en octets)
+    """
+    first, last, total = parse_content_range(response.headers["Content-Range"])
+    if first != 0 or total is None:
+        raise IOError(f"Première plage inattendue reçue pour {url}")
+    with open(part_path, "wb") as file_writer:
+        file_writer.truncate(total)
+        num_bytes = write_response(response, file_writer, None, stream=True)
+    if num_bytes != last + 1:
+        raise IOError(f"Plage 0-{last} de {url} incomplète : {num_bytes} octets reçus")
+    ranges = [
+        (start, min(start + range_size, total) - 1)
+        for start in range(last + 1, total, range_size)
+    ]
+    logging.info(
+        "Téléchargement de %d octets en %d plages sur %d connexions",
+        total,
+        len(ranges) + 1,
+        connections,
     )
+    with concurrent.futures.ThreadPoolExecutor(max_workers=connections) as executor:
+        futures = [
+            executor.submit(
+                download_range, url, part_path, start, end, validator, session, auth
+            )
+            for start, end in ranges
+        ]
+        for future in futures:
+            future.result()
+    return total
 
 
-def download_data_from_url_to_file(url: str, path: str, stream: bool = True, auth=None):
+def download_data_from_url_to_file(
+    url: str,
+    path: str,
+    stream: bool = True,
+    auth=None,
+    session=None,
+    connections: int = 1,
+    range_size: int = 67108864,
+    chunk_consumer=None,
+    cancel=None,
+):
     """Télécharge un fichier de données depuis une URL.
 
+    Le téléchargement est conditionnel : si le fichier local a été téléchargé depuis la même URL,
+    les en-têtes ETag et Last-Modified reçus alors sont renvoyés, et un fichier inchangé n'est
+    pas téléchargé à nouveau. La donnée est écrite dans un fichier .part, renommé une fois
+    le téléchargement complet et vérifié. Un téléchargement interrompu reprend là où il s'était
+    arrêté (en-tête Range) si le serveur le permet. L'empreinte SHA-256 et les en-têtes de
+    la réponse sont conservés dans un fichier de métadonnées (voir read_download_metadata).
+
+    Avec plusieurs connexions, le fichier est téléchargé par plages d'octets concurrentes
+    (voir download_remaining_ranges). Si le serveur ne gère pas les plages, le fichier est
+    téléchargé en un seul flux.
+
+    Le contenu peut être transmis, en plus de son écriture sur disque, à une fonction
+    (chunk_consumer) recevant les blocs dans l'ordre du fichier. Les plages concurrentes ne
+    sont alors pas utilisées. Rien n'est transmis si le fichier n'a pas changé.
+
+    Un téléchargement en un seul flux peut être annulé depuis un autre fil d'exécution (cancel) :
+    il s'interrompt au bloc suivant, en conservant le fichier .part pour une reprise ultérieure.
+
     Args:
         url (str): URL du fichier à télécharger
         path (str): Chemin vers un fichier local
         stream (bool, optional): Si la donnée doit être streamée (recommandé pour les fichiers volumineux). Defaults to True.
+        auth (optional): Authentification transmise à requests. Defaults to None.
+        session (requests.Session, optional): Session HTTP à utiliser. Defaults to None (requests,
+            ou une session dédiée avec plusieurs connexions).
+        connections (int, optional): Nombre de plages téléchargées simultanément. Defaults to 1.
+        range_size (int, optional): Taille des plages (en octets). Defaults to 67108864.
+        chunk_consumer (callable, optional): Fonction recevant le contenu du fichier, bloc par bloc (bytes).
+            Defaults to None.
+        cancel (threading.Event, optional): Drapeau d'annulation, vérifié entre deux blocs. Defaults to None.
+
+    Raises:
+        requests.HTTPError: Si le serveur répond par une erreur
+        IOError: Si la taille de la donnée reçue ne correspond pas à celle annoncée, ou si
+            le téléchargement a été annulé
+
+    Returns:
+        bool: True si le fichier a été téléchargé, False s'il n'a pas changé depuis le dernier téléchargement
     """
-    response = requests.get(url, allow_redirects=True, verify=True, stream=stream, auth=auth)
-    with open(path, "wb") as file_writer:
-        if stream:
-            for counter, chunk in enumerate(response.iter_content(chunk_size=4096)):
-                file_writer.write(chunk)
-                # print(".", end="", flush=True)
+    ranged = stream and connections > 1 and chunk_consumer is None
+    if session is None and ranged:
+        with pooled_session(connections) as session:
+            return download_data_from_url_to_file(
+                url, path, stream, auth, session, connections, range_size
+            )
+    if session is None:
+        session = requests
+    part_path = path + ".part"
+    # La donnée est demandée telle quelle, afin que les positions (Range) et tailles soient celles du fichier
+    headers = {"Accept-Encoding": "identity"}
+    metadata = read_download_metadata(path)
+    if metadata is not None and metadata.get("url") == url:
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+    part_metadata = read_download_metadata(part_path)
+    resume_from = 0
+    if stream and part_metadata is not None and part_metadata.get("url") == url:
+        validator = part_metadata.get("etag") or part_metadata.get("last_modified")
+        if validator:
+            resume_from = os.path.getsize(part_path)
+            headers["Range"] = f"bytes={resume_from}-"
+            headers["If-Range"] = validator
+            ranged = False
+    if ranged:
+        headers["Range"] = f"bytes=0-{range_size - 1}"
+
+    response = session.get(
+        url,
+        allow_redirects=True,
+        verify=True,
+        stream=stream,
+        auth=auth,
+        headers=headers,
+    )
+    with response:
+        if response.status_code == 304:
+            logging.info("%s inchangé depuis le dernier téléchargement", path)
+            remove_files(part_path, metadata_path(part_path))
+            return False
+        response.raise_for_status()
+        new_metadata = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+        if ranged and response.status_code == 206:
+            # Le fichier .part préalloué ne peut pas être repris : ses métadonnées ne sont pas écrites
+            remove_files(metadata_path(part_path))
+            num_bytes = download_remaining_ranges(
+                url,
+                part_path,
+                response,
+                new_metadata["etag"] or new_metadata["last_modified"],
+                session,
+                auth,
+                connections,
+                range_size,
+            )
+            digest = file_sha256(part_path)
         else:
-            file_writer.write(response.content)
+            if response.status_code == 206 and response.headers.get(
+                "Content-Range", ""
+            ).startswith(f"bytes {resume_from}-"):
+                logging.info(
+                    "Reprise du téléchargement de %s à l'octet %d", url, resume_from
+                )
+                # Le début du fichier, déjà reçu, est transmis avant la suite
+                digest = file_sha256(part_path, chunk_consumer, cancel)
+                mode = "ab"
+            elif response.status_code == 206:
+                raise IOError(
+                    f"Plage inattendue reçue pour {url} : {response.headers.get('Content-Range')}"
+                )
+            else:
+                if ranged:
+                    logging.info(
+                        "Plages d'octets non gérées par le serveur, téléchargement en un seul flux"
+                    )
+                resume_from = 0
+                digest = hashlib.sha256()
+                mode = "wb"
+            # Les métadonnées du fichier .part permettent de reprendre un téléchargement interrompu
+            write_download_metadata(new_metadata, part_path)
+            with open(part_path, mode) as file_writer:
+                num_bytes = write_response(
+                    response, file_writer, digest, stream, chunk_consumer, cancel
+                )
+                file_writer.flush()
+                os.fsync(file_writer.fileno())
+            expected_bytes = response.headers.get("Content-Length")
+            if expected_bytes is not None and num_bytes != int(expected_bytes):
+                raise IOError(
+                    f"Téléchargement de {url} incomplet : {num_bytes} octets reçus sur {expected_bytes}"
+                )
+            num_bytes += resume_from
+
+    new_metadata["taille"] = num_bytes
+    new_metadata["sha256"] = digest.hexdigest()
+    os.replace(part_path, path)
+    write_download_metadata(new_metadata, path)
+    remove_files(metadata_path(part_path))
+    logging.info(
+        "%s téléchargé (%d octets, sha256 %s)",
+        path,
+        new_metadata["taille"],
+        new_metadata["sha256"],
+    )
+    return True
 
 
 def open_json(path: str):
     """Charge un fichier JSON sous forme de dictionnaire
 
+    Le fichier est projeté en mémoire (mmap) et décodé par fenêtres successives, sans copie
+    intégrale de son contenu (ni en octets, ni en chaîne de caractères) : le pic de mémoire
+    se limite aux données chargées. Si l'analyseur orjson est configuré (et installé), il lit
+    directement la projection : plus rapide, mais au prix d'un pic de mémoire plus élevé.
+
     Args:
         path (str): CHemin vers un fichier JSON (utf8)
 
@@ -54,7 +533,294 @@ def open_json(path: str):
         dict: Données du fichier
     """
     with open(path, "rb") as file_reader:
-        return json.loads(file_reader.read().decode("utf-8"))
+        if os.fstat(file_reader.fileno()).st_size == 0:
+            return json.loads(b"")
+        with mmap.mmap(file_reader.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if conf.download.analyseur_json == "orjson" and orjson is not None:
+                with memoryview(mapped) as buffer:
+                    try:
+                        return orjson.loads(buffer)
+                    except orjson.JSONDecodeError:
+                        # orjson refuse certains documents acceptés par json
+                        # (entiers de plus de 64 bits, NaN...)
+                        pass
+            reader = JsonChunksReader(iter_text_chunks(mapped), share_keys=True)
+            return reader.decode_document()
+
+
+def iter_text_chunks(buffer, chunk_size: int = 1048576):
+    """Décode par fenêtres successives un contenu texte (utf8) binaire.
+
+    Args:
+        buffer: Contenu binaire (bytes, mmap...)
+        chunk_size (int, optional): Nombre d'octets décodés à chaque fenêtre, multiple de
+            mmap.PAGESIZE. Defaults to 1048576.
+
+    Yields:
+        str: Morceaux successifs du texte
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    # Les pages d'une projection déjà décodées sont libérées (Linux), chunk_size étant
+    # un multiple de la taille des pages
+    release = (
+        getattr(buffer, "madvise", None) if hasattr(mmap, "MADV_DONTNEED") else None
+    )
+    for start in range(0, len(buffer), chunk_size):
+        text = decoder.decode(buffer[start : start + chunk_size])
+        if release is not None:
+            release(mmap.MADV_DONTNEED, start, min(chunk_size, len(buffer) - start))
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+def iter_json_array(path: str, key: str, chunk_size: int = 1048576):
+    """Parcourt de manière incrémentale les éléments d'une liste JSON, sans charger le fichier entier.
+
+    Le fichier doit contenir un objet à la racine, dont la clé `key` est une liste.
+    Seul un bloc de `chunk_size` caractères (et l'élément en cours) est conservé en mémoire.
+
+    Args:
+        path (str): Chemin vers un fichier JSON (utf8)
+        key (str): Clé de la racine contenant la liste à parcourir (exemple : "marches")
+        chunk_size (int, optional): Nombre de caractères lus à chaque lecture. Defaults to 1048576.
+
+    Raises:
+        ValueError: Si le fichier ne respecte pas la structure attendue
+
+    Yields:
+        dict: Eléments de la liste, un par un
+    """
+    with open(path, "r", encoding="utf-8") as file_reader:
+        yield from iter_json_array_from_text_chunks(
+            iter(lambda: file_reader.read(chunk_size), ""), key
+        )
+
+
+def iter_json_array_from_text_chunks(chunks, key: str):
+    """Parcourt de manière incrémentale les éléments d'une liste JSON reçue par morceaux.
+
+    Args:
+        chunks (iterable): Morceaux successifs (str) du document JSON
+        key (str): Clé de la racine contenant la liste à parcourir
+
+    Raises:
+        ValueError: Si le document ne respecte pas la structure attendue
+
+    Yields:
+        dict: Eléments de la liste, un par un
+    """
+    reader = JsonChunksReader(chunks)
+    for current_key in reader.iter_object_keys():
+        if current_key != key:
+            reader.decode_value()
+        else:
+            yield from reader.iter_array()
+            return
+    raise ValueError(f"Clé '{key}' introuvable à la racine du JSON")
+
+
+# Caractères pouvant composer un nombre JSON
+NUMBER_CHARACTERS = frozenset("0123456789+-.eE")
+
+
+class JsonChunksReader:
+    def __init__(self, chunks, share_keys: bool = False):
+        """Prépare la lecture d'un document JSON reçu par morceaux.
+
+        Seul le morceau en cours (et la valeur en cours de lecture) est conservé en mémoire.
+
+        Args:
+            chunks (iterable): Morceaux successifs (str) du document JSON
+            share_keys (bool, optional): Si les clés identiques des objets décodés doivent partager
+                une même chaîne, comme lors d'un décodage du document en une fois (json ne les
+                partage qu'au sein d'une même valeur). Plus lent, mais plus économe pour un document
+                conservé entier. Defaults to False.
+        """
+        if share_keys:
+            keys = dict()
+            self.decoder = json.JSONDecoder(
+                object_pairs_hook=lambda pairs: {
+                    keys.setdefault(key, key): value for key, value in pairs
+                }
+            )
+        else:
+            self.decoder = json.JSONDecoder()
+        self.whitespace = re.compile(r"[ \t\n\r]*")
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.position = 0
+        self.exhausted = False
+
+    def fill(self):
+        """Ajoute un morceau au tampon en abandonnant la partie déjà consommée.
+
+        Returns:
+            bool: False si tous les morceaux ont été reçus
+        """
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.exhausted = True
+            return False
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        return True
+
+    def next_char(self):
+        """Renvoie le prochain caractère significatif, sans le consommer.
+
+        Returns:
+            str: Caractère, ou None en fin de document
+        """
+        while True:
+            self.position = self.whitespace.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return None
+
+    def expect(self, char: str):
+        """Consomme le prochain caractère significatif, qui doit être `char`.
+
+        Args:
+            char (str): Caractère attendu
+
+        Raises:
+            ValueError: Si le caractère trouvé est différent
+        """
+        found = self.next_char()
+        if found != char:
+            raise ValueError(f"JSON inattendu : '{char}' attendu, '{found}' trouvé")
+        self.position += 1
+
+    def decode_value(self):
+        """Décode la prochaine valeur JSON en entier.
+
+        Une valeur n'est acceptée que si elle est suivie d'au moins un caractère, et, pour un
+        nombre, d'un caractère ne pouvant pas le prolonger, afin de ne pas tronquer un nombre
+        coupé en fin de tampon (exemple : "1." ou "1.5e").
+
+        Returns:
+            Valeur décodée
+        """
+        is_number = self.next_char() in NUMBER_CHARACTERS
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                if self.exhausted or (
+                    end < len(self.buffer)
+                    and not (is_number and self.buffer[end] in NUMBER_CHARACTERS)
+                ):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.exhausted:
+                    raise
+            if not self.fill():
+                value, self.position = self.decoder.raw_decode(
+                    self.buffer, self.position
+                )
+                return value
+
+    def iter_object_keys(self):
+        """Parcourt les clés d'un objet JSON.
+
+        La valeur associée à chaque clé doit être consommée avant de passer à la clé suivante.
+
+        Yields:
+            str: Clés de l'objet
+        """
+        self.expect("{")
+        if self.next_char() == "}":
+            self.position += 1
+            return
+        while True:
+            if self.next_char() != '"':
+                raise ValueError(
+                    f"JSON inattendu : clé attendue, '{self.next_char()}' trouvé"
+                )
+            key = self.decode_value()
+            self.expect(":")
+            yield key
+            separator = self.next_char()
+            self.position += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(
+                    f"JSON inattendu : ',' ou '}}' attendu, '{separator}' trouvé"
+                )
+
+    def iter_array(self, decode_item=None):
+        """Parcourt les éléments d'une liste JSON.
+
+        Args:
+            decode_item (callable, optional): Fonction décodant un élément. Defaults to None (decode_value).
+
+        Raises:
+            ValueError: Si la liste est mal formée
+
+        Yields:
+            Eléments de la liste, un par un
+        """
+        if decode_item is None:
+            decode_item = self.decode_value
+        self.expect("[")
+        if self.next_char() == "]":
+            self.position += 1
+            return
+        while True:
+            yield decode_item()
+            separator = self.next_char()
+            self.position += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(
+                    f"JSON inattendu : ',' ou ']' attendu, '{separator}' trouvé"
+                )
+
+    def decode_nested(self, depth: int):
+        """Décode la prochaine valeur, en parcourant élément par élément ses `depth` premiers niveaux.
+
+        Args:
+            depth (int): Nombre de niveaux (objets ou listes) parcourus élément par élément
+
+        Returns:
+            Valeur décodée
+        """
+        char = self.next_char()
+        if depth == 0 or char not in ("{", "["):
+            return self.decode_value()
+        if char == "[":
+            return list(self.iter_array(lambda: self.decode_nested(depth - 1)))
+        value = dict()
+        for key in self.iter_object_keys():
+            value[key] = self.decode_nested(depth - 1)
+        return value
+
+    def decode_document(self, depth: int = 2):
+        """Décode le document entier.
+
+        Les premiers niveaux (par exemple la liste des marchés, puis chaque marché) sont
+        parcourus élément par élément, de sorte qu'un seul élément à la fois est présent
+        dans le tampon en plus du morceau en cours.
+
+        Args:
+            depth (int, optional): Nombre de niveaux parcourus élément par élément. Defaults to 2.
+
+        Raises:
+            ValueError: Si le document est mal formé ou suivi d'autres données
+
+        Returns:
+            Document décodé
+        """
+        value = self.decode_nested(depth)
+        if self.next_char() is not None:
+            raise ValueError("JSON inattendu : données après la fin du document")
+        return value
 
 
 def save_json(data: dict, path: str):
@@ -69,18 +835,84 @@ def save_json(data: dict, path: str):
 
 
 def json_dict_to_dataframe(
-    data: dict, record_path: str = None, index_column: str = None
+    data: dict, record_path: str = None, index_column: str = None, columns: list = None
 ):
     """Convertit de la donnée JSON semi-structurée vers un DataFrame.
 
     Args:
         data (dict): Donnée issue d'un JSON
         record_path (str): Chemin vers la liste d'entrées
+        index_column (str, optional): Colonne servant d'index. Defaults to None.
+        columns (list, optional): Colonnes à extraire (notation pointée), voir records_to_dataframe.
+            Defaults to None (aplatissement complet par pandas.json_normalize).
 
     Returns:
         pandas.DataFrame: Donnée aplatie dans un DataFrame.
     """
+    if columns is not None:
+        records = data[record_path] if record_path is not None else data
+        return records_to_dataframe(records, columns, index_column)
     dataframe = pandas.json_normalize(data, record_path=record_path)
     if index_column is not None:
         dataframe = dataframe.set_index(index_column)
     return dataframe
+
+
+def get_field(record: dict, path: list):
+    """Lit un champ, éventuellement imbriqué, d'une entrée JSON.
+
+    Args:
+        record (dict): Entrée JSON
+        path (list): Clés successives menant au champ (exemple : ["acheteur", "id"])
+
+    Returns:
+        Valeur du champ, None s'il est absent ou s'il s'agit d'un objet (qui serait aplati en
+            plusieurs colonnes). Les listes sont renvoyées telles quelles, sans être parcourues.
+    """
+    value = record
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    if isinstance(value, dict):
+        return None
+    return value
+
+
+def records_to_dataframe(records: list, columns: list, index_column: str = None):
+    """Construit un DataFrame contenant seulement certaines colonnes d'entrées JSON.
+
+    Contrairement à pandas.json_normalize, les entrées ne sont ni copiées ni aplaties en entier :
+    seuls les champs demandés sont lus, en un seul parcours, et chaque colonne est construite
+    directement (son type est déduit de ses valeurs, comme pour pandas.json_normalize).
+
+    Args:
+        records (list): Entrées JSON
+        columns (list): Colonnes à extraire (notation pointée pour les champs imbriqués)
+        index_column (str, optional): Champ de premier niveau servant d'index. Defaults to None.
+
+    Returns:
+        pandas.DataFrame: Colonnes extraites (None si le champ est absent)
+    """
+    columns = [column for column in columns if column != index_column]
+    # Les champs de premier niveau, les plus nombreux, sont lus sans parcours de chemin
+    top_level = [column for column in columns if "." not in column]
+    nested = [(column, column.split(".")) for column in columns if "." in column]
+    values = {column: list() for column in columns}
+    index = list()
+    for record in records:
+        for column in top_level:
+            value = record.get(column)
+            values[column].append(None if isinstance(value, dict) else value)
+        for column, path in nested:
+            values[column].append(get_field(record, path))
+        if index_column is not None:
+            index.append(record.get(index_column))
+    if index_column is None:
+        index = pandas.RangeIndex(len(records))
+    else:
+        index = pandas.Index(index, name=index_column)
+    return pandas.DataFrame(
+        {column: pandas.Series(values[column], index=index) for column in columns},
+        index=index,
+    )
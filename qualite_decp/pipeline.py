@@ -0,0 +1,158 @@
+""" Ce module enchaîne le téléchargement et l'audit de la donnée consolidée.
+
+Le flux HTTP est écrit sur disque et, en même temps, analysé de manière incrémentale :
+les marchés sont répartis par source au fur et à mesure de leur réception, pendant que
+le téléchargement se poursuit dans un fil d'exécution dédié. Les étapes ne dépendant que
+du marché (validation par rapport au schéma, empreintes) sont exécutées par lots en
+arrière-plan dès la réception, seuls les agrégats par source étant calculés en fin de flux.
+"""
+
+import codecs
+import concurrent.futures
+import logging
+import queue
+import threading
+
+from qualite_decp import conf
+from qualite_decp import download
+from qualite_decp.audit import app
+
+# Marqueur de fin de flux
+END_OF_STREAM = object()
+
+
+class DownloadStream:
+    def __init__(self, url: str, path: str, queue_size: int = 16):
+        """Lance le téléchargement d'un fichier texte (utf8), dont le contenu est lu au fil de sa réception.
+
+        Le fichier est téléchargé dans un fil d'exécution dédié (voir download.download_data_from_url_to_file),
+        les blocs reçus transitant par une file de taille bornée. Si le fichier n'a pas changé depuis
+        le dernier téléchargement, le fichier local est lu à la place. Le téléchargement doit être
+        fermé (close) une fois le contenu lu, ou abandonné.
+
+        Args:
+            url (str): URL du fichier à télécharger
+            path (str): Chemin vers un fichier local
+            queue_size (int, optional): Nombre maximal de blocs reçus en attente d'analyse. Defaults to 16.
+        """
+        self.path = path
+        self.chunks = queue.Queue(maxsize=queue_size)
+        self.cancel = threading.Event()
+        self.finished = False
+        self.outcome = dict()
+        self.thread = threading.Thread(
+            target=self.download_file, args=(url,), daemon=True
+        )
+        self.thread.start()
+
+    def consume(self, chunk: bytes):
+        """Transmet un bloc reçu, sauf si le téléchargement a été annulé.
+
+        Args:
+            chunk (bytes): Bloc reçu
+        """
+        if not self.cancel.is_set():
+            self.chunks.put(chunk)
+
+    def download_file(self, url: str):
+        """Télécharge le fichier (fil d'exécution dédié).
+
+        Args:
+            url (str): URL du fichier à télécharger
+        """
+        try:
+            self.outcome["modified"] = download.download_data_from_url_to_file(
+                url,
+                self.path,
+                stream=True,
+                chunk_consumer=self.consume,
+                cancel=self.cancel,
+            )
+        except BaseException as error:
+            self.outcome["error"] = error
+        finally:
+            self.chunks.put(END_OF_STREAM)
+
+    def iter_text(self):
+        """Parcourt le contenu du fichier au fil de sa réception.
+
+        Raises:
+            Exception: Erreur survenue pendant le téléchargement
+
+        Yields:
+            str: Morceaux successifs du contenu du fichier
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        while not self.finished:
+            chunk = self.chunks.get()
+            if chunk is END_OF_STREAM:
+                self.finished = True
+                break
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        self.thread.join()
+        if "error" in self.outcome:
+            raise self.outcome["error"]
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+        if not self.outcome["modified"]:
+            with open(self.path, "r", encoding="utf-8") as file_reader:
+                yield from iter(lambda: file_reader.read(1048576), "")
+
+    def close(self):
+        """Annule le téléchargement s'il est en cours, et attend la fin de son fil d'exécution.
+
+        Le téléchargement s'interrompt au bloc suivant, en conservant le fichier .part
+        pour une reprise ultérieure.
+        """
+        self.cancel.set()
+        # Les blocs en attente sont abandonnés, afin de débloquer le fil d'exécution
+        while not self.finished:
+            self.finished = self.chunks.get() is END_OF_STREAM
+        self.thread.join()
+
+
+def run(rows: int = None, workers: int = None, incremental: bool = False):
+    """Télécharge et audite la donnée consolidée en une seule étape, puis stocke les résultats.
+
+    Args:
+        rows (int, optional): Nombre de lignes desquelles auditer la qualité. Defaults to None.
+        workers (int, optional): Nombre de processus auditant les sources en parallèle. Defaults to None.
+        incremental (bool, optional): Si seuls les marchés ajoutés, supprimés ou modifiés depuis
+            l'exécution précédente doivent être audités. Defaults to False.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        logging.info("Téléchargement du schéma de données...")
+        schema_download = executor.submit(
+            download.download_data_from_url_to_file,
+            conf.download.url_schema_donnees,
+            conf.download.chemin_schema_donnees,
+            stream=False,
+        )
+        logging.info("Téléchargement et audit des données consolidées...")
+        data_stream = DownloadStream(
+            conf.download.url_donnees_consolidees,
+            conf.download.chemin_donnes_consolidees,
+        )
+        try:
+            schema_download.result()
+            schema = download.open_json(conf.download.chemin_schema_donnees)
+            marches = download.iter_json_array_from_text_chunks(
+                data_stream.iter_text(), "marches"
+            )
+            # L'instantané colonnaire ne correspond pas aux marchés en cours de réception.
+            # La validation et les empreintes de chaque marché sont calculées dès sa réception.
+            results = app.audit_marches(
+                marches,
+                schema,
+                rows=rows,
+                workers=workers,
+                incremental=incremental,
+                use_snapshot=False,
+                audit_while_reading=True,
+            )
+        finally:
+            data_stream.close()
+    results.to_json(conf.audit.chemin_resultats)
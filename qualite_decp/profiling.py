@@ -0,0 +1,308 @@
+""" Ce module mesure la durée, le temps CPU et la mémoire des étapes d'un traitement.
+
+Les étapes sont délimitées par des intervalles (span), imbriquables, sans effet tant que le
+profilage n'a pas été démarré (voir start). Les intervalles mesurés dans un processus enfant
+sont rapatriés avec son résultat (voir call_with_spans et add_spans).
+"""
+
+import collections
+import contextlib
+import datetime
+import os
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Profilage en cours, None s'il n'est pas démarré
+current = None
+
+
+def get_rss():
+    """Renvoie la mémoire résidente actuelle et maximale du processus (Linux).
+
+    Returns:
+        int, int: Mémoire résidente actuelle et maximale (octets), None si indisponibles
+    """
+    try:
+        with open("/proc/self/status", encoding="utf-8") as file_reader:
+            status = dict(line.split(":", 1) for line in file_reader if ":" in line)
+        return (
+            int(status["VmRSS"].split()[0]) * 1024,
+            int(status["VmHWM"].split()[0]) * 1024,
+        )
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def reset_peak_rss():
+    """Réinitialise la mémoire résidente maximale du processus (Linux 4.0 et ultérieurs).
+
+    Returns:
+        bool: True si la réinitialisation a eu lieu
+    """
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as file_writer:
+            file_writer.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_cpu_time():
+    """Renvoie le temps CPU consommé par le processus et ses processus enfants terminés.
+
+    Returns:
+        float: Temps CPU (secondes)
+    """
+    cpu_time = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_time += children.ru_utime + children.ru_stime
+    return cpu_time
+
+
+def to_mb(num_bytes):
+    """Convertit un nombre d'octets en mégaoctets (arrondi), None restant None."""
+    return None if num_bytes is None else round(num_bytes / 2 ** 20, 1)
+
+
+class Profiler:
+    def __init__(self, trace_memory: bool = True):
+        """Démarre la collecte des intervalles.
+
+        Args:
+            trace_memory (bool, optional): Si la mémoire allouée par Python doit être suivie
+                (tracemalloc, qui ralentit le traitement). Defaults to True.
+        """
+        self.trace_memory = trace_memory
+        self.started = time.time()
+        self.spans = list()
+        self.stack = list()
+        self.can_reset_rss = reset_peak_rss()
+        if trace_memory:
+            tracemalloc.start()
+
+    def record_peaks(self):
+        """Reporte les pics de mémoire observés depuis la dernière réinitialisation sur les intervalles ouverts, puis réinitialise les pics.
+
+        Les pics n'étant mesurables que pour l'ensemble du processus, ils sont réinitialisés à
+        chaque ouverture ou fermeture d'intervalle, et chaque intervalle ouvert conserve le
+        maximum observé. Sans réinitialisation possible (tracemalloc avant Python 3.9),
+        le pic mesuré est celui depuis le début du profilage.
+        """
+        python_peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+        _, rss_peak = get_rss()
+        for span in self.stack:
+            if python_peak is not None:
+                span["python_peak"] = max(span["python_peak"] or 0, python_peak)
+            if rss_peak is not None:
+                span["rss_peak"] = max(span["rss_peak"] or 0, rss_peak)
+        if self.trace_memory and hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        if self.can_reset_rss:
+            reset_peak_rss()
+
+    @contextlib.contextmanager
+    def span(self, name: str, records: int = None, source: str = None):
+        """Mesure un intervalle.
+
+        Args:
+            name (str): Nom de l'étape
+            records (int, optional): Nombre d'enregistrements traités. Defaults to None.
+            source (str, optional): Source concernée. Defaults to None (source de l'intervalle englobant).
+
+        Yields:
+            dict: Intervalle en cours, dont le nombre d'enregistrements ("records") peut être
+                renseigné avant sa fin
+        """
+        if source is None and len(self.stack) > 0:
+            source = self.stack[-1]["source"]
+        self.record_peaks()
+        span = {
+            "name": name,
+            "source": source,
+            "records": records,
+            "python_start": tracemalloc.get_traced_memory()[0]
+            if self.trace_memory
+            else None,
+            "rss_start": get_rss()[0],
+            "python_peak": None,
+            "rss_peak": None,
+            "start": time.time(),
+            "cpu_start": get_cpu_time(),
+            "wall_start": time.perf_counter(),
+        }
+        self.stack.append(span)
+        try:
+            yield span
+        finally:
+            records = span["records"]
+            wall_time = time.perf_counter() - span["wall_start"]
+            cpu_time = get_cpu_time() - span["cpu_start"]
+            self.record_peaks()
+            self.stack.pop()
+            self.spans.append(
+                {
+                    "etape": name,
+                    "source": source,
+                    "profondeur": len(self.stack),
+                    "processus": os.getpid(),
+                    "debut_s": round(span["start"] - self.started, 4),
+                    "duree_s": round(wall_time, 4),
+                    "duree_cpu_s": round(cpu_time, 4),
+                    "enregistrements": records,
+                    "enregistrements_par_s": round(records / wall_time, 1)
+                    if records is not None and wall_time > 0
+                    else None,
+                    "memoire_python_max_mo": to_mb(
+                        None
+                        if span["python_peak"] is None
+                        else span["python_peak"] - span["python_start"]
+                    ),
+                    "memoire_residente_max_mo": to_mb(
+                        None
+                        if span["rss_peak"] is None or span["rss_start"] is None
+                        else max(span["rss_peak"] - span["rss_start"], 0)
+                    ),
+                }
+            )
+
+    def stop(self):
+        """Arrête la collecte.
+
+        Returns:
+            list: Intervalles mesurés, dans l'ordre de leur fin
+        """
+        if self.trace_memory:
+            tracemalloc.stop()
+        return self.spans
+
+
+def start(trace_memory: bool = True):
+    """Démarre le profilage dans le processus courant.
+
+    Args:
+        trace_memory (bool, optional): Si la mémoire allouée par Python doit être suivie. Defaults to True.
+    """
+    global current
+    current = Profiler(trace_memory)
+
+
+def stop():
+    """Arrête le profilage dans le processus courant.
+
+    Returns:
+        list: Intervalles mesurés (vide si le profilage n'était pas démarré)
+    """
+    global current
+    if current is None:
+        return list()
+    spans = current.stop()
+    current = None
+    return spans
+
+
+def is_enabled():
+    """Indique si le profilage est démarré dans le processus courant."""
+    return current is not None
+
+
+@contextlib.contextmanager
+def span(name: str, records: int = None, source: str = None):
+    """Mesure un intervalle si le profilage est démarré (voir Profiler.span)."""
+    if current is None:
+        yield {"records": records}
+    else:
+        with current.span(name, records, source) as measured_span:
+            yield measured_span
+
+
+def call_with_spans(trace_memory: bool, function, *args):
+    """Appelle une fonction en profilant ses étapes, typiquement dans un processus enfant.
+
+    Args:
+        trace_memory (bool): Si la mémoire allouée par Python doit être suivie
+        function (callable): Fonction à appeler
+
+    Returns:
+        object, list, float: Résultat de la fonction, intervalles mesurés, et instant de début du profilage
+    """
+    start(trace_memory)
+    started = current.started
+    try:
+        result = function(*args)
+    finally:
+        spans = stop()
+    return result, spans, started
+
+
+def add_spans(spans: list, started: float):
+    """Ajoute au profilage en cours des intervalles mesurés dans un autre processus.
+
+    Args:
+        spans (list): Intervalles mesurés
+        started (float): Instant de début du profilage dans l'autre processus
+    """
+    if current is None:
+        return
+    depth = len(current.stack)
+    offset = started - current.started
+    for other_span in spans:
+        other_span = dict(other_span)
+        other_span["debut_s"] = round(other_span["debut_s"] + offset, 4)
+        other_span["profondeur"] += depth
+        if other_span["source"] is None and depth > 0:
+            other_span["source"] = current.stack[-1]["source"]
+        current.spans.append(other_span)
+
+
+def summarize(spans: list):
+    """Agrège les intervalles par étape.
+
+    Args:
+        spans (list): Intervalles mesurés
+
+    Returns:
+        list: Durée, temps CPU et nombre d'enregistrements cumulés par étape, par durée décroissante
+    """
+    totals = collections.OrderedDict()
+    for measured_span in spans:
+        total = totals.setdefault(
+            measured_span["etape"],
+            {
+                "etape": measured_span["etape"],
+                "occurrences": 0,
+                "duree_s": 0,
+                "duree_cpu_s": 0,
+                "enregistrements": 0,
+            },
+        )
+        total["occurrences"] += 1
+        total["duree_s"] += measured_span["duree_s"]
+        total["duree_cpu_s"] += measured_span["duree_cpu_s"]
+        total["enregistrements"] += measured_span["enregistrements"] or 0
+    for total in totals.values():
+        total["duree_s"] = round(total["duree_s"], 4)
+        total["duree_cpu_s"] = round(total["duree_cpu_s"], 4)
+    return sorted(totals.values(), key=lambda total: total["duree_s"], reverse=True)
+
+
+def build_report(spans: list):
+    """Construit le rapport de profilage.
+
+    Args:
+        spans (list): Intervalles mesurés
+
+    Returns:
+        dict: Rapport (contexte d'exécution, intervalles, et synthèse par étape)
+    """
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "processeurs": os.cpu_count(),
+        "synthese": summarize(spans),
+        "etapes": sorted(spans, key=lambda measured_span: measured_span["debut_s"]),
+    }
@@ -0,0 +1,289 @@
+""" Ce module contient la conversion de la donnée consolidée en instantané colonnaire (Parquet).
+
+Les marchés sont aplatis (notation pointée, comme pandas.json_normalize) dans une table
+principale. Les listes imbriquées configurées (titulaires, modifications) sont stockées dans
+des tables filles, reliées à la table principale par la colonne _ligne (position du marché
+dans le fichier JSON). Les autres listes sont conservées sous forme de texte JSON.
+"""
+
+import json
+import logging
+import os
+
+import pyarrow
+import pyarrow.parquet
+
+from qualite_decp import download
+
+# Colonne reliant les tables filles à la table principale
+LINE_COLUMN = "_ligne"
+# Colonne donnant la position d'un élément dans sa liste (tables filles)
+POSITION_COLUMN = "_position"
+# Métadonnées identifiant le fichier JSON converti
+METADATA_KEY = b"qualite_decp.source"
+
+
+def child_table_path(path: str, field: str):
+    """Construit le chemin d'une table fille à partir de celui de la table principale.
+
+    Args:
+        path (str): Chemin vers la table principale (exemple : data/consolidated_data.parquet)
+        field (str): Champ de la liste imbriquée (exemple : titulaires)
+
+    Returns:
+        str: Chemin vers la table fille (exemple : data/consolidated_data.titulaires.parquet)
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}.{field}{extension}"
+
+
+def source_signature(json_path: str):
+    """Identifie une version du fichier JSON.
+
+    L'empreinte SHA-256 enregistrée lors du téléchargement est utilisée si elle correspond au
+    fichier, à défaut la taille et la date de modification du fichier.
+
+    Args:
+        json_path (str): Chemin vers le fichier JSON
+
+    Returns:
+        dict: Signature du fichier
+    """
+    stat = os.stat(json_path)
+    metadata = download.read_download_metadata(json_path)
+    if metadata is not None and metadata.get("taille") == stat.st_size:
+        return {"taille": stat.st_size, "sha256": metadata.get("sha256")}
+    return {"taille": stat.st_size, "date_modification": stat.st_mtime_ns}
+
+
+def flatten_record(record: dict, child_fields: list = (), prefix: str = ""):
+    """Aplatit un marché en colonnes scalaires, en séparant les listes imbriquées configurées.
+
+    Args:
+        record (dict): Marché (ou objet imbriqué)
+        child_fields (list, optional): Champs de premier niveau à stocker en tables filles. Defaults to ().
+        prefix (str, optional): Préfixe des colonnes (objet imbriqué). Defaults to "".
+
+    Returns:
+        dict, dict: Colonnes aplaties ({colonne: valeur}), et listes à stocker en tables filles ({champ: liste})
+    """
+    columns = dict()
+    children = dict()
+    for key, value in record.items():
+        column = prefix + key
+        if prefix == "" and key in child_fields and isinstance(value, list):
+            children[key] = value
+        elif isinstance(value, dict):
+            nested_columns, _ = flatten_record(value, prefix=column + ".")
+            columns.update(nested_columns)
+        elif isinstance(value, list):
+            columns[column] = json.dumps(value, ensure_ascii=False)
+        elif value is not None:
+            columns[column] = value
+    return columns, children
+
+
+def flatten_item(field: str, item):
+    """Aplatit un élément d'une liste imbriquée stockée en table fille.
+
+    Args:
+        field (str): Champ de la liste (exemple : titulaires)
+        item: Elément de la liste
+
+    Returns:
+        dict: Colonnes aplaties ({colonne: valeur})
+    """
+    if isinstance(item, dict):
+        columns, _ = flatten_record(item)
+        return columns
+    if item is None:
+        return dict()
+    return {field: item}
+
+
+def observe_types(column_types: dict, columns: dict):
+    """Enregistre les types Python des valeurs d'une ligne aplatie.
+
+    Les entiers hors de l'intervalle des entiers 64 bits sont comptés comme du texte.
+
+    Args:
+        column_types (dict): Types rencontrés par colonne ({colonne: set}), mis à jour
+        columns (dict): Colonnes de la ligne ({colonne: valeur})
+    """
+    for column, value in columns.items():
+        value_type = type(value)
+        if value_type is int and not -(2 ** 63) <= value < 2 ** 63:
+            value_type = str
+        column_types.setdefault(column, set()).add(value_type)
+
+
+def arrow_type(python_types: set):
+    """Choisit le type Arrow d'une colonne à partir des types Python rencontrés.
+
+    Les colonnes de types mélangés sont stockées en texte : les indicateurs convertissent
+    de toute façon leurs valeurs (pandas.to_numeric, pandas.to_datetime).
+
+    Args:
+        python_types (set): Types Python des valeurs non nulles de la colonne
+
+    Returns:
+        pyarrow.DataType: Type de la colonne
+    """
+    if python_types == {bool}:
+        return pyarrow.bool_()
+    if python_types == {int}:
+        return pyarrow.int64()
+    if python_types in ({float}, {int, float}):
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+class TableWriter:
+    def __init__(self, path: str, column_types: dict, metadata: dict, batch_size: int):
+        """Prépare l'écriture par lots d'une table Parquet de schéma connu.
+
+        Args:
+            path (str): Chemin vers le fichier Parquet
+            column_types (dict): Types Python rencontrés par colonne ({colonne: set})
+            metadata (dict): Métadonnées du fichier
+            batch_size (int): Nombre de lignes par groupe de lignes
+        """
+        self.schema = pyarrow.schema(
+            [
+                pyarrow.field(column, arrow_type(types))
+                for column, types in column_types.items()
+            ],
+            metadata=metadata,
+        )
+        self.as_text = [
+            self.schema.field(column).type == pyarrow.string()
+            for column in self.schema.names
+        ]
+        self.batch_size = batch_size
+        self.rows = list()
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def append(self, row: dict):
+        """Ajoute une ligne, écrite avec le lot en cours.
+
+        Args:
+            row (dict): Colonnes de la ligne ({colonne: valeur})
+        """
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Ecrit le lot en cours."""
+        if len(self.rows) == 0:
+            return
+        arrays = list()
+        for column, as_text in zip(self.schema.names, self.as_text):
+            values = [row.get(column) for row in self.rows]
+            if as_text:
+                values = [None if v is None else str(v) for v in values]
+            arrays.append(values)
+        self.writer.write_table(
+            pyarrow.Table.from_arrays(arrays, schema=self.schema.remove_metadata())
+        )
+        self.rows = list()
+
+    def close(self):
+        """Ecrit le dernier lot et ferme le fichier."""
+        self.flush()
+        self.writer.close()
+
+
+def write_snapshot(
+    json_path: str, path: str, child_fields: list, batch_size: int = 50000
+):
+    """Convertit les marchés d'un fichier JSON en instantané colonnaire.
+
+    Le fichier JSON est parcouru deux fois de manière incrémentale : une première fois pour
+    déterminer les colonnes et leurs types, une seconde fois pour écrire les tables par lots.
+
+    Args:
+        json_path (str): Chemin vers le fichier JSON de la donnée consolidée
+        path (str): Chemin vers la table principale (Parquet)
+        child_fields (list): Champs à stocker en tables filles (exemple : ["titulaires", "modifications"])
+        batch_size (int, optional): Nombre de lignes par groupe de lignes. Defaults to 50000.
+    """
+    column_types = {LINE_COLUMN: {int}}
+    child_column_types = {
+        field: {LINE_COLUMN: {int}, POSITION_COLUMN: {int}} for field in child_fields
+    }
+    for marche in download.iter_json_array(json_path, "marches"):
+        columns, children = flatten_record(marche, child_fields)
+        observe_types(column_types, columns)
+        for field, items in children.items():
+            for item in items:
+                observe_types(child_column_types[field], flatten_item(field, item))
+
+    metadata = {METADATA_KEY: json.dumps(source_signature(json_path))}
+    writer = TableWriter(path, column_types, metadata, batch_size)
+    child_writers = {
+        field: TableWriter(
+            child_table_path(path, field),
+            child_column_types[field],
+            metadata,
+            batch_size,
+        )
+        for field in child_fields
+    }
+    num_lines = 0
+    for line, marche in enumerate(download.iter_json_array(json_path, "marches")):
+        columns, children = flatten_record(marche, child_fields)
+        columns[LINE_COLUMN] = line
+        writer.append(columns)
+        for field, items in children.items():
+            for position, item in enumerate(items):
+                item_columns = flatten_item(field, item)
+                item_columns[LINE_COLUMN] = line
+                item_columns[POSITION_COLUMN] = position
+                child_writers[field].append(item_columns)
+        num_lines = line + 1
+    writer.close()
+    for child_writer in child_writers.values():
+        child_writer.close()
+    logging.info(
+        "Instantané colonnaire de %d marchés (%d colonnes) écrit dans %s",
+        num_lines,
+        len(column_types),
+        path,
+    )
+
+
+def is_up_to_date(json_path: str, path: str):
+    """Vérifie si un instantané colonnaire correspond à la version actuelle du fichier JSON.
+
+    Args:
+        json_path (str): Chemin vers le fichier JSON de la donnée consolidée
+        path (str): Chemin vers la table principale (Parquet)
+
+    Returns:
+        bool: True si l'instantané existe et a été produit depuis ce fichier JSON
+    """
+    if not path or not os.path.exists(path) or not os.path.exists(json_path):
+        return False
+    metadata = pyarrow.parquet.read_schema(path).metadata or dict()
+    if METADATA_KEY not in metadata:
+        return False
+    return json.loads(metadata[METADATA_KEY]) == source_signature(json_path)
+
+
+def read_columns(path: str, columns: list):
+    """Charge certaines colonnes d'une table de l'instantané.
+
+    Seules les colonnes demandées sont lues sur le disque. Les colonnes absentes de
+    l'instantané (aucun marché ne les renseigne) sont ignorées.
+
+    Args:
+        path (str): Chemin vers une table de l'instantané (Parquet)
+        columns (list): Colonnes à charger
+
+    Returns:
+        pandas.DataFrame: Colonnes chargées
+    """
+    available_columns = set(pyarrow.parquet.read_schema(path).names)
+    columns = [column for column in columns if column in available_columns]
+    return pyarrow.parquet.read_table(path, columns=columns).to_pandas()
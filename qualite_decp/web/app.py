@@ -20,10 +20,9 @@ def run():
     selected_source, selected_current_date, selected_comparison_date = build.sidebar(
         available_sources, available_dates
     )
-    current_results = artifacts.get_audit_results(
-        selected_current_date, selected_source
-    )
-    comparison_results = artifacts.get_audit_results(
-        selected_comparison_date, selected_source
+    current_results, comparison_results = artifacts.get_audit_results_for_dates(
+        [selected_current_date, selected_comparison_date],
+        selected_source,
+        available_dates,
     )
     build.page(current_results, comparison_results)
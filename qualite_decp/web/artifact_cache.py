@@ -0,0 +1,195 @@
+""" Ce module contient un cache persistant des archives d'artifacts téléchargées par l'application web.
+
+Chaque archive est stockée dans un fichier nommé d'après sa clé (empreinte SHA-256 de son contenu,
+ou identifiant de l'artifact, qui ne change pas de contenu). Les fichiers sont écrits de manière
+atomique (fichier temporaire renommé), ce qui permet à plusieurs sessions de partager le cache.
+La date de modification des fichiers tient lieu de date de dernière utilisation : les archives
+les plus anciennes sont évincées au-delà d'une taille ou d'un âge maximal (LRU).
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+
+# Extension des archives stockées
+ARCHIVE_EXTENSION = ".zip"
+
+
+def key_from_digest(digest: str):
+    """Construit la clé d'une archive à partir de l'empreinte de son contenu.
+
+    Args:
+        digest (str): Empreinte (exemple : "sha256:4f3c...", ou empreinte hexadécimale seule)
+
+    Returns:
+        str: Clé (exemple : "sha256-4f3c...")
+    """
+    algorithm, _, value = digest.rpartition(":")
+    return f"{algorithm or 'sha256'}-{value.lower()}"
+
+
+def key_from_url(archive_url: str):
+    """Construit la clé d'une archive à partir de son URL de téléchargement.
+
+    L'URL d'une archive d'artifact GitHub contient l'identifiant de l'artifact, dont le contenu
+    ne change pas. A défaut, la clé est l'empreinte de l'URL.
+
+    Args:
+        archive_url (str): URL de l'archive (exemple : https://api.github.com/repos/o/r/actions/artifacts/123/zip)
+
+    Returns:
+        str: Clé (exemple : "artifact-123")
+    """
+    match = re.search(r"/artifacts/(\d+)/zip$", archive_url)
+    if match is not None:
+        return f"artifact-{match.group(1)}"
+    return (
+        "url-"
+        + hashlib.blake2b(archive_url.encode("utf-8"), digest_size=16).hexdigest()
+    )
+
+
+def verify_digest(content: bytes, digest: str):
+    """Vérifie l'empreinte SHA-256 d'un contenu.
+
+    Args:
+        content (bytes): Contenu
+        digest (str): Empreinte attendue (exemple : "sha256:4f3c...")
+
+    Raises:
+        IOError: Si l'empreinte ne correspond pas
+    """
+    algorithm, _, expected = digest.rpartition(":")
+    if algorithm not in ("", "sha256"):
+        raise IOError(f"Algorithme d'empreinte non géré : {algorithm}")
+    actual = hashlib.sha256(content).hexdigest()
+    if actual != expected.lower():
+        raise IOError(
+            f"Empreinte de l'archive invalide : {actual} au lieu de {expected}"
+        )
+
+
+class ArtifactCache:
+    def __init__(
+        self, directory: str, max_size: int = None, max_age_days: float = None
+    ):
+        """Ouvre (ou crée) un cache d'archives.
+
+        Args:
+            directory (str): Dossier du cache
+            max_size (int, optional): Taille totale maximale des archives (octets). Defaults to None (illimitée).
+            max_age_days (float, optional): Nombre de jours au-delà duquel une archive non utilisée est évincée.
+                Defaults to None (illimité).
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age_days = max_age_days
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key: str):
+        """Construit le chemin de l'archive d'une clé.
+
+        Args:
+            key (str): Clé de l'archive
+
+        Returns:
+            str: Chemin vers l'archive
+        """
+        if not re.fullmatch(r"[\w.-]+", key):
+            raise ValueError(f"Clé d'archive invalide : {key}")
+        return os.path.join(self.directory, key + ARCHIVE_EXTENSION)
+
+    def get(self, key: str):
+        """Lit une archive du cache et la marque comme récemment utilisée.
+
+        Args:
+            key (str): Clé de l'archive
+
+        Returns:
+            bytes: Contenu de l'archive, None si elle est absente
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file_reader:
+                content = file_reader.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Archive absente, ou évincée entre-temps par une autre session
+            return None
+        logging.debug("Archive %s lue depuis le cache", key)
+        return content
+
+    def put(self, key: str, content: bytes):
+        """Stocke une archive dans le cache, de manière atomique, puis applique l'éviction.
+
+        Args:
+            key (str): Clé de l'archive
+            content (bytes): Contenu de l'archive
+        """
+        path = self.path(key)
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=self.directory, prefix=f".{key}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(file_descriptor, "wb") as file_writer:
+                file_writer.write(content)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        logging.debug("Archive %s stockée dans le cache (%d octets)", key, len(content))
+        self.evict(keep=key)
+
+    def list_archives(self):
+        """Liste les archives du cache.
+
+        Returns:
+            list: Archives (chemin, taille en octets, date de dernière utilisation), de la moins récemment utilisée à la plus récente
+        """
+        archives = list()
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.name.endswith(
+                    ARCHIVE_EXTENSION
+                ):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                archives.append((entry.path, stat.st_size, stat.st_mtime))
+        return sorted(archives, key=lambda archive: archive[2])
+
+    def evict(self, keep: str = None):
+        """Supprime les archives trop anciennes, puis les moins récemment utilisées au-delà de la taille maximale.
+
+        Args:
+            keep (str, optional): Clé d'une archive à conserver (celle venant d'être stockée). Defaults to None.
+        """
+        if self.max_size is None and self.max_age_days is None:
+            return
+        kept_path = None if keep is None else self.path(keep)
+        archives = self.list_archives()
+        total_size = sum(size for _, size, _ in archives)
+        oldest_allowed = (
+            None
+            if self.max_age_days is None
+            else time.time() - self.max_age_days * 24 * 3600
+        )
+        num_evicted = 0
+        for path, size, last_used in archives:
+            too_old = oldest_allowed is not None and last_used < oldest_allowed
+            too_large = self.max_size is not None and total_size > self.max_size
+            if path == kept_path or not (too_old or too_large):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            num_evicted += 1
+        if num_evicted > 0:
+            logging.debug("%d archives évincées du cache", num_evicted)
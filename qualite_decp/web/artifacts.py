@@ -1,6 +1,8 @@
-from datetime import datetime
+import datetime
+import functools
 import logging
 import zipfile
+import io
 import json
 import os
 
@@ -9,40 +11,30 @@ import requests
 
 from qualite_decp import conf
 from qualite_decp import download
+from qualite_decp.web import artifact_cache
+from qualite_decp.web import catalog
+from qualite_decp.web import prefetch
 from qualite_decp.audit import audit_results_one_source
 from qualite_decp.audit import audit_results
 
 
-@st.cache
-def get_artifacts(today_date: datetime.date = datetime.now().date()):
-    """Obtient les artifacts depuis le projet GitHub.
-
-    Args:
-        today_date (datetime.date, optional): Date du jour. Defaults to datetime.now().date().
+@st.cache(allow_output_mutation=True)
+def get_catalog():
+    """Crée le catalogue des artifacts de résultats d'audit, partagé par les sessions de l'application.
 
     Returns:
-        dict: Dictionnaire d'artifacts
+        catalog.ArtifactCatalog: Catalogue des artifacts
     """
-    github_repo = conf.web.projet_github
-    url = f"https://api.github.com/repos/{github_repo}/actions/artifacts"
-    artifacts = download_json_from_url(url)
-    return artifacts
-
-
-@st.cache
-def download_json_from_url(url: str):
-    """Charge un fichier JSON en mémoire depuis une URL
+    catalog_conf = conf.web.catalogue_artifacts
+    return catalog.ArtifactCatalog(
+        catalog_conf.url_api,
+        conf.web.projet_github,
+        conf.audit.nom_artifact_resultats,
+        ttl=catalog_conf.duree_validite,
+        page_size=catalog_conf.taille_page,
+        auth=get_github_auth(),
+    )
 
-    Args:
-        url (str): URL du fichier
-
-    Returns:
-        dict: Dictionnaire issu du fichier JSON
-    """
-    response = requests.get(url)
-    if response.status_code == 403:
-        raise Exception(f"Erreur 403 en requêtant {url} : {response.content}")
-    return response.json()
 
 def get_github_auth():
     """ Obtient un tuple d'authentification pour l'API GitHub.
@@ -59,48 +51,169 @@ def list_artifacts():
     """Liste les artifacts disponible (1 par date).
 
     Returns:
-        dict: Dictionnaire des artifacts disponible (date:url)
+        dict: Dictionnaire des artifacts disponible (date:artifact), dans l'ordre chronologique
+    """
+    return get_catalog().refresh()
+
+
+def get_artifact_cache():
+    """Ouvre le cache persistant des archives d'artifacts.
+
+    Returns:
+        artifact_cache.ArtifactCache: Cache des archives
+    """
+    cache_conf = conf.web.cache_artifacts
+    return artifact_cache.ArtifactCache(
+        cache_conf.chemin, cache_conf.taille_max, cache_conf.age_max_jours
+    )
+
+
+@st.cache(allow_output_mutation=True)
+def get_session():
+    """Crée la session HTTP utilisée pour télécharger les artifacts, partagée par les sessions de l'application.
+
+    Returns:
+        requests.Session: Session HTTP, dont le pool de connexions permet les chargements simultanés
+    """
+    return download.pooled_session(conf.web.prechargement.chargements_simultanes)
+
+
+def download_artifact_archive(
+    archive_url: str, digest: str = None, session: requests.Session = None
+):
+    """Obtient le contenu d'un artifact archivé, depuis le cache persistant ou à défaut depuis une URL.
+
+    Args:
+        archive_url (str): URL vers un artifact archivé (ZIP)
+        digest (str, optional): Empreinte SHA-256 de l'archive (exemple : "sha256:4f3c..."), vérifiée
+            après téléchargement et utilisée comme clé du cache. Defaults to None (clé issue de l'URL).
+        session (requests.Session, optional): Session HTTP à utiliser. Defaults to None (requests).
+
+    Returns:
+        bytes: Contenu de l'archive
     """
-    artifacts = get_artifacts()
-    nom_artifact = conf.audit.nom_artifact_resultats
-    num_artifacts = artifacts.get("total_count")
-    logging.debug(f"{num_artifacts} artifacts disponibles sur le projet")
-    artifacts = [
-        a
-        for a in artifacts.get("artifacts")
-        if a.get("name") == nom_artifact and a.get("expired") == False
-    ]
-    logging.debug(f"{len(artifacts)} artifacts de résultats d'audit")
-    results = dict()
-    for artifact in artifacts:
-        artifact_date = artifact.get("created_at")
-        artifact_url = artifact.get("archive_download_url")
-        artifact_date = datetime.strptime(artifact_date, "%Y-%m-%dT%H:%M:%SZ").date()
-        results[artifact_date] = artifact_url
-    logging.debug(f"{len(results)} artifacts avec date unique")
-    results = dict(sorted(results.items()))
-    return results
-
-
-@st.cache
-def load_artifact_archive_from_url(archive_url:str):
+    if digest:
+        key = artifact_cache.key_from_digest(digest)
+    else:
+        key = artifact_cache.key_from_url(archive_url)
+    cache = get_artifact_cache()
+    content = cache.get(key)
+    if content is None:
+        logging.debug(f"Téléchargement de l'artifact {archive_url}")
+        response = (requests if session is None else session).get(
+            archive_url, auth=get_github_auth()
+        )
+        response.raise_for_status()
+        content = response.content
+        if digest:
+            artifact_cache.verify_digest(content, digest)
+        cache.put(key, content)
+    return content
+
+
+def load_artifact_archive_from_url(
+    archive_url: str, digest: str = None, session: requests.Session = None
+):
     """ Charge un artifact archivé sous forme de dictionnaire depuis une URL.
 
+    L'archive est lue en mémoire, depuis le cache persistant des archives s'il la contient.
+
     Args:
         archive_url (str): URL vers un artifact de type JSON archivé (ZIP)
+        digest (str, optional): Empreinte SHA-256 de l'archive. Defaults to None.
+        session (requests.Session, optional): Session HTTP à utiliser. Defaults to None (requests).
 
     Returns:
         dict: Fichier chargé
     """
-    auth = get_github_auth()
-    download.download_data_from_url_to_file(archive_url, "./data/artifact.zip", stream=True, auth=auth)
-    with zipfile.ZipFile("./data/artifact.zip", "r") as z:
+    content = download_artifact_archive(archive_url, digest, session)
+    with zipfile.ZipFile(io.BytesIO(content), "r") as z:
         for filename in z.namelist():
             with z.open(filename) as f:  
                 data = f.read()  
                 d = json.loads(data)  
                 return d
 
+
+def get_artifact_reference(date: datetime.date) -> tuple:
+    """Obtient la référence de l'artifact de résultats d'audit d'une date.
+
+    Args:
+        date (datetime.date): Date de l'audit voulu
+
+    Returns:
+        (str, str): Tuple (URL de l'archive, empreinte de l'archive ou None)
+    """
+    artifact_description = get_catalog().get(date)
+    if artifact_description is None:
+        raise KeyError(f"Aucun artifact de résultats d'audit à la date {date}")
+    return (
+        artifact_description.get("archive_download_url"),
+        artifact_description.get("digest"),
+    )
+
+
+def load_audit_results(
+    artifact_reference: tuple, session: requests.Session = None
+) -> audit_results.AuditResults:
+    """Charge les résultats de l'audit de qualité de toutes les sources depuis un artifact.
+
+    Args:
+        artifact_reference (tuple): Tuple (URL de l'archive, empreinte de l'archive ou None)
+        session (requests.Session, optional): Session HTTP à utiliser. Defaults to None (requests).
+
+    Returns:
+        audit_results.AuditResults: Résultats d'audit
+    """
+    archive_url, digest = artifact_reference
+    artifact = load_artifact_archive_from_url(archive_url, digest, session)
+    return audit_results.AuditResults.from_list(artifact)
+
+
+@st.cache(allow_output_mutation=True)
+def get_prefetcher():
+    """Crée le chargeur concurrent des résultats d'audit, partagé par les sessions de l'application.
+
+    Returns:
+        prefetch.ResultsPrefetcher: Chargeur des résultats d'audit par référence d'artifact
+    """
+    prefetch_conf = conf.web.prechargement
+    return prefetch.ResultsPrefetcher(
+        functools.partial(load_audit_results, session=get_session()),
+        max_workers=prefetch_conf.chargements_simultanes,
+        max_entries=prefetch_conf.nombre_max_resultats,
+    )
+
+
+def get_audit_results_for_dates(
+    dates: list, source: str, available_dates: list = None
+) -> list:
+    """Récupère simultanément les résultats de l'audit de qualité pour une source à plusieurs dates.
+
+    Les résultats des dates voisines sont ensuite chargés en arrière-plan, afin d'être
+    disponibles si une autre date est sélectionnée.
+
+    Args:
+        dates (list): Dates des audits voulus
+        source (str): Source auditée
+        available_dates (list, optional): Dates disponibles, dans l'ordre chronologique. Defaults to None
+            (pas de chargement anticipé).
+
+    Returns:
+        list: Résultats d'audit (audit_results_one_source.AuditResultsOneSource), dans l'ordre des dates
+    """
+    prefetcher = get_prefetcher()
+    results = prefetcher.get([get_artifact_reference(date) for date in dates])
+    if available_dates is not None:
+        neighbouring_dates = prefetch.get_neighbouring_dates(
+            available_dates, dates, conf.web.prechargement.dates_voisines
+        )
+        prefetcher.prefetch(
+            [get_artifact_reference(date) for date in neighbouring_dates]
+        )
+    return [r.extract_results_for_source(source) for r in results]
+
+
 def get_audit_results(
     date: datetime.date, source: str
 ) -> audit_results_one_source.AuditResultsOneSource:
@@ -113,9 +226,4 @@ def get_audit_results(
     Returns:
         audit_results_one_source.AuditResultsOneSource: Résultats d'audit
     """
-    artifacts_dict = list_artifacts()
-    url = artifacts_dict[date]
-    artifact = load_artifact_archive_from_url(url)
-    results = audit_results.AuditResults.from_list(artifact)
-    result = results.extract_results_for_source(source)
-    return result
+    return get_audit_results_for_dates([date], source)[0]
@@ -178,6 +178,16 @@ def detailed_singularite_container(parent_element, singularite: measures.Singula
         **{to_percentage(singularite.lignes_dupliquees)}** lignes dupliquées
         """
     )
+    if singularite.doublons_inter_sources is not None:
+        singularite_container.info(
+            f"""
+            **{to_percentage(singularite.doublons_inter_sources)}** marchés également publiés par une autre source
+            """
+        )
+    if singularite.marge_erreur is not None:
+        singularite_container.caption(
+            f"Recherche probabiliste des doublons : marge d'erreur de {to_percentage(singularite.marge_erreur)}"
+        )
 
 
 def detailed_validite_container(parent_element, validite: measures.Validite):
@@ -0,0 +1,180 @@
+""" Ce module contient le catalogue des artifacts de résultats d'audit publiés sur le projet GitHub.
+
+Le catalogue parcourt toutes les pages de l'API des artifacts, en requêtes conditionnelles
+(en-tête If-None-Match) : une page inchangée depuis la dernière lecture n'est pas retransmise,
+et n'est pas décomptée de la limite de requêtes de l'API GitHub. L'index des artifacts par
+date est reconstruit une fois par rafraîchissement, au plus une fois par durée de validité.
+Si l'API est indisponible, le dernier index obtenu continue d'être servi.
+
+L'URL de l'API est paramétrable, afin de pouvoir interroger un service local la simulant.
+"""
+
+from datetime import datetime
+import logging
+import threading
+import time
+
+import requests
+
+
+def parse_artifact_date(created_at: str):
+    """Lit la date de création d'un artifact.
+
+    Args:
+        created_at (str): Date de création (exemple : "2021-10-18T06:12:45Z")
+
+    Returns:
+        datetime.date: Date
+    """
+    return datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%SZ").date()
+
+
+def index_artifacts_by_date(artifacts: list, artifact_name: str):
+    """Indexe les artifacts valides d'un nom donné par date de création.
+
+    Lorsque plusieurs artifacts ont été créés le même jour, le plus récent est retenu.
+
+    Args:
+        artifacts (list): Artifacts renvoyés par l'API
+        artifact_name (str): Nom des artifacts à retenir
+
+    Returns:
+        dict: Artifacts par date, dans l'ordre chronologique ({datetime.date: artifact})
+    """
+    index = dict()
+    for artifact in artifacts:
+        if artifact.get("name") != artifact_name or artifact.get("expired") != False:
+            continue
+        created_at = artifact.get("created_at")
+        artifact_date = parse_artifact_date(created_at)
+        indexed = index.get(artifact_date)
+        if indexed is None or indexed.get("created_at") < created_at:
+            index[artifact_date] = artifact
+    return dict(sorted(index.items()))
+
+
+class ArtifactCatalog:
+    def __init__(
+        self,
+        api_url: str,
+        repository: str,
+        artifact_name: str,
+        ttl: float = 300,
+        page_size: int = 100,
+        session: requests.Session = None,
+        auth=None,
+    ):
+        """Crée un catalogue vide, rempli au premier rafraîchissement.
+
+        Args:
+            api_url (str): URL de l'API GitHub (exemple : https://api.github.com)
+            repository (str): Projet GitHub (exemple : pauldes/valorisation-decp)
+            artifact_name (str): Nom des artifacts de résultats d'audit
+            ttl (float, optional): Durée de validité de l'index (secondes). Defaults to 300.
+            page_size (int, optional): Nombre d'artifacts par page (100 au maximum). Defaults to 100.
+            session (requests.Session, optional): Session HTTP à utiliser. Defaults to None (session dédiée).
+            auth (optional): Authentification transmise à requests. Defaults to None.
+        """
+        self.url = f"{api_url.rstrip('/')}/repos/{repository}/actions/artifacts"
+        self.artifact_name = artifact_name
+        self.ttl = ttl
+        self.page_size = page_size
+        self.session = requests.Session() if session is None else session
+        self.auth = auth
+        # Dernière réponse de chaque page : {URL: (ETag, contenu, URL de la page suivante)}
+        self.pages = dict()
+        self.index = dict()
+        self.refreshed = None
+        self.lock = threading.Lock()
+
+    def get_page(self, url: str, params: dict = None):
+        """Obtient une page de l'API, en requête conditionnelle si elle a déjà été lue.
+
+        Args:
+            url (str): URL de la page
+            params (dict, optional): Paramètres de la requête. Defaults to None.
+
+        Raises:
+            requests.HTTPError: Si l'API répond par une erreur
+
+        Returns:
+            dict, str: Contenu de la page, et URL de la page suivante (en-tête Link), None s'il s'agit de la dernière
+        """
+        page_key = requests.Request("GET", url, params=params).prepare().url
+        headers = {"Accept": "application/vnd.github+json"}
+        previous = self.pages.get(page_key)
+        if previous is not None:
+            headers["If-None-Match"] = previous[0]
+        response = self.session.get(url, params=params, headers=headers, auth=self.auth)
+        if response.status_code == 304 and previous is not None:
+            return previous[1], previous[2]
+        response.raise_for_status()
+        content = response.json()
+        next_url = response.links.get("next", {}).get("url")
+        etag = response.headers.get("ETag")
+        if etag is not None:
+            self.pages[page_key] = (etag, content, next_url)
+        return content, next_url
+
+    def fetch_artifacts(self):
+        """Obtient tous les artifacts du projet, en suivant la pagination (en-tête Link).
+
+        Returns:
+            list: Artifacts
+        """
+        artifacts = list()
+        url, params = self.url, {"per_page": self.page_size}
+        while url is not None:
+            content, url = self.get_page(url, params)
+            artifacts.extend(content.get("artifacts", []))
+            # L'URL de la page suivante contient déjà les paramètres
+            params = None
+        logging.debug(
+            f"{len(artifacts)} artifacts obtenus sur {content.get('total_count')} disponibles"
+        )
+        return artifacts
+
+    def refresh(self, force: bool = False):
+        """Reconstruit l'index des artifacts par date, s'il a expiré.
+
+        En cas d'erreur de l'API, l'index précédent est conservé s'il existe.
+
+        Args:
+            force (bool, optional): Si l'index doit être reconstruit avant son expiration. Defaults to False.
+
+        Returns:
+            dict: Artifacts par date, dans l'ordre chronologique ({datetime.date: artifact})
+        """
+        with self.lock:
+            now = time.monotonic()
+            if (
+                not force
+                and self.refreshed is not None
+                and now - self.refreshed < self.ttl
+            ):
+                return self.index
+            try:
+                artifacts = self.fetch_artifacts()
+            except requests.RequestException as error:
+                if self.refreshed is None:
+                    raise
+                logging.warning(
+                    f"Catalogue des artifacts non rafraîchi, index précédent conservé : {error}"
+                )
+                self.refreshed = now
+                return self.index
+            self.index = index_artifacts_by_date(artifacts, self.artifact_name)
+            self.refreshed = now
+            logging.debug(f"{len(self.index)} artifacts de résultats d'audit par date")
+            return self.index
+
+    def get(self, date):
+        """Renvoie l'artifact d'une date.
+
+        Args:
+            date (datetime.date): Date
+
+        Returns:
+            dict: Artifact, None si aucun artifact n'existe à cette date
+        """
+        return self.refresh().get(date)
@@ -0,0 +1,116 @@
+""" Ce module contient le chargement concurrent des résultats d'audit affichés par l'application web.
+
+Les résultats sont chargés par un groupe de fils d'exécution partagé par les sessions de
+l'application. Chaque chargement est mémorisé sous forme de tâche (concurrent.futures.Future) :
+une date demandée alors que son chargement anticipé est en cours attend cette tâche au lieu
+de relancer le téléchargement. Les tâches en échec sont oubliées, afin d'être relancées à la
+demande suivante, et seules les plus récemment demandées sont conservées.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import threading
+
+
+def get_neighbouring_dates(available_dates: list, selected_dates: list, distance: int):
+    """Liste les dates voisines des dates sélectionnées.
+
+    Args:
+        available_dates (list): Dates disponibles, dans l'ordre chronologique
+        selected_dates (list): Dates sélectionnées
+        distance (int): Nombre de dates voisines retenues de part et d'autre de chaque date sélectionnée
+
+    Returns:
+        list: Dates voisines, hors dates sélectionnées, des plus proches aux plus éloignées
+    """
+    available_dates = list(available_dates)
+    positions = {date: position for position, date in enumerate(available_dates)}
+    neighbours = list()
+    for offset in range(1, distance + 1):
+        for date in selected_dates:
+            if date not in positions:
+                continue
+            for position in (positions[date] + offset, positions[date] - offset):
+                if 0 <= position < len(available_dates):
+                    neighbour = available_dates[position]
+                    if neighbour not in selected_dates and neighbour not in neighbours:
+                        neighbours.append(neighbour)
+    return neighbours
+
+
+class ResultsPrefetcher:
+    def __init__(self, load_function, max_workers: int = 4, max_entries: int = 32):
+        """Crée un chargeur concurrent de résultats.
+
+        Args:
+            load_function (callable): Fonction chargeant les résultats d'une clé (exemple : une date)
+            max_workers (int, optional): Nombre de chargements simultanés. Defaults to 4.
+            max_entries (int, optional): Nombre de résultats conservés en mémoire. Defaults to 32.
+        """
+        self.load_function = load_function
+        self.max_entries = max_entries
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.futures = collections.OrderedDict()
+        # Réentrant : une tâche déjà terminée appelle forget_failure dès son enregistrement (voir submit)
+        self.lock = threading.RLock()
+
+    def submit(self, key):
+        """Lance le chargement des résultats d'une clé, s'il n'est pas déjà lancé ou terminé.
+
+        Args:
+            key: Clé des résultats (hachable)
+
+        Returns:
+            concurrent.futures.Future: Tâche de chargement
+        """
+        with self.lock:
+            future = self.futures.get(key)
+            if future is not None and not (
+                future.done() and future.exception() is not None
+            ):
+                self.futures.move_to_end(key)
+                return future
+            future = self.executor.submit(self.load_function, key)
+            self.futures[key] = future
+            future.add_done_callback(lambda done: self.forget_failure(key, done))
+            while len(self.futures) > self.max_entries:
+                self.futures.popitem(last=False)
+            return future
+
+    def forget_failure(self, key, future: concurrent.futures.Future):
+        """Oublie une tâche en échec, afin qu'elle soit relancée à la demande suivante.
+
+        Args:
+            key: Clé des résultats
+            future (concurrent.futures.Future): Tâche terminée
+        """
+        if future.exception() is None:
+            return
+        logging.warning(
+            f"Echec du chargement des résultats {key} : {future.exception()}"
+        )
+        with self.lock:
+            if self.futures.get(key) is future:
+                del self.futures[key]
+
+    def get(self, keys: list):
+        """Charge les résultats de plusieurs clés simultanément et attend leur fin.
+
+        Args:
+            keys (list): Clés des résultats
+
+        Returns:
+            list: Résultats, dans l'ordre des clés
+        """
+        futures = [self.submit(key) for key in keys]
+        return [future.result() for future in futures]
+
+    def prefetch(self, keys: list):
+        """Lance le chargement anticipé de résultats, sans attendre leur fin.
+
+        Args:
+            keys (list): Clés des résultats
+        """
+        for key in keys:
+            self.submit(key)